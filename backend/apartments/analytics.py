@@ -0,0 +1,263 @@
+"""
+Portfolio analytics: occupancy, rent per m², collection rate and monthly
+trends broken down by city, region and property type, plus arrears aging.
+
+The snapshot is built from a handful of GROUP BY queries over the finest
+(city, region, property_type) grain and rolled up in Python, so cost grows
+with the number of distinct groups rather than with portfolio size.
+Results are cached per owner scope and invalidated when any apartment,
+tenant or payment of one of those owners changes.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.db.models import Case, Count, DecimalField, F, Min, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import Apartment, Tenant, RentPayment, PaymentTransaction
+
+DIMENSIONS = ('city', 'region', 'property_type')
+CACHE_TIMEOUT = 60 * 60
+
+
+def invalidate_owner_analytics(*owner_ids, using=None):
+    """
+    Drop cached analytics for these owners (and for unscoped admin views) once
+    the writing transaction on ``using`` commits. The versions live on the
+    owner rows, so every worker process and management command sees the bump.
+    """
+    owner_ids = sorted(set(owner_ids))
+    if not owner_ids:
+        return
+    User = get_user_model()
+    transaction.on_commit(
+        lambda: User.objects.filter(pk__in=owner_ids).update(analytics_version=F('analytics_version') + 1),
+        using=using or router.db_for_write(Apartment),
+    )
+
+
+def owner_versions(owner_ids):
+    """Current data version of each owner; bumped by invalidate_owner_analytics."""
+    stored = dict(get_user_model().objects.filter(pk__in=owner_ids).values_list('pk', 'analytics_version'))
+    return {owner_id: stored.get(owner_id, 0) for owner_id in sorted(owner_ids)}
+
+
+def _cache_key(owner_ids, months):
+    if owner_ids is None:
+        # every bump raises the sum, so it versions the unscoped view
+        versions = [('all', get_user_model().objects.aggregate(total=Sum('analytics_version'))['total'] or 0)]
+    else:
+        versions = list(owner_versions(owner_ids).items())
+    digest = hashlib.md5(repr(versions).encode()).hexdigest()
+    return f'analytics:portfolio:{months}:{digest}'
+
+
+def portfolio_analytics(owner_ids, months=12):
+    """Cached ``compute_portfolio_analytics`` for an owner scope (None means all owners)."""
+    key = _cache_key(owner_ids, months)
+    result = cache.get(key)
+    if result is None:
+        result = compute_portfolio_analytics(owner_ids, months)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+
+def _scoped(queryset, owner_ids, lookup):
+    if owner_ids is None:
+        return queryset
+    return queryset.filter(**{f'{lookup}__in': owner_ids})
+
+
+def _grain(prefix):
+    return [f'{prefix}{dimension}' for dimension in DIMENSIONS]
+
+
+def _empty_bucket():
+    return {
+        'apartments': 0, 'rented': 0, 'square_meters': 0,
+        'rent': 0.0, 'rented_square_meters': 0,
+        'expected': 0.0, 'collected': 0.0,
+    }
+
+
+def _finish(bucket):
+    apartments = bucket['apartments']
+    return {
+        'apartments': apartments,
+        'rented': bucket['rented'],
+        'occupancy_rate': round(bucket['rented'] / apartments, 4) if apartments else None,
+        'square_meters': bucket['square_meters'],
+        'monthly_rent': round(bucket['rent'], 2),
+        'rent_per_m2': (
+            round(bucket['rent'] / bucket['rented_square_meters'], 2) if bucket['rented_square_meters'] else None
+        ),
+        'expected': round(bucket['expected'], 2),
+        'collected': round(bucket['collected'], 2),
+        'collection_rate': round(bucket['collected'] / bucket['expected'], 4) if bucket['expected'] else None,
+    }
+
+
+def compute_portfolio_analytics(owner_ids, months=12):
+    today = timezone.now().date()
+    window_start = date(today.year, today.month, 1) - relativedelta(months=months - 1)
+
+    apartment_rows = _scoped(Apartment.objects.all(), owner_ids, 'owner_id').values(*DIMENSIONS).annotate(
+        apartments=Count('id'),
+        rented=Count('id', filter=Q(status='rented')),
+        square_meters=Sum('square_meters'),
+    )
+    rent_rows = _scoped(Tenant.objects.all(), owner_ids, 'apartment__owner_id').filter(
+        Q(contract_end__isnull=True) | Q(contract_end__gte=today),
+        contract_start__lte=today,
+    ).values(*_grain('apartment__')).annotate(
+        rent=Sum('monthly_rent'),
+        rented_square_meters=Sum('apartment__square_meters'),
+    )
+    payment_rows = _scoped(RentPayment.objects.all(), owner_ids, 'owner_id').filter(
+        due_date__gte=window_start, due_date__lte=today,
+    ).alias(received=PaymentTransaction.collected()).order_by().values(
+        *_grain('tenant__apartment__'), 'year', 'month',
+    ).annotate(
+        expected=Sum('amount'),
+        collected=Sum('received'),
+    )
+
+    totals = _empty_bucket()
+    groups = {dimension: defaultdict(_empty_bucket) for dimension in DIMENSIONS}
+    trends = {dimension: defaultdict(lambda: defaultdict(lambda: [0.0, 0.0])) for dimension in DIMENSIONS}
+    overall_trend = defaultdict(lambda: [0.0, 0.0])
+
+    def add(values, key_prefix, **amounts):
+        for name, amount in amounts.items():
+            totals[name] += amount
+            for dimension in DIMENSIONS:
+                groups[dimension][values[f'{key_prefix}{dimension}'] or ''][name] += amount
+
+    for row in apartment_rows:
+        add(row, '', apartments=row['apartments'], rented=row['rented'], square_meters=row['square_meters'] or 0)
+    for row in rent_rows:
+        add(row, 'apartment__', rent=float(row['rent'] or 0), rented_square_meters=row['rented_square_meters'] or 0)
+    for row in payment_rows:
+        expected, collected = float(row['expected'] or 0), float(row['collected'] or 0)
+        add(row, 'tenant__apartment__', expected=expected, collected=collected)
+        period = f"{row['year']}-{row['month']:02d}"
+        overall_trend[period][0] += expected
+        overall_trend[period][1] += collected
+        for dimension in DIMENSIONS:
+            bucket = trends[dimension][row[f'tenant__apartment__{dimension}'] or ''][period]
+            bucket[0] += expected
+            bucket[1] += collected
+
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'months': months,
+        'totals': _finish(totals),
+        'trend': _trend(overall_trend),
+        **{
+            f'by_{dimension}': [
+                {dimension: value, **_finish(bucket), 'trend': _trend(trends[dimension][value])}
+                for value, bucket in sorted(groups[dimension].items())
+            ]
+            for dimension in DIMENSIONS
+        },
+    }
+
+
+def _trend(periods):
+    """Monthly expected/collected with month-over-month change of collected rent."""
+    result, previous = [], None
+    for period in sorted(periods):
+        expected, collected = periods[period]
+        result.append({
+            'period': period,
+            'expected': round(expected, 2),
+            'collected': round(collected, 2),
+            'collection_rate': round(collected / expected, 4) if expected else None,
+            'mom_change': round((collected - previous) / previous, 4) if previous else None,
+        })
+        previous = collected
+    return result
+
+
+AGING_BUCKETS = ('0-30', '31-60', '61-90', '90+')
+AGING_GROUPS = {
+    'tenant': {
+        'tenant_id': 'tenant_id',
+        'tenant_name': 'tenant__full_name',
+        'apartment_id': 'tenant__apartment_id',
+        'apartment_title': 'tenant__apartment__title',
+        'owner_id': 'owner_id',
+    },
+    'apartment': {
+        'apartment_id': 'tenant__apartment_id',
+        'apartment_title': 'tenant__apartment__title',
+        'owner_id': 'owner_id',
+    },
+    'owner': {
+        'owner_id': 'owner_id',
+        'owner_username': 'owner__username',
+    },
+}
+
+
+def _aging_bucket(low, high):
+    """Sum of outstanding amounts whose due_date lies in [low, high]; either bound may be None."""
+    condition = Q()
+    if low is not None:
+        condition &= Q(due_date__gte=low)
+    if high is not None:
+        condition &= Q(due_date__lte=high)
+    return Sum(Case(When(condition, then=F('outstanding')), default=Value(0), output_field=DecimalField(max_digits=12, decimal_places=2)))
+
+
+def arrears_aging(owner_ids, group='tenant', today=None):
+    """
+    Outstanding (unpaid, due) amounts bucketed by days past due_date, one row
+    per tenant, apartment or owner, from a single grouped query. Partial
+    payments already received are deducted.
+    """
+    today = today or timezone.now().date()
+
+    def days_ago(days):
+        return today - timedelta(days=days)
+
+    columns = AGING_GROUPS[group]
+    # usernames are looked up separately: with sharding the users table is in another database
+    lookups = [lookup for lookup in columns.values() if lookup != 'owner__username']
+    rows = list(_scoped(RentPayment.objects.all(), owner_ids, 'owner_id').filter(
+        paid=False, due_date__lte=today,
+    ).annotate(outstanding=F('amount') - PaymentTransaction.collected()).order_by().values(*lookups).annotate(
+        bucket_0_30=_aging_bucket(days_ago(30), today),
+        bucket_31_60=_aging_bucket(days_ago(60), days_ago(31)),
+        bucket_61_90=_aging_bucket(days_ago(90), days_ago(61)),
+        bucket_90_plus=_aging_bucket(None, days_ago(91)),
+        total=Sum('outstanding'),
+        late_fees=Sum('late_fee__amount'),
+        payments=Count('id'),
+        oldest_due_date=Min('due_date'),
+    ).order_by('-total'))
+    usernames = {}
+    if len(lookups) < len(columns):
+        usernames = dict(get_user_model().objects.filter(
+            id__in={row['owner_id'] for row in rows},
+        ).values_list('id', 'username'))
+
+    return [
+        {
+            **{name: row[lookup] if lookup in row else usernames.get(row['owner_id']) for name, lookup in columns.items()},
+            **dict(zip(AGING_BUCKETS, (
+                row['bucket_0_30'], row['bucket_31_60'], row['bucket_61_90'], row['bucket_90_plus'],
+            ))),
+            'total': row['total'],
+            'late_fees': row['late_fees'] or Decimal(0),
+            'payments': row['payments'],
+            'oldest_due_date': row['oldest_due_date'],
+        }
+        for row in rows
+    ]
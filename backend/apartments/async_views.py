@@ -0,0 +1,245 @@
+"""
+Async composite endpoints.
+
+Each view authenticates like the DRF views (the configured authenticators),
+is throttled by TokenBucketThrottle with cost class ``list``, applies the same
+owner scoping, shard routing and read-replica routing, then runs its
+independent queries at the same time and answers in a single round trip.
+
+Django's async ORM runs every query through one shared thread, so
+``asyncio.gather`` over ``afirst()``/``aaggregate()`` would still execute them
+one after another. ``_gather`` instead gives each query its own worker thread
+and database connection (like ``config.sharding.scatter_gather``), which
+SQLite in WAL mode serves in parallel. Under config.asgi the request waits
+for them without holding a server thread.
+"""
+import asyncio
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.db.models import Count, F, Q, Sum
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from config import db_routers
+from config.sharding import shard_for_owner, sharding_enabled, shards_for_owners, use_shard
+from config.throttles import TokenBucketThrottle
+from .models import Apartment, Tenant, RentPayment, Document, Notification, PaymentTransaction
+from .serializers import (
+    ApartmentSerializer,
+    TenantListSerializer,
+    RentPaymentListSerializer,
+    DocumentListSerializer,
+)
+from .views import get_allowed_owner_ids
+
+THROTTLE_CLASSES = [TokenBucketThrottle]
+THROTTLE_COST_CLASS = 'list'
+# the dashboard lists the oldest overdue payments only; overdue_count is the full total
+DASHBOARD_OVERDUE_LIMIT = 50
+
+
+def _error(detail, status):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def _exception_response(exc):
+    body = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+    response = JsonResponse(body, status=exc.status_code, encoder=JSONEncoder)
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = str(int(exc.wait))
+    return response
+
+
+class _ThrottleScope:
+    """Stand-in for the view instance the throttle classes inspect."""
+    action = None
+    throttle_cost_class = THROTTLE_COST_CLASS
+
+
+@sync_to_async
+def _authenticate(request):
+    for authenticator_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authenticator_class().authenticate(request)
+        if result is not None:
+            request.user = result[0]
+            return result[0]
+    return None
+
+
+def _check_throttles(request):
+    """Same checks as ``APIView.check_throttles``."""
+    durations = []
+    for throttle_class in THROTTLE_CLASSES:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, _ThrottleScope):
+            durations.append(throttle.wait())
+    durations = [duration for duration in durations if duration is not None]
+    if durations:
+        raise Throttled(wait=max(durations))
+
+
+class _MultipleShards(APIException):
+    status_code = 400
+    default_detail = {'owner': ["Τα δεδομένα σας είναι σε περισσότερες βάσεις: ορίστε owner"]}
+
+
+def _shard_alias(request, owner_ids):
+    """Shard of the owner scope (narrowed by ``?owner=``), None when sharding is off."""
+    if not sharding_enabled():
+        return None
+    aliases = shards_for_owners(owner_ids)
+    owner_id = request.GET.get('owner')
+    if owner_id and owner_id.isdigit() and (owner_ids is None or int(owner_id) in owner_ids):
+        aliases = [shard_for_owner(int(owner_id))]
+    if len(aliases) > 1:
+        raise _MultipleShards()
+    return aliases[0] if aliases else None
+
+
+async def _serve(request, handler, *args):
+    """Authenticate, throttle and route ``request``, then answer with ``handler(user, owner_ids, *args)``."""
+    if request.method != 'GET':
+        return _error(f'Method "{request.method}" not allowed.', 405)
+    try:
+        user = await _authenticate(request)
+        if user is None:
+            return _error("Authentication credentials were not provided.", 401)
+        await sync_to_async(_check_throttles)(request)
+        owner_ids = await sync_to_async(get_allowed_owner_ids)(user)
+        alias = await sync_to_async(_shard_alias)(request, owner_ids)
+    except APIException as exc:
+        return _exception_response(exc)
+
+    # the routing context variables are copied into the query threads by sync_to_async
+    with ExitStack() as routing:
+        routing.enter_context(use_shard(alias))
+        token = db_routers.route_reads_to_replica(user.pk)
+        if token is not None:
+            routing.callback(db_routers.reset_read_routing, token)
+        return await handler(user, owner_ids, *args)
+
+
+def _in_transaction():
+    return any(connection.in_atomic_block for connection in connections.all(initialized_only=True))
+
+
+def _own_connection(call):
+    def run():
+        try:
+            return call()
+        finally:
+            connections.close_all()
+    return run
+
+
+async def _gather(*calls):
+    """
+    Run the blocking ``calls`` concurrently, each in a worker thread on its
+    own database connections, and return their results in order. Inside a
+    transaction they run one after another on its connection instead, since
+    other connections cannot see its uncommitted rows.
+    """
+    if await sync_to_async(_in_transaction)():
+        return [await sync_to_async(call)() for call in calls]
+    return await asyncio.gather(*(sync_to_async(_own_connection(call), thread_sensitive=False)() for call in calls))
+
+
+def _scope(queryset, owner_ids, lookup):
+    if owner_ids is None:
+        return queryset
+    return queryset.filter(**{f'{lookup}__in': owner_ids})
+
+
+def _serialize(serializer_class, instance):
+    return None if instance is None else serializer_class(instance).data
+
+
+def _lean_rows(serializer_class, queryset):
+    names = list(serializer_class.Meta.fields)
+    return serializer_class(list(serializer_class.values_queryset(queryset, names)), many=True).data
+
+
+async def apartment_overview(request, pk):
+    """Apartment with its tenants, payments, documents and totals."""
+    return await _serve(request, _apartment_overview, pk)
+
+
+async def _apartment_overview(user, owner_ids, pk):
+    apartments = _scope(Apartment.objects.filter(pk=pk), owner_ids, 'owner_id')
+    payments = _scope(RentPayment.objects.filter(tenant__apartment_id=pk), owner_ids, 'owner_id')
+    today = timezone.now().date()
+
+    apartment, tenants, payment_rows, documents, totals = await _gather(
+        lambda: _serialize(ApartmentSerializer, apartments.first()),
+        lambda: _lean_rows(TenantListSerializer, _scope(
+            Tenant.objects.filter(apartment_id=pk), owner_ids, 'apartment__owner_id',
+        )),
+        lambda: _lean_rows(RentPaymentListSerializer, payments),
+        lambda: _lean_rows(DocumentListSerializer, _scope(
+            Document.objects.filter(Q(apartment_id=pk) | Q(tenant__apartment_id=pk)), owner_ids, 'owner_id',
+        )),
+        lambda: payments.annotate(received=PaymentTransaction.collected()).aggregate(
+            total_paid=Sum('received'),
+            total_unpaid=Sum(F('amount') - F('received'), filter=Q(paid=False)),
+            overdue_count=Count('id', filter=Q(paid=False, due_date__lt=today)),
+            payment_count=Count('id'),
+        ),
+    )
+    if apartment is None:
+        return _error("Not found.", 404)
+
+    return JsonResponse({
+        'apartment': apartment,
+        'tenants': tenants,
+        'payments': payment_rows,
+        'documents': documents,
+        'totals': {
+            'total_paid': totals['total_paid'] or 0,
+            'total_unpaid': totals['total_unpaid'] or 0,
+            'overdue_count': totals['overdue_count'],
+            'payment_count': totals['payment_count'],
+        },
+    }, encoder=JSONEncoder)
+
+
+async def dashboard(request):
+    """
+    Dashboard stats: apartment counts, income, overdue payments (the oldest
+    DASHBOARD_OVERDUE_LIMIT of them) and unread notifications.
+    """
+    return await _serve(request, _dashboard)
+
+
+async def _dashboard(user, owner_ids):
+    today = timezone.now().date()
+    payments = _scope(RentPayment.objects.all(), owner_ids, 'owner_id')
+    overdue = payments.filter(paid=False, due_date__lt=today)
+
+    apartment_stats, income, overdue_rows, unread_count = await _gather(
+        lambda: _scope(Apartment.objects.all(), owner_ids, 'owner_id').aggregate(
+            total=Count('id'),
+            rented=Count('id', filter=Q(status='rented')),
+        ),
+        lambda: payments.annotate(received=PaymentTransaction.collected()).aggregate(
+            monthly_income=Sum('received', filter=Q(year=today.year, month=today.month)),
+            yearly_income=Sum('received', filter=Q(year=today.year)),
+            overdue_count=Count('id', filter=Q(paid=False, due_date__lt=today)),
+        ),
+        lambda: _lean_rows(RentPaymentListSerializer, overdue.order_by('due_date', 'id')[:DASHBOARD_OVERDUE_LIMIT]),
+        lambda: Notification.objects.filter(user_id=user.id, is_read=False).count(),
+    )
+
+    return JsonResponse({
+        'total_apartments': apartment_stats['total'],
+        'rented_apartments': apartment_stats['rented'],
+        'monthly_income': income['monthly_income'] or 0,
+        'yearly_income': income['yearly_income'] or 0,
+        'overdue_count': income['overdue_count'],
+        'overdue_payments': overdue_rows,
+        'unread_notifications': unread_count,
+    }, encoder=JSONEncoder)
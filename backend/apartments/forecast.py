@@ -0,0 +1,157 @@
+"""
+Cash-flow forecast from contract terms.
+
+Expected rent is derived from Tenant contract_start/contract_end/monthly_rent
+without writing any RentPayment rows: every contract contributes +rent at the
+first forecast month it is active and -rent after its last one, and a prefix
+sum over months turns those steps into monthly totals. Months that already
+have RentPayment rows use the stored amount and paid state instead.
+"""
+from collections import defaultdict
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+
+from django.contrib.auth import get_user_model
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from .models import Tenant, RentPayment, PaymentTransaction
+
+FORECAST_GROUPS = {
+    # owner labels are filled in from the users table afterwards (another database when sharded)
+    'owner': ('apartment__owner_id', 'apartment__owner_id'),
+    'apartment': ('apartment_id', 'apartment__title'),
+    'city': ('apartment__city', 'apartment__city'),
+}
+
+
+def _month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def _period(index):
+    year, month = divmod(index, 12)
+    return f'{year}-{month + 1:02d}'
+
+
+def iter_contract_steps(tenants, first, last):
+    """
+    Yield ``(key, label, month_offset, delta)`` rent steps for every contract
+    overlapping forecast months ``first..last`` (month indexes). Contract months
+    follow ``iter_rent_schedule``; open-ended contracts run to the end of the horizon.
+    """
+    for key, label, start, end, rent in tenants:
+        begin = max(_month_index(start), first)
+        stop = last
+        if end:
+            stop = _month_index(end)
+            if start + relativedelta(months=stop - _month_index(start)) > end:
+                stop -= 1
+            stop = min(stop, last)
+        if begin > stop:
+            continue
+        yield key, label, begin - first, rent
+        yield key, label, stop - first + 1, -rent
+
+
+def _payment_rows(owner_scope, group, first, last):
+    """Actual RentPayment amounts per group and month, plus the contract rent they replace."""
+    key_lookup, label_lookup = FORECAST_GROUPS[group]
+    row_index = F('year') * 12 + F('month') - 1
+    contract_start = ExtractYear('tenant__contract_start') * 12 + ExtractMonth('tenant__contract_start') - 1
+    contract_end = ExtractYear('tenant__contract_end') * 12 + ExtractMonth('tenant__contract_end') - 1
+    money = DecimalField(max_digits=12, decimal_places=2)
+
+    payments = RentPayment.objects.annotate(month_index=row_index).filter(
+        month_index__gte=first, month_index__lte=last,
+    )
+    payments = owner_scope(payments, 'owner_id')
+    payments = payments.alias(received=PaymentTransaction.collected())
+    return payments.order_by().values(f'tenant__{key_lookup}', 'month_index').annotate(
+        collected=Sum('received'),
+        outstanding=Sum(F('amount') - F('received'), filter=Q(paid=False)),
+        replaced=Sum(Case(
+            When(
+                Q(month_index__gte=contract_start)
+                & (Q(tenant__contract_end__isnull=True) | Q(month_index__lte=contract_end)),
+                then=F('tenant__monthly_rent'),
+            ),
+            default=Value(0),
+            output_field=money,
+        )),
+    )
+
+
+def cash_flow_forecast(owner_ids, group='owner', months=12, start=None):
+    """
+    Monthly expected / collected / outstanding / projected rent for ``months``
+    months from the start of the current month, per owner, apartment or city.
+    """
+    start = start or timezone.now().date()
+    first = _month_index(date(start.year, start.month, 1))
+    last = first + months - 1
+    key_lookup, label_lookup = FORECAST_GROUPS[group]
+
+    def owner_scope(queryset, lookup):
+        if owner_ids is None:
+            return queryset
+        return queryset.filter(**{f'{lookup}__in': owner_ids})
+
+    tenants = owner_scope(Tenant.objects.all(), 'apartment__owner_id').filter(
+        Q(contract_end__isnull=True) | Q(contract_end__gte=date(start.year, start.month, 1)),
+    ).values_list(key_lookup, label_lookup, 'contract_start', 'contract_end', 'monthly_rent')
+
+    steps = defaultdict(lambda: [0.0] * (months + 1))
+    labels = {}
+    for key, label, offset, delta in iter_contract_steps(tenants.iterator(), first, last):
+        steps[key][offset] += float(delta)
+        labels[key] = label
+
+    actual = defaultdict(lambda: defaultdict(lambda: [0.0, 0.0, 0.0]))
+    for row in _payment_rows(owner_scope, group, first, last):
+        bucket = actual[row[f'tenant__{key_lookup}']][row['month_index'] - first]
+        bucket[0] += float(row['collected'] or 0)
+        bucket[1] += float(row['outstanding'] or 0)
+        bucket[2] += float(row['replaced'] or 0)
+
+    if group == 'owner':
+        labels = dict(get_user_model().objects.filter(
+            id__in=set(steps) | set(actual),
+        ).values_list('id', 'username'))
+
+    groups, totals = [], [_empty_month(first + offset) for offset in range(months)]
+    for key in sorted(set(steps) | set(actual), key=lambda k: (k is None, str(k))):
+        running, series = 0.0, []
+        for offset in range(months):
+            running += steps[key][offset] if key in steps else 0.0
+            collected, outstanding, replaced = actual[key][offset] if key in actual else (0.0, 0.0, 0.0)
+            projected = max(running - replaced, 0.0)
+            month = _month(first + offset, collected, outstanding, projected)
+            series.append(month)
+            for name in ('expected', 'collected', 'outstanding', 'projected'):
+                totals[offset][name] = round(totals[offset][name] + month[name], 2)
+        groups.append({'key': key, 'label': labels.get(key, key), 'months': series})
+
+    return {
+        'start': _period(first),
+        'months': months,
+        'group': group,
+        'totals': totals,
+        'groups': groups,
+    }
+
+
+def _empty_month(index):
+    return {'period': _period(index), 'expected': 0.0, 'collected': 0.0, 'outstanding': 0.0, 'projected': 0.0}
+
+
+def _month(index, collected, outstanding, projected):
+    return {
+        'period': _period(index),
+        'expected': round(collected + outstanding + projected, 2),
+        'collected': round(collected, 2),
+        'outstanding': round(outstanding, 2),
+        'projected': round(projected, 2),
+    }
@@ -0,0 +1,71 @@
+"""
+``Idempotency-Key`` support for unsafe API actions.
+
+The first request with a key reserves an IdempotencyKey row (unique per user
+and key) and stores its response when it succeeds. A retry with the same key
+finds the row and gets the stored response back, marked with an
+``Idempotent-Replayed`` header, without running the action again; a retry
+that arrives while the first request is still running gets 409. The
+reservation is written inside the request's transaction
+(ImmediateWriteMixin), so a failed request leaves no row and can be retried.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def request_hash(request):
+    """Fingerprint of the method, path and body, to catch a key reused for another request."""
+    body = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.blake2b(f'{request.method} {request.path} {body}'.encode(), digest_size=16).hexdigest()
+
+
+def idempotent(handler):
+    """Make a view action replayable through the ``Idempotency-Key`` header."""
+
+    @wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'idempotency_key': ["Το κλειδί είναι πολύ μεγάλο"]}, status=400)
+
+        fingerprint = request_hash(request)
+        try:
+            with transaction.atomic(using=router.db_for_write(IdempotencyKey)):
+                record = IdempotencyKey.objects.create(user_id=request.user.pk, key=key, request_hash=fingerprint)
+        except IntegrityError:
+            record = IdempotencyKey.objects.get(user_id=request.user.pk, key=key)
+            if record.request_hash != fingerprint:
+                return Response({'idempotency_key': ["Το κλειδί έχει χρησιμοποιηθεί για άλλο αίτημα"]}, status=422)
+            if record.status_code is None:
+                return Response({'idempotency_key': ["Το αίτημα με αυτό το κλειδί εκτελείται ακόμη"]}, status=409)
+            response = Response(record.response, status=record.status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        response = handler(view, request, *args, **kwargs)
+        if response.status_code < 400:
+            IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code, response=response.data)
+        return response
+
+    return wrapper
+
+
+def prune_idempotency_keys(now=None):
+    """Delete keys older than settings.IDEMPOTENCY_KEY_TTL_HOURS; returns how many."""
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
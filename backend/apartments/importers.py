@@ -0,0 +1,171 @@
+"""
+Bulk import of apartments, each with an optional tenant, from CSV or XLSX.
+
+The first row is a header. Apartment columns use the Apartment field names
+(title, address, square_meters, ...); tenant columns use the Tenant field
+names prefixed with ``tenant_`` (tenant_full_name, tenant_contract_start, ...).
+Rows are validated in batches and nothing is written unless every row is valid;
+the write transaction is only taken for the inserts.
+"""
+import csv
+import io
+import os
+from itertools import islice
+
+from django.db import router, transaction
+
+from config.sharding import shard_for_owner, sharding_enabled, use_shard
+
+from .analytics import invalidate_owner_analytics
+from .models import Apartment, Tenant, RentPayment
+from .occupancy import refresh_apartment_statuses
+from .serializers import ApartmentSerializer, TenantImportSerializer
+from .utils import build_rent_payments, bulk_create_in_chunks
+
+TENANT_PREFIX = 'tenant_'
+BATCH_SIZE = 500
+
+
+class PortfolioImportError(Exception):
+    """Raised with row-level errors; nothing has been written."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid rows")
+        self.errors = errors
+
+
+def read_rows(fileobj, filename):
+    """Yield ``(row_number, {column: value})`` for every non-empty data row."""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        rows = _read_xlsx(fileobj)
+    elif extension in ('', '.csv', '.txt'):
+        rows = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    else:
+        raise PortfolioImportError([{'row': None, 'errors': {'file': [f"Μη υποστηριζόμενος τύπος αρχείου: {extension}"]}}])
+
+    header = None
+    for row_number, values in enumerate(rows, start=1):
+        if header is None:
+            header = [str(value or '').strip() for value in values]
+            continue
+        row = {}
+        for column, value in zip(header, values):
+            if isinstance(value, str):
+                value = value.strip()
+            if column and value not in (None, ''):
+                row[column] = value
+        if row:
+            yield row_number, row
+
+
+def _read_xlsx(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise PortfolioImportError([{'row': None, 'errors': {'file': ["Η εισαγωγή XLSX απαιτεί το openpyxl"]}}])
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _split_row(row):
+    apartment_data, tenant_data = {}, {}
+    for column, value in row.items():
+        if column.startswith(TENANT_PREFIX):
+            tenant_data[column[len(TENANT_PREFIX):]] = value
+        else:
+            apartment_data[column] = value
+    return apartment_data, tenant_data
+
+
+def _errors_by_index(errors):
+    # ListSerializer reports a list aligned with the input or, on newer DRF, a dict keyed by index
+    if isinstance(errors, dict):
+        return errors
+    return {index: error for index, error in enumerate(errors) if error}
+
+
+def validate_rows(rows):
+    """Validate rows batch by batch; returns ``[(apartment_data, tenant_data or None)]``."""
+    validated, errors = [], []
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, BATCH_SIZE))
+        if not batch:
+            break
+        split = [_split_row(row) for _, row in batch]
+
+        # one list serializer per batch builds the field set once instead of per row
+        apartments = ApartmentSerializer(data=[apartment_data for apartment_data, _ in split], many=True)
+        apartments.is_valid()
+        with_tenant = [index for index, (_, tenant_data) in enumerate(split) if tenant_data]
+        tenants = TenantImportSerializer(data=[split[index][1] for index in with_tenant], many=True)
+        tenants.is_valid()
+        apartment_errors = _errors_by_index(apartments.errors)
+        tenant_errors = {with_tenant[i]: e for i, e in _errors_by_index(tenants.errors).items()}
+
+        for index, (row_number, _) in enumerate(batch):
+            row_errors = dict(apartment_errors.get(index, {}))
+            row_errors.update({f'{TENANT_PREFIX}{name}': e for name, e in tenant_errors.get(index, {}).items()})
+            if row_errors:
+                errors.append({'row': row_number, 'errors': row_errors})
+
+        if not errors:
+            tenant_data = dict(zip(with_tenant, tenants.validated_data))
+            validated.extend(
+                (apartment_data, tenant_data.get(index))
+                for index, apartment_data in enumerate(apartments.validated_data)
+            )
+
+    if errors:
+        raise PortfolioImportError(errors)
+    return validated
+
+
+def write_portfolio(validated, owner_id):
+    """
+    Create the apartments and tenants of ``validated`` (from validate_rows)
+    for ``owner_id`` in one transaction, generate the rent schedule of every
+    tenant in a single pass and set the apartments' occupancy from their
+    contracts. Returns the number of apartments, tenants and payments created.
+    """
+    shard = shard_for_owner(owner_id) if sharding_enabled() else None
+    with use_shard(shard):
+        using = router.db_for_write(Apartment)
+        with transaction.atomic(using=using):
+            apartments = [
+                Apartment(owner_id=owner_id, **{**data, 'is_rented': data.get('status') == 'rented'})
+                for data, _ in validated
+            ]
+            for start in range(0, len(apartments), BATCH_SIZE):
+                Apartment.objects.bulk_create(apartments[start:start + BATCH_SIZE])
+
+            tenants = [
+                Tenant(apartment=apartment, **tenant_data)
+                for apartment, (_, tenant_data) in zip(apartments, validated)
+                if tenant_data is not None
+            ]
+            for start in range(0, len(tenants), BATCH_SIZE):
+                Tenant.objects.bulk_create(tenants[start:start + BATCH_SIZE])
+
+            payments = bulk_create_in_chunks(RentPayment, build_rent_payments(tenants))
+
+            # bulk_create skips the save() signals that keep occupancy in sync
+            for start in range(0, len(apartments), BATCH_SIZE):
+                refresh_apartment_statuses(Apartment.objects.using(using).filter(
+                    pk__in=[apartment.pk for apartment in apartments[start:start + BATCH_SIZE]],
+                ))
+
+    invalidate_owner_analytics(owner_id)
+    return {'apartments': len(apartments), 'tenants': len(tenants), 'payments': payments}
+
+
+def import_portfolio(fileobj, filename, owner_id):
+    """
+    Validate every row of ``fileobj``, then write them all for ``owner_id``;
+    the write transaction is only opened once the whole file is valid.
+    """
+    return write_portfolio(validate_rows(read_rows(fileobj, filename)), owner_id)
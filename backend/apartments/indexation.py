@@ -0,0 +1,154 @@
+"""
+Annual rent indexation.
+
+Raises ``Tenant.monthly_rent`` and every unpaid RentPayment due on or after
+the effective date, either by a fixed percentage or by a CPI-style table of
+percentages per month (each tenant gets the rate of its contract
+anniversary month). Each distinct rate is one set-based
+``UPDATE ... SET amount = ROUND(amount * factor, 2)`` per table, all inside
+one transaction; a dry run reports the same figures from aggregate queries
+outside any transaction, so it never takes the write lock. Payments of
+closed periods are never touched and every changed payment gets an
+``updated`` PaymentEvent.
+"""
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import router, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum, Value
+from django.db.models.functions import Round
+
+from .analytics import invalidate_owner_analytics
+from .models import PaymentEvent, PeriodClose, RentPayment, Tenant
+
+MAX_PERCENT = Decimal(50)
+EVENT_BATCH_SIZE = 2000
+CENT = Decimal('0.01')
+
+
+class IndexationError(Exception):
+    pass
+
+
+def _percent(value):
+    try:
+        percent = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        raise IndexationError(f"Μη έγκυρο ποσοστό: {value}")
+    if not -MAX_PERCENT <= percent <= MAX_PERCENT:
+        raise IndexationError(f"Το ποσοστό πρέπει να είναι μεταξύ -{MAX_PERCENT} και {MAX_PERCENT}")
+    return percent
+
+
+def _money(value):
+    return Decimal(value or 0).quantize(CENT)
+
+
+def rate_groups(percent=None, table=None):
+    """
+    ``[(percent, tenant filter)]`` for a fixed ``percent`` or a ``table`` of
+    ``{month (1-12): percent}`` keyed by contract anniversary month.
+    """
+    if (percent is None) == (table is None):
+        raise IndexationError("Ορίστε είτε ποσοστό είτε πίνακα ποσοστών ανά μήνα")
+    if percent is not None:
+        return [(_percent(percent), Q())]
+    groups = {}
+    for month, value in table.items():
+        try:
+            month = int(month)
+        except (TypeError, ValueError):
+            month = 0
+        if not 1 <= month <= 12:
+            raise IndexationError(f"Μη έγκυρος μήνας στον πίνακα: {month}")
+        groups.setdefault(_percent(value), []).append(month)
+    return [(rate, Q(contract_start__month__in=sorted(months))) for rate, months in groups.items()]
+
+
+def _scopes(owner_ids, effective, apartment_ids, tenant_ids):
+    """Tenants (active on ``effective``) and the unpaid open-period payments from ``effective`` on."""
+    tenants = Tenant.objects.filter(Q(contract_end__isnull=True) | Q(contract_end__gte=effective))
+    payments = RentPayment.objects.filter(paid=False, due_date__gte=effective).filter(
+        ~Exists(PeriodClose.objects.filter(owner_id=OuterRef('owner_id'), year=OuterRef('year'), month=OuterRef('month')))
+    )
+    if owner_ids is not None:
+        tenants = tenants.filter(apartment__owner_id__in=owner_ids)
+        payments = payments.filter(owner_id__in=owner_ids)
+    if apartment_ids:
+        tenants = tenants.filter(apartment_id__in=apartment_ids)
+    if tenant_ids:
+        tenants = tenants.filter(id__in=tenant_ids)
+    return tenants, payments
+
+
+def index_rents(owner_ids, effective, percent=None, table=None, apartment_ids=None, tenant_ids=None, dry_run=False):
+    """
+    Index the rents of ``owner_ids`` (None: all owners), optionally narrowed
+    to apartments or tenants. Returns per-rate and overall tenant/payment
+    counts with rent totals before and after.
+    """
+    groups = rate_groups(percent, table)
+    tenants, payments = _scopes(owner_ids, effective, apartment_ids, tenant_ids)
+
+    result = {'effective_date': effective, 'dry_run': dry_run, 'rates': []}
+    if dry_run:
+        # plain reads: no transaction, so a preview never takes the write lock
+        for rate, tenant_filter in groups:
+            group_tenants, group_payments = _group(tenants, payments, tenant_filter)
+            factor = Value(1 + rate / 100)
+            entry = _entry(rate, group_tenants, group_payments)
+            # same rounding as the UPDATE, evaluated without writing
+            entry['monthly_rent_after'] = _money(group_tenants.aggregate(
+                after=Sum(Round(F('monthly_rent') * factor, 2))
+            )['after'])
+            entry['amount_after'] = _money(group_payments.aggregate(
+                after=Sum(Round(F('amount') * factor, 2))
+            )['after'])
+            result['rates'].append(entry)
+    else:
+        owners = set()
+        with transaction.atomic(using=router.db_for_write(RentPayment)):
+            for rate, tenant_filter in groups:
+                group_tenants, group_payments = _group(tenants, payments, tenant_filter)
+                factor = Value(1 + rate / 100)
+                entry = _entry(rate, group_tenants, group_payments)
+                owners.update(group_tenants.values_list('apartment__owner_id', flat=True).distinct())
+                group_payments.update(amount=Round(F('amount') * factor, 2))
+                group_tenants.update(monthly_rent=Round(F('monthly_rent') * factor, 2))
+                _record_events(group_payments)
+                entry['monthly_rent_after'] = _money(group_tenants.aggregate(after=Sum('monthly_rent'))['after'])
+                entry['amount_after'] = _money(group_payments.aggregate(after=Sum('amount'))['after'])
+                result['rates'].append(entry)
+        if owners:
+            invalidate_owner_analytics(*owners)
+
+    result['totals'] = {
+        name: sum((entry[name] for entry in result['rates']), 0)
+        for name in ('tenants', 'payments', 'monthly_rent_before', 'monthly_rent_after', 'amount_before', 'amount_after')
+    }
+    return result
+
+
+def _group(tenants, payments, tenant_filter):
+    group_tenants = tenants.filter(tenant_filter)
+    return group_tenants, payments.filter(tenant__in=group_tenants.values('id'))
+
+
+def _entry(rate, tenants, payments):
+    """Counts and totals of a rate group before indexation."""
+    rents = tenants.aggregate(tenants=Count('id'), before=Sum('monthly_rent'))
+    due = payments.aggregate(payments=Count('id'), before=Sum('amount'))
+    return {
+        'percent': rate,
+        'tenants': rents['tenants'],
+        'monthly_rent_before': _money(rents['before']),
+        'payments': due['payments'],
+        'amount_before': _money(due['before']),
+    }
+
+
+def _record_events(payments):
+    """``updated`` events for the freshly indexed ``payments``, written in batches."""
+    rows = payments.order_by('id').iterator(chunk_size=EVENT_BATCH_SIZE)
+    while chunk := list(islice(rows, EVENT_BATCH_SIZE)):
+        PaymentEvent.objects.bulk_create(PaymentEvent.for_payments(chunk, 'updated'))
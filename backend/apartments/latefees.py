@@ -0,0 +1,109 @@
+"""
+Late fees on overdue rent.
+
+Each owner can set a LateFeeRule (optionally per apartment). The nightly
+``recompute_late_fees`` run streams every unpaid, overdue payment of owners
+with a rule with its outstanding balance (amount less the partial payments
+received) and ``due_date``, computes the fees in Decimal and upserts the
+LateFee lines in bulk. Fees are recomputed from the due date every night,
+so the run is idempotent; once a payment is paid its fee line is no longer
+touched.
+"""
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .analytics import invalidate_owner_analytics
+from .models import LateFee, LateFeeRule, PaymentTransaction, RentPayment
+
+CHUNK_SIZE = 50000
+WRITE_BATCH_SIZE = 5000
+CENT = Decimal('0.01')
+
+
+def compute_fee(balance, days_late, flat_fee, daily_rate, grace_days, max_amount, max_percent):
+    """
+    Fee on an outstanding ``balance`` that is ``days_late`` days overdue
+    (caps are None when the rule has none), rounded half up to cents.
+    """
+    chargeable = days_late - grace_days
+    if chargeable <= 0 or balance <= 0:
+        return Decimal(0)
+    fee = flat_fee + balance * daily_rate / 100 * chargeable
+    if max_amount is not None:
+        fee = min(fee, max_amount)
+    if max_percent is not None:
+        fee = min(fee, balance * max_percent / 100)
+    return fee.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _rules():
+    """``(rules by apartment_id, rules by owner_id)`` of the active rules."""
+    by_apartment, by_owner = {}, {}
+    for rule in LateFeeRule.objects.filter(is_active=True):
+        parameters = (
+            rule.id, rule.flat_fee, rule.daily_rate, rule.grace_days, rule.max_amount, rule.max_percent,
+        )
+        if rule.apartment_id is None:
+            by_owner[rule.owner_id] = parameters
+        else:
+            by_apartment[rule.apartment_id] = parameters
+    return by_apartment, by_owner
+
+
+def recompute_late_fees(today=None, chunk_size=CHUNK_SIZE):
+    """
+    Recompute the fee line of every overdue unpaid payment covered by a rule.
+    Returns ``{'payments', 'fees', 'seconds'}``.
+    """
+    started = time.perf_counter()
+    today = today or timezone.now().date()
+    by_apartment, by_owner = _rules()
+    overdue = RentPayment.objects.filter(
+        Q(owner_id__in=list(by_owner)) | Q(tenant__apartment_id__in=list(by_apartment)),
+        paid=False,
+        due_date__lt=today,
+    ).annotate(
+        balance=F('amount') - PaymentTransaction.collected(),
+    ).order_by().values_list('id', 'owner_id', 'tenant__apartment_id', 'balance', 'due_date')
+
+    payments = fees = 0
+    owner_ids = set()
+    rows = overdue.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        rules = [by_apartment.get(apartment_id) or by_owner[owner_id] for _, owner_id, apartment_id, _, _ in chunk]
+        days_late = [(today - due_date).days for *_, due_date in chunk]
+        lines = [
+            LateFee(
+                payment_id=payment_id,
+                owner_id=owner_id,
+                rule_id=rule[0],
+                days_late=days,
+                amount=fee,
+                computed_at=today,
+            )
+            for (payment_id, owner_id, _, balance, _), rule, days in zip(chunk, rules, days_late)
+            if (fee := compute_fee(balance, days, *rule[1:])) > 0
+        ]
+        LateFee.objects.bulk_create(
+            lines,
+            batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['payment'],
+            update_fields=['owner', 'rule', 'days_late', 'amount', 'computed_at'],
+        )
+        payments += len(chunk)
+        fees += len(lines)
+        owner_ids.update(line.owner_id for line in lines)
+
+    # unpaid payments no longer covered by a rule (removed, deactivated) lose their fee
+    stale = LateFee.objects.filter(payment__paid=False, computed_at__lt=today)
+    owner_ids.update(stale.values_list('owner_id', flat=True).distinct())
+    stale.delete()
+
+    if owner_ids:
+        invalidate_owner_analytics(*owner_ids)
+    return {'payments': payments, 'fees': fees, 'seconds': round(time.perf_counter() - started, 2)}
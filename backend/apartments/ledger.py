@@ -0,0 +1,180 @@
+"""
+Partial payments.
+
+Money received is recorded as PaymentTransaction rows, any number per
+RentPayment; the payment is marked paid (with the date and method of the
+transaction that settled it) once they cover its amount, and unpaid again if
+a transaction is removed; while they cover it the payment cannot be marked
+unpaid by hand. ``RentPayment.paid`` stays authoritative, so a payment
+marked paid without transactions counts as fully collected.
+
+Paid/unpaid transitions are conditional updates (``UPDATE ... WHERE paid =
+false``) that write only the state columns, so concurrent callers cannot
+both win: exactly one of them gets ``True`` back and runs the side effects.
+
+Balances are computed in SQL: ``with_balances`` annotates each payment with
+its collected amount and balance, plus the tenant's running balance as a
+window function over the due dates, so a tenant statement is one query
+however many transactions it covers.
+"""
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import F, Sum, Value, Window
+from django.utils import timezone
+
+from .analytics import invalidate_owner_analytics
+from .models import PaymentEvent, PaymentTransaction, RentPayment
+from .periods import flag_amended
+
+
+class LedgerError(Exception):
+    pass
+
+
+def with_balances(payments, opening_balance=Decimal(0)):
+    """
+    ``payments`` annotated with ``collected``, ``balance`` and
+    ``running_balance`` (the tenant's balance up to and including the
+    payment, on top of ``opening_balance``).
+    """
+    return payments.annotate(collected=PaymentTransaction.collected()).annotate(
+        balance=F('amount') - F('collected'),
+        running_balance=Window(
+            Sum(F('amount') - F('collected')),
+            partition_by=[F('tenant_id')],
+            order_by=[F('due_date').asc(), F('id').asc()],
+        ) + Value(opening_balance),
+    )
+
+
+def received(payment):
+    """Sum of the transactions recorded against ``payment``."""
+    return PaymentTransaction.objects.filter(payment=payment).aggregate(total=Sum('amount'))['total'] or Decimal(0)
+
+
+def _transition(payment, paid, **fields):
+    """
+    ``UPDATE ... SET paid = <paid>, ... WHERE id = <payment> AND paid = <not paid>``;
+    reloads ``payment`` and, when this call made the change, logs the
+    PaymentEvent (update() skips the model signals). Returns whether it did.
+    """
+    with transaction.atomic(using=router.db_for_write(RentPayment)):
+        changed = RentPayment.objects.filter(pk=payment.pk, paid=not paid).update(paid=paid, **fields) == 1
+        payment.refresh_from_db()
+        payment._loaded_paid = payment.paid
+        if changed:
+            PaymentEvent.objects.bulk_create(PaymentEvent.for_payments([payment], 'paid' if paid else 'unpaid'))
+            flag_amended(payment.owner_id, payment.year, payment.month)
+    if changed:
+        invalidate_owner_analytics(payment.owner_id)
+    return changed
+
+
+def mark_payment_paid(payment, paid_date=None, **fields):
+    """Mark ``payment`` paid unless it already is; ``fields``: payment_method, receipt_number, notes."""
+    return _transition(payment, True, paid_date=paid_date or timezone.now().date(), **fields)
+
+
+def mark_payment_unpaid(payment):
+    """Mark ``payment`` unpaid unless it already is; refused while its transactions cover it."""
+    with transaction.atomic(using=router.db_for_write(RentPayment)):
+        total = received(payment)
+        if total > 0 and total >= payment.amount:
+            raise LedgerError("Η πληρωμή καλύπτεται από καταχωρημένες εισπράξεις, διαγράψτε πρώτα κάποια από αυτές")
+        return _transition(payment, False, paid_date=None)
+
+
+def sync_payment(payment):
+    """Mark ``payment`` paid or unpaid according to its transactions."""
+    total = received(payment)
+    paid = total > 0 and total >= payment.amount
+    if paid == payment.paid:
+        return payment
+    if paid:
+        last = PaymentTransaction.objects.filter(payment=payment).order_by('-paid_date', '-id').first()
+        mark_payment_paid(
+            payment,
+            last.paid_date,
+            payment_method=last.payment_method,
+            receipt_number=payment.receipt_number or last.receipt_number,
+        )
+    else:
+        mark_payment_unpaid(payment)
+    return payment
+
+
+def record_transaction(payment, amount, paid_date=None, payment_method=None, receipt_number='', notes=''):
+    """Record ``amount`` received towards ``payment``; it may not exceed the outstanding balance."""
+    if amount <= 0:
+        raise LedgerError("Το ποσό πρέπει να είναι θετικό")
+    with transaction.atomic(using=router.db_for_write(PaymentTransaction)):
+        # row lock (where supported) so concurrent partial payments cannot overshoot the balance
+        payment = RentPayment.objects.select_for_update().get(pk=payment.pk)
+        if payment.paid:
+            raise LedgerError("Η πληρωμή έχει ήδη εξοφληθεί")
+        balance = payment.amount - received(payment)
+        if amount > balance:
+            raise LedgerError(f"Το ποσό υπερβαίνει το υπόλοιπο ({balance}€)")
+        entry = PaymentTransaction.objects.create(
+            payment=payment,
+            owner_id=payment.owner_id,
+            amount=amount,
+            paid_date=paid_date or timezone.now().date(),
+            payment_method=payment_method,
+            receipt_number=receipt_number,
+            notes=notes,
+        )
+        sync_payment(payment)
+    return entry
+
+
+def delete_transaction(entry):
+    with transaction.atomic(using=router.db_for_write(PaymentTransaction)):
+        payment = entry.payment
+        entry.delete()
+        sync_payment(payment)
+
+
+def tenant_ledger(tenant_id, year=None):
+    """
+    Payments of a tenant (optionally one year) with their balances and
+    running balance, and the transactions with paid-to-date totals per
+    payment and per tenant; every figure comes from SQL.
+    """
+    payments = RentPayment.objects.filter(tenant_id=tenant_id)
+    transactions = PaymentTransaction.objects.filter(payment__tenant_id=tenant_id)
+    opening_balance = Decimal(0)
+    if year is not None:
+        opening_balance = payments.filter(year__lt=year).annotate(
+            collected=PaymentTransaction.collected(),
+        ).aggregate(balance=Sum(F('amount') - F('collected')))['balance'] or Decimal(0)
+        payments = payments.filter(year=year)
+        transactions = transactions.filter(payment__year=year)
+
+    totals = payments.annotate(collected=PaymentTransaction.collected()).aggregate(
+        total_expected=Sum('amount'), total_collected=Sum('collected'),
+    )
+    expected, collected = totals['total_expected'] or Decimal(0), totals['total_collected'] or Decimal(0)
+    order = [F('paid_date').asc(), F('id').asc()]
+    return {
+        'tenant_id': tenant_id,
+        'year': year,
+        'opening_balance': opening_balance,
+        'totals': {
+            'expected': expected,
+            'collected': collected,
+            'balance': expected - collected,
+            'closing_balance': opening_balance + expected - collected,
+        },
+        'payments': list(with_balances(payments, opening_balance).order_by('due_date', 'id').values(
+            'id', 'year', 'month', 'due_date', 'amount', 'paid', 'paid_date', 'collected', 'balance', 'running_balance',
+        )),
+        'transactions': list(transactions.annotate(
+            payment_paid_to_date=Window(Sum('amount'), partition_by=[F('payment_id')], order_by=order),
+            paid_to_date=Window(Sum('amount'), order_by=order),
+        ).order_by('paid_date', 'id').values(
+            'id', 'payment_id', 'payment__year', 'payment__month', 'amount', 'paid_date', 'payment_method',
+            'receipt_number', 'payment_paid_to_date', 'paid_to_date',
+        )),
+    }
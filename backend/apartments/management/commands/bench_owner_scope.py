@@ -0,0 +1,50 @@
+"""
+Compare owner scoping through joins with the denormalised owner column.
+
+Runs the payment and document scoping queries of the API both ways against
+the current database and prints timings and SQLite query plans.
+
+    python manage.py bench_owner_scope --repeat 20
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from apartments.models import Apartment, RentPayment, Document
+
+
+class Command(BaseCommand):
+    help = "Benchmark owner-scoped payment/document queries: joins vs denormalised owner_id"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--owners', type=int, default=5, help="Size of the owner scope (like an accountant)")
+        parser.add_argument('--explain', action='store_true', help="Print the query plans")
+
+    def handle(self, *args, **options):
+        owner_ids = list(
+            Apartment.objects.order_by().values_list('owner_id', flat=True).distinct()[:options['owners']]
+        )
+        if not owner_ids:
+            self.stdout.write("No apartments to benchmark")
+            return
+
+        cases = [
+            ('payments via joins', RentPayment.objects.filter(tenant__apartment__owner_id__in=owner_ids)),
+            ('payments via owner_id', RentPayment.objects.filter(owner_id__in=owner_ids)),
+            ('documents via joins', Document.objects.filter(
+                Q(tenant__apartment__owner_id__in=owner_ids) | Q(apartment__owner_id__in=owner_ids)
+            )),
+            ('documents via owner_id', Document.objects.filter(owner_id__in=owner_ids)),
+        ]
+        for label, queryset in cases:
+            page = queryset.values_list('pk', flat=True)[:100]
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                count = queryset.count()
+                list(page)
+            elapsed = (time.perf_counter() - start) / options['repeat']
+            self.stdout.write(f"{label:<24} {elapsed * 1000:9.2f} ms  ({count} rows)")
+            if options['explain']:
+                self.stdout.write(f"    {queryset.values_list('pk', flat=True).explain()}")
@@ -0,0 +1,112 @@
+"""
+Multi-threaded stress test of the mark_paid / mark_unpaid API actions.
+
+Creates a scratch owner with a few payments in the current database, then
+client threads call mark_paid on the same payments at once, half of them
+retrying with a shared Idempotency-Key. Checks that every payment was paid
+exactly once (one 'paid' event, one notification), that retries got the
+original response back, and removes the scratch data again.
+
+    python manage.py bench_payment_transitions --threads 8 --payments 20
+"""
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apartments.models import Apartment, IdempotencyKey, Notification, PaymentEvent, RentPayment, Tenant
+from apartments.utils import generate_rent_payments
+from apartments.views import RentPaymentViewSet
+
+
+def _client(user, payment_ids, keyed, barrier, results):
+    mark_paid = RentPaymentViewSet.as_view({'post': 'mark_paid'}, throttle_classes=[])
+    factory = APIRequestFactory()
+    try:
+        barrier.wait()
+        for payment_id in payment_ids:
+            headers = {'HTTP_IDEMPOTENCY_KEY': f'bench-{payment_id}'} if keyed else {}
+            request = factory.post(f'/api/payments/{payment_id}/mark_paid/', {'payment_method': 'cash'}, format='json', **headers)
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            response = mark_paid(request, pk=payment_id)
+            results.append((
+                payment_id, keyed, response.status_code, response.get('Idempotent-Replayed') == 'true',
+                response.data.get('paid_date') if response.status_code == 200 else None,
+                time.perf_counter() - started,
+            ))
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Stress concurrent mark_paid calls and check each payment is paid and notified exactly once"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--payments', type=int, default=20)
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        owner = User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:8]}', password=uuid.uuid4().hex, role='owner')
+        owner_id = owner.pk
+        try:
+            self._run(owner, options)
+        finally:
+            owner.delete()
+            PaymentEvent.objects.filter(owner_id=owner_id).delete()
+            IdempotencyKey.objects.filter(user_id=owner_id).delete()
+
+    def _run(self, owner, options):
+        apartment = Apartment.objects.create(owner=owner, title='Bench', address='-', square_meters=50)
+        tenant = Tenant.objects.create(
+            apartment=apartment, full_name='Bench Tenant', contract_start=date.today().replace(day=1),
+            contract_end=None, monthly_rent=450,
+        )
+        generate_rent_payments(tenant)
+        payment_ids = list(RentPayment.objects.filter(tenant=tenant).order_by('id').values_list('id', flat=True))
+        payment_ids = payment_ids[:options['payments']]
+        notifications_before = Notification.objects.filter(user=owner, notification_type='payment_received').count()
+
+        results = []
+        barrier = threading.Barrier(options['threads'])
+        threads = [
+            threading.Thread(target=_client, args=(owner, payment_ids, index % 2 == 0, barrier, results))
+            for index in range(options['threads'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(status for _, _, status, *_ in results)
+        replayed = sum(1 for _, keyed, _, was_replayed, *_ in results if keyed and was_replayed)
+        paid_events = Counter(
+            PaymentEvent.objects.filter(payment_id__in=payment_ids, event_type='paid').values_list('payment_id', flat=True)
+        )
+        notifications = Notification.objects.filter(user=owner, notification_type='payment_received').count()
+        unpaid = RentPayment.objects.filter(pk__in=payment_ids, paid=False).count()
+        latencies = sorted(latency for *_, latency in results)
+
+        self.stdout.write(
+            f"{len(results)} calls in {elapsed:.2f}s  statuses {dict(statuses)}  {replayed} replayed  "
+            f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms  max {latencies[-1] * 1000:.1f} ms"
+        )
+        problems = []
+        if unpaid:
+            problems.append(f"{unpaid} payments left unpaid")
+        if any(count != 1 for count in paid_events.values()) or len(paid_events) != len(payment_ids):
+            problems.append(f"'paid' events per payment: {dict(Counter(paid_events.values()))}")
+        if notifications - notifications_before != len(payment_ids):
+            problems.append(f"{notifications - notifications_before} notifications for {len(payment_ids)} payments")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(f"✓ {len(payment_ids)} payments paid and notified exactly once")
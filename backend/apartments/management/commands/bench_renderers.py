@@ -0,0 +1,57 @@
+"""
+Compare the default JSONRenderer list path with the columnar renderers.
+
+    python manage.py bench_renderers --repeat 5
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from apartments.models import RentPayment
+from apartments.renderers import COLUMNAR_RENDERER_CLASSES, orjson
+from apartments.serializers import RentPaymentSerializer, RentPaymentListSerializer
+
+
+class Command(BaseCommand):
+    help = "Benchmark payment list rendering: JSONRenderer vs columnar formats"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--limit', type=int, default=None, help="Only render the first N payments")
+
+    def handle(self, *args, **options):
+        queryset = RentPayment.objects.select_related('tenant__apartment')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+        names = list(RentPaymentListSerializer.Meta.fields)
+
+        def full_serializer():
+            data = RentPaymentSerializer(list(queryset.all()), many=True).data
+            return JSONRenderer().render(data)
+
+        def lean_serializer():
+            rows = RentPaymentListSerializer.values_queryset(queryset.all(), names)
+            data = RentPaymentListSerializer(rows, many=True).data
+            return JSONRenderer().render(data)
+
+        cases = [('json (model serializer)', full_serializer), ('json (lean values)', lean_serializer)]
+        for renderer_class in COLUMNAR_RENDERER_CLASSES:
+            def columnar(renderer_class=renderer_class):
+                rows = RentPaymentListSerializer.values_list_queryset(queryset.all(), names)
+                return renderer_class().render({'columns': names, 'rows': [list(row) for row in rows]})
+            cases.append((renderer_class.media_type, columnar))
+
+        self.stdout.write(f"{queryset.count()} payments, repeat={options['repeat']}, orjson={'yes' if orjson else 'no'}")
+        baseline = None
+        for label, func in cases:
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                payload = func()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            baseline = baseline or best
+            self.stdout.write(
+                f"{label:<32} {best * 1000:9.1f} ms  {len(payload) / 1024:9.1f} KiB  x{baseline / best:5.2f}"
+            )
@@ -0,0 +1,125 @@
+"""
+Multi-process write/read benchmark for the SQLite connection profile.
+
+Runs the same mark_paid-style workload twice against a scratch database:
+once with SQLite defaults (rollback journal, deferred transactions, a new
+connection per operation) and once with settings.SQLITE_PRAGMAS, a
+persistent connection and BEGIN IMMEDIATE writes.
+
+    python manage.py bench_sqlite --writers 4 --readers 4 --seconds 5
+"""
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = """
+CREATE TABLE payment (
+    id INTEGER PRIMARY KEY,
+    tenant_id INTEGER NOT NULL,
+    amount DECIMAL NOT NULL,
+    paid BOOL NOT NULL DEFAULT 0,
+    paid_date DATE NULL
+);
+CREATE INDEX payment_tenant ON payment (tenant_id);
+"""
+
+
+def _connect(path, pragmas):
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def _worker(path, pragmas, role, rows, deadline, results):
+    tuned = bool(pragmas)
+    ops = errors = 0
+    conn = _connect(path, pragmas) if tuned else None
+    pid = os.getpid()
+    while time.time() < deadline:
+        if not tuned:
+            conn = _connect(path, pragmas)
+        payment_id = (pid * 7919 + ops) % rows + 1
+        try:
+            if role == 'writer':
+                conn.execute('BEGIN IMMEDIATE' if tuned else 'BEGIN')
+                conn.execute('SELECT paid FROM payment WHERE id = ?', (payment_id,)).fetchone()
+                conn.execute(
+                    "UPDATE payment SET paid = NOT paid, paid_date = date('now') WHERE id = ?",
+                    (payment_id,),
+                )
+                conn.execute('COMMIT')
+            else:
+                conn.execute(
+                    'SELECT paid, SUM(amount) FROM payment WHERE tenant_id = ? GROUP BY paid',
+                    (payment_id % 500,),
+                ).fetchall()
+            ops += 1
+        except sqlite3.OperationalError:
+            errors += 1
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+        if not tuned:
+            conn.close()
+    if tuned:
+        conn.close()
+    results.put((role, ops, errors))
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent SQLite writes/reads with default vs tuned connection settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        for tuned in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                pragmas = settings.SQLITE_PRAGMAS if tuned else {}
+                self._seed(path, pragmas, options['rows'])
+                totals = self._run(path, pragmas, options)
+            label = 'tuned' if tuned else 'default'
+            for role in ('writer', 'reader'):
+                ops, errors = totals[role]
+                self.stdout.write(
+                    f"{label:<8} {role}s: {ops / options['seconds']:10.0f} ops/s  {errors} locked errors"
+                )
+
+    def _seed(self, path, pragmas, rows):
+        conn = _connect(path, pragmas)
+        conn.executescript(SCHEMA)
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO payment (tenant_id, amount) VALUES (?, ?)',
+            ((i % 500, 450) for i in range(rows)),
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def _run(self, path, pragmas, options):
+        results = multiprocessing.Queue()
+        deadline = time.time() + options['seconds']
+        roles = ['writer'] * options['writers'] + ['reader'] * options['readers']
+        processes = [
+            multiprocessing.Process(target=_worker, args=(path, pragmas, role, options['rows'], deadline, results))
+            for role in roles
+        ]
+        for process in processes:
+            process.start()
+        totals = {'writer': [0, 0], 'reader': [0, 0]}
+        for _ in processes:
+            role, ops, errors = results.get()
+            totals[role][0] += ops
+            totals[role][1] += errors
+        for process in processes:
+            process.join()
+        return totals
@@ -0,0 +1,81 @@
+"""
+Concurrency harness for config.throttles.TokenBucketThrottle.
+
+Client threads per role hammer a 'list' and a 'heavy' cost-class
+endpoint for a few seconds against a private local-memory cache, then the
+accepted rate of each is compared with what the buckets allow.
+
+    python manage.py bench_throttle --clients 8 --seconds 5
+"""
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from config.throttles import TokenBucketThrottle
+
+VIEWS = {
+    'list': SimpleNamespace(action='summary', throttle_cost_class='list'),
+    'heavy': SimpleNamespace(action='portfolio', throttle_cost_class='heavy'),
+}
+
+
+def _client(role, user_id, deadline, heavy_share, results):
+    user = SimpleNamespace(pk=user_id, role=role, is_authenticated=True)
+    request = SimpleNamespace(user=user, META={'REMOTE_ADDR': '127.0.0.1'})
+    counts = Counter()
+    calls = 0
+    while time.time() < deadline:
+        kind = 'heavy' if calls % 100 < heavy_share * 100 else 'list'
+        allowed = TokenBucketThrottle().allow_request(request, VIEWS[kind])
+        counts[(role, kind, allowed)] += 1
+        calls += 1
+    results.append(counts)
+
+
+class Command(BaseCommand):
+    help = "Measure accepted vs throttled requests per role and cost class under concurrent load"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=4, help="Client threads per role")
+        parser.add_argument('--seconds', type=float, default=3)
+        parser.add_argument('--heavy-share', type=float, default=0.2, help="Fraction of calls to the heavy endpoint")
+
+    def handle(self, *args, **options):
+        bench_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-throttle'}}
+        with override_settings(CACHES=bench_cache):
+            results = []
+            deadline = time.time() + options['seconds']
+            threads = [
+                threading.Thread(target=_client, args=(role, -(index + 1) * 10 - offset, deadline, options['heavy_share'], results))
+                for offset, role in enumerate(('owner', 'accountant', 'admin'))
+                for index in range(options['clients'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        totals = sum(results, Counter())
+        seconds = options['seconds']
+        for role in ('owner', 'accountant', 'admin'):
+            bucket = settings.THROTTLE_BUCKETS[role]
+            budget = options['clients'] * (bucket['capacity'] + bucket['refill_per_second'] * seconds)
+            spent = sum(
+                totals[(role, kind, True)] * settings.THROTTLE_COST_CLASSES[kind]['cost'] for kind in VIEWS
+            )
+            for kind in VIEWS:
+                accepted, refused = totals[(role, kind, True)], totals[(role, kind, False)]
+                self.stdout.write(
+                    f"{role:<10} {kind:<6} accepted {accepted:6d} ({accepted / seconds:7.1f}/s)  throttled {refused:8d}"
+                )
+            self.stdout.write(f"{role:<10} tokens spent {spent:.0f} of at most {budget:.0f}")
+        heavy = settings.THROTTLE_COST_CLASSES['heavy']
+        if 'global' in heavy:
+            pool = heavy['global']['capacity'] + heavy['global']['refill_per_second'] * seconds
+            accepted = sum(totals[(role, 'heavy', True)] for role in ('owner', 'accountant', 'admin'))
+            self.stdout.write(f"heavy (all roles) accepted {accepted}, global pool allows {pool / heavy['cost']:.0f}")
@@ -0,0 +1,31 @@
+"""
+Keep every active tenant's rent schedule filled to a rolling horizon.
+
+Open-ended contracts only get 12 months of RentPayment rows when the tenant
+is created; run this nightly (cron) so there is always a due payment ahead.
+With sharding enabled every shard is extended in turn.
+
+    python manage.py extend_rent_schedules --horizon 12
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apartments.utils import extend_rent_schedules
+from config.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = "Extend rent schedules of active tenants up to the configured horizon"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horizon', type=int, default=settings.RENT_SCHEDULE_HORIZON_MONTHS,
+            help="Months past the current month to keep filled",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for shard in each_shard():
+            tenants, payments = extend_rent_schedules(options['horizon'], batch_size=options['batch_size'])
+            where = f" on {shard}" if shard else ""
+            self.stdout.write(f"✓ {payments} payments created for {tenants} tenants{where}")
@@ -0,0 +1,46 @@
+"""
+Render PDF receipts (and yearly statements) in bulk.
+
+Unchanged documents are skipped by content hash, so re-running is cheap.
+
+    python manage.py generate_receipts --year 2025
+    python manage.py generate_receipts --year 2025 --statements --owner owner1 --workers 4
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apartments.receipts import ReceiptError, generate_receipts, generate_statements
+from config.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = "Generate PDF receipts for paid payments (and tenant statements) of a year"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True)
+        parser.add_argument('--month', type=int)
+        parser.add_argument('--owner', help="Owner username (default: all owners)")
+        parser.add_argument('--statements', action='store_true', help="Also generate yearly tenant statements")
+        parser.add_argument('--workers', type=int, help="Render processes (default settings.PDF_RENDER_WORKERS)")
+
+    def handle(self, *args, **options):
+        owner_ids = None
+        if options['owner']:
+            User = get_user_model()
+            try:
+                owner_ids = [User.objects.get(username=options['owner']).id]
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown owner {options['owner']}")
+
+        for shard in each_shard():
+            where = f" on {shard}" if shard else ""
+            try:
+                receipts = generate_receipts(owner_ids, options['year'], options['month'], options['workers'])
+                self.stdout.write(f"✓ receipts{where}: {receipts['rendered']} rendered, {receipts['unchanged']} unchanged")
+                if options['statements']:
+                    statements = generate_statements(owner_ids, options['year'], options['workers'])
+                    self.stdout.write(
+                        f"✓ statements{where}: {statements['rendered']} rendered, {statements['unchanged']} unchanged"
+                    )
+            except ReceiptError as exc:
+                raise CommandError(str(exc))
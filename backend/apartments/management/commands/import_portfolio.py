@@ -0,0 +1,37 @@
+"""
+Import apartments and tenants from a CSV or XLSX file for one owner.
+
+    python manage.py import_portfolio portfolio.csv --owner owner1
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apartments.importers import PortfolioImportError, import_portfolio
+
+
+class Command(BaseCommand):
+    help = "Bulk import apartments and tenants (with rent schedules) from CSV/XLSX"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--owner', required=True, help="Owner username")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"Unknown owner {options['owner']}")
+
+        with open(options['path'], 'rb') as fileobj:
+            try:
+                created = import_portfolio(fileobj, options['path'], owner.id)
+            except PortfolioImportError as exc:
+                for error in exc.errors:
+                    self.stderr.write(f"row {error['row']}: {error['errors']}")
+                raise CommandError("Import aborted, nothing was written")
+
+        self.stdout.write(
+            f"✓ {created['apartments']} apartments, {created['tenants']} tenants, "
+            f"{created['payments']} payments"
+        )
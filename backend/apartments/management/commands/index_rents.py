@@ -0,0 +1,60 @@
+"""
+Index rents (monthly rent and unpaid payments from a date) in bulk.
+
+A fixed percentage, or a CPI table as JSON ``{"month": percent}`` applied by
+contract anniversary month. Preview first with --dry-run.
+
+    python manage.py index_rents --percent 3 --effective 2026-01-01 --dry-run
+    python manage.py index_rents --table cpi-2025.json --effective 2026-01-01 --owner owner1
+"""
+import json
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apartments.indexation import IndexationError, index_rents
+from config.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = "Raise monthly rents and unpaid future payments by a percentage or a CPI table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--effective', type=date.fromisoformat, required=True, help="YYYY-MM-DD")
+        parser.add_argument('--percent', help="Fixed percentage for every tenant")
+        parser.add_argument('--table', help="JSON file of {month: percent} by contract anniversary month")
+        parser.add_argument('--owner', help="Owner username (default: all owners)")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        owner_ids = None
+        if options['owner']:
+            User = get_user_model()
+            try:
+                owner_ids = [User.objects.get(username=options['owner']).id]
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown owner {options['owner']}")
+        table = None
+        if options['table']:
+            with open(options['table'], encoding='utf-8') as f:
+                table = json.load(f)
+
+        for shard in each_shard():
+            where = f" on {shard}" if shard else ""
+            try:
+                result = index_rents(
+                    owner_ids, options['effective'], percent=options['percent'], table=table,
+                    dry_run=options['dry_run'],
+                )
+            except IndexationError as exc:
+                raise CommandError(str(exc))
+            for entry in result['rates']:
+                self.stdout.write(
+                    f"  {entry['percent']}%: {entry['tenants']} tenants "
+                    f"{entry['monthly_rent_before']} → {entry['monthly_rent_after']}, "
+                    f"{entry['payments']} payments {entry['amount_before']} → {entry['amount_after']}"
+                )
+            totals = result['totals']
+            verb = "would be indexed" if options['dry_run'] else "indexed"
+            self.stdout.write(f"✓ {totals['tenants']} tenants and {totals['payments']} payments {verb}{where}")
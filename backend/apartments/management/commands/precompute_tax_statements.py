@@ -0,0 +1,33 @@
+"""
+Store the yearly E2 rental-income statements of every owner (TaxStatement).
+
+Run after year end (or nightly during tax season) so accountants get every
+owner's statement without computing it; owners are computed in batches, one
+grouped query per batch.
+
+    python manage.py precompute_tax_statements --year 2025
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apartments.tax import BATCH_SIZE, precompute_e2_statements
+from config.sharding import each_shard, shard_for_owner
+
+
+class Command(BaseCommand):
+    help = "Precompute and store the yearly E2 rental-income statements of all owners"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=timezone.now().year - 1)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        owner_ids = list(get_user_model().objects.filter(role='owner').order_by('id').values_list('id', flat=True))
+        for shard in each_shard():
+            shard_owners = [owner_id for owner_id in owner_ids if shard is None or shard_for_owner(owner_id) == shard]
+            batch_size = options['batch_size']
+            for start in range(0, len(shard_owners), batch_size):
+                precompute_e2_statements(shard_owners[start:start + batch_size], options['year'])
+            where = f" on {shard}" if shard else ""
+            self.stdout.write(f"✓ {len(shard_owners)} statements for {options['year']} stored{where}")
@@ -0,0 +1,17 @@
+"""
+Delete stored Idempotency-Key responses past settings.IDEMPOTENCY_KEY_TTL_HOURS.
+
+Run it nightly (cron):
+
+    python manage.py prune_idempotency_keys
+"""
+from django.core.management.base import BaseCommand
+
+from apartments.idempotency import prune_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"✓ {prune_idempotency_keys()} idempotency keys deleted")
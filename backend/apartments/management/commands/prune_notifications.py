@@ -0,0 +1,28 @@
+"""
+Move read notifications past their retention period to the archive table.
+
+Retention per type comes from settings.NOTIFICATION_RETENTION_DAYS. Run it
+nightly (cron):
+
+    python manage.py prune_notifications --chunk-size 500
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apartments.notifications import archive_notifications
+
+
+class Command(BaseCommand):
+    help = "Archive and delete expired read notifications in small chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=settings.NOTIFICATION_PRUNE_CHUNK_SIZE,
+            help="Rows moved per transaction",
+        )
+
+    def handle(self, *args, **options):
+        archived = archive_notifications(options['chunk_size'])
+        for notification_type, count in archived.items():
+            self.stdout.write(f"{notification_type:<20} {count}")
+        self.stdout.write(f"✓ {sum(archived.values())} notifications archived")
@@ -0,0 +1,120 @@
+"""
+Move owners between database shards.
+
+Owners that share an accountant are kept on the same shard, so an
+accountant's requests never span shards. ``--auto`` places these owner
+groups largest first (by number of rent payments) onto the least loaded
+shard and moves the ones that end up elsewhere; ``--source default``
+splits an existing unsharded database. API writes for an owner get 409
+while it is moved, and every write to the source shard waits for the copy
+(SQLite busy_timeout), so move large owners off-peak.
+
+    python manage.py rebalance_shards --owner owner1 --to shard2
+    python manage.py rebalance_shards --auto --dry-run
+"""
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from apartments.analytics import invalidate_owner_analytics
+from apartments.models import RentPayment
+from config.sharding import move_owner, owner_placements, shard_aliases, shard_for_owner
+from users.models import AccountantOwner
+
+
+def owner_groups(owner_ids):
+    """Owners linked through a shared accountant, as lists of owner ids."""
+    parent = {owner_id: owner_id for owner_id in owner_ids}
+
+    def find(owner_id):
+        while parent[owner_id] != owner_id:
+            parent[owner_id] = parent[parent[owner_id]]
+            owner_id = parent[owner_id]
+        return owner_id
+
+    by_accountant = defaultdict(list)
+    for accountant_id, owner_id in AccountantOwner.objects.filter(owner_id__in=owner_ids).values_list(
+        'accountant_id', 'owner_id'
+    ):
+        by_accountant[accountant_id].append(owner_id)
+    for linked in by_accountant.values():
+        for owner_id in linked[1:]:
+            parent[find(owner_id)] = find(linked[0])
+
+    groups = defaultdict(list)
+    for owner_id in owner_ids:
+        groups[find(owner_id)].append(owner_id)
+    return list(groups.values())
+
+
+class Command(BaseCommand):
+    help = "Move owners (with their accountants' other owners) between database shards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', help="Owner username to move (with --to)")
+        parser.add_argument('--to', help="Target shard alias")
+        parser.add_argument('--auto', action='store_true', help="Balance all owners by payment count")
+        parser.add_argument('--source', help="Read every owner from this database instead of its shard, e.g. default")
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if not aliases:
+            raise CommandError("No shards configured (set SPITIIQ_SHARD_DBS)")
+        if options['auto'] == bool(options['owner']):
+            raise CommandError("Use either --owner/--to or --auto")
+
+        User = get_user_model()
+        if options['owner']:
+            if options['to'] not in aliases:
+                raise CommandError(f"--to must be one of {', '.join(aliases)}")
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown owner {options['owner']}")
+            moves = [(owner.id, options['source'] or shard_for_owner(owner.id), options['to'])]
+        else:
+            moves = self.plan(list(User.objects.filter(role='owner').values_list('id', flat=True)), aliases, options['source'])
+
+        usernames = dict(User.objects.filter(id__in=[owner_id for owner_id, _, _ in moves]).values_list('id', 'username'))
+        for owner_id, source, target in moves:
+            if source == target:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"  {usernames[owner_id]}: {source} → {target}")
+                continue
+            moved = move_owner(owner_id, source, target, options['chunk_size'])
+            invalidate_owner_analytics(owner_id)
+            self.stdout.write(f"  {usernames[owner_id]}: {source} → {target} ({sum(moved.values())} rows)")
+
+        changed = sum(source != target for _, source, target in moves)
+        self.stdout.write(f"✓ {changed} owners {'to move' if options['dry_run'] else 'moved'}")
+
+    def plan(self, owner_ids, aliases, source=None):
+        """``(owner_id, source, target)`` for every owner, greedily balancing payment counts."""
+        placements = owner_placements()
+        current = {
+            owner_id: source or (placements[owner_id] if placements.get(owner_id) in aliases else shard_for_owner(owner_id))
+            for owner_id in owner_ids
+        }
+        payments = Counter()
+        for alias in set(current.values()):
+            payments.update(dict(
+                RentPayment.objects.using(alias).filter(owner_id__in=owner_ids).order_by().values(
+                    'owner_id',
+                ).annotate(count=Count('id')).values_list('owner_id', 'count')
+            ))
+
+        load = dict.fromkeys(aliases, 0)
+        moves = []
+        groups = owner_groups(owner_ids)
+        for group in sorted(groups, key=lambda group: -sum(payments[owner_id] for owner_id in group)):
+            # least loaded shard; on ties the one already holding most of the group
+            held = Counter(current[owner_id] for owner_id in group)
+            target = min(aliases, key=lambda alias: (load[alias], -held[alias]))
+            load[target] += sum(payments[owner_id] for owner_id in group)
+            moves.extend((owner_id, current[owner_id], target) for owner_id in group)
+        return moves
@@ -0,0 +1,25 @@
+"""
+Recompute the late fees of every overdue unpaid payment (run nightly).
+
+    python manage.py recompute_late_fees
+"""
+from django.core.management.base import BaseCommand
+
+from apartments.latefees import CHUNK_SIZE, recompute_late_fees
+from config.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = "Recompute accrued late fees of overdue payments from the owners' late-fee rules"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        for shard in each_shard():
+            result = recompute_late_fees(chunk_size=options['chunk_size'])
+            where = f" on {shard}" if shard else ""
+            self.stdout.write(
+                f"✓ {result['fees']} fees from {result['payments']} overdue payments "
+                f"in {result['seconds']}s{where}"
+            )
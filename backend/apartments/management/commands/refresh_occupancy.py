@@ -0,0 +1,23 @@
+"""
+Derive every apartment's status (rented / vacant) from its tenant contracts.
+
+Tenant changes refresh their apartment immediately; run this nightly (cron)
+so contracts that start or end on a date are picked up too. Apartments under
+maintenance are left alone.
+
+    python manage.py refresh_occupancy
+"""
+from django.core.management.base import BaseCommand
+
+from apartments.occupancy import refresh_apartment_statuses
+from config.sharding import each_shard
+
+
+class Command(BaseCommand):
+    help = "Set apartment status from the tenant contracts running today"
+
+    def handle(self, *args, **options):
+        for shard in each_shard():
+            changed = refresh_apartment_statuses()
+            where = f" on {shard}" if shard else ""
+            self.stdout.write(f"✓ {changed} apartment statuses updated{where}")
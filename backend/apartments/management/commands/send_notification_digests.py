@@ -0,0 +1,23 @@
+"""
+Roll pending notification events into one digest Notification per user.
+
+Schedule it hourly and daily (cron):
+
+    python manage.py send_notification_digests --delivery hourly
+    python manage.py send_notification_digests --delivery daily
+"""
+from django.core.management.base import BaseCommand
+
+from apartments.notifications import DIGEST_BATCH_SIZE, send_notification_digests
+
+
+class Command(BaseCommand):
+    help = "Send hourly or daily notification digests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delivery', choices=['hourly', 'daily'], required=True)
+        parser.add_argument('--batch-size', type=int, default=DIGEST_BATCH_SIZE, help="Users per batch")
+
+    def handle(self, *args, **options):
+        digests, events = send_notification_digests(options['delivery'], options['batch_size'])
+        self.stdout.write(f"✓ {digests} digests from {events} events")
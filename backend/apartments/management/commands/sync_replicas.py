@@ -0,0 +1,43 @@
+"""
+Copy the primary SQLite database onto every configured read replica.
+
+Replicas are only read from while their copy is at most
+REPLICA_MAX_LAG_SECONDS old, so run this more often than that (e.g. every
+minute from cron); until then reads fall back to the primary.
+
+    SPITIIQ_REPLICA_DBS=replica1.sqlite3 python manage.py sync_replicas
+"""
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from config.db_routers import record_sync, replica_aliases
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database onto the configured read replicas"
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError("No replicas configured (set SPITIIQ_REPLICA_DBS)")
+
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError("sync_replicas only supports SQLite databases")
+        primary.ensure_connection()
+
+        for alias in aliases:
+            # everything committed before this moment is in the copy
+            started = time.time()
+            connections[alias].close()
+            target = sqlite3.connect(str(settings.DATABASES[alias]['NAME']))
+            try:
+                primary.connection.backup(target)
+                record_sync(target, started)
+            finally:
+                target.close()
+            self.stdout.write(f"✓ {alias} synced")
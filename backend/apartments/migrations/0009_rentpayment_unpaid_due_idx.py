@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-19 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0008_tenant_payment_due_day'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rentpayment',
+            index=models.Index(condition=models.Q(('paid', False)), fields=['due_date', 'tenant'], name='rentpayment_unpaid_due_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:02
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+SNAPSHOT_FIELDS = (
+    'tenant_id', 'year', 'month', 'amount', 'due_date',
+    'paid', 'paid_date', 'payment_method', 'receipt_number', 'notes',
+)
+
+
+def backfill_created_events(apps, schema_editor):
+    """Seed the log with the current state of every payment so replays start complete."""
+    RentPayment = apps.get_model('apartments', 'RentPayment')
+    PaymentEvent = apps.get_model('apartments', 'PaymentEvent')
+    rows = RentPayment.objects.order_by('pk').values('pk', 'tenant__apartment__owner_id', *SNAPSHOT_FIELDS)
+    batch = []
+    for row in rows.iterator(chunk_size=1000):
+        batch.append(PaymentEvent(
+            payment_id=row['pk'],
+            owner_id=row['tenant__apartment__owner_id'],
+            event_type='created',
+            data={name: row[name] for name in SNAPSHOT_FIELDS},
+        ))
+        if len(batch) == 1000:
+            PaymentEvent.objects.bulk_create(batch)
+            batch = []
+    PaymentEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    # each batch of the backfill commits on its own instead of holding the write lock throughout
+    atomic = False
+
+    dependencies = [
+        ('apartments', '0011_notification_retention'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.IntegerField()),
+                ('owner_id', models.IntegerField(null=True)),
+                ('event_type', models.CharField(choices=[('created', 'Created'), ('updated', 'Updated'), ('paid', 'Paid'), ('unpaid', 'Unpaid'), ('deleted', 'Deleted')], max_length=20)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['owner_id', 'id'], name='paymentevent_owner_cursor_idx'), models.Index(fields=['payment_id', 'id'], name='paymentevent_payment_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_created_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+CHUNK_SIZE = 5000
+
+
+def _update_in_chunks(queryset, **values):
+    """UPDATE ``queryset`` one primary-key range at a time to keep each write transaction short."""
+    last = queryset.order_by('-pk').values_list('pk', flat=True).first() or 0
+    for start in range(0, last + 1, CHUNK_SIZE):
+        queryset.filter(pk__gte=start, pk__lt=start + CHUNK_SIZE).update(**values)
+
+
+def backfill_owner(apps, schema_editor):
+    Apartment = apps.get_model('apartments', 'Apartment')
+    Tenant = apps.get_model('apartments', 'Tenant')
+    RentPayment = apps.get_model('apartments', 'RentPayment')
+    Document = apps.get_model('apartments', 'Document')
+
+    tenant_owner = Tenant.objects.filter(pk=OuterRef('tenant_id')).values('apartment__owner_id')[:1]
+    apartment_owner = Apartment.objects.filter(pk=OuterRef('apartment_id')).values('owner_id')[:1]
+    _update_in_chunks(RentPayment.objects.all(), owner_id=Subquery(tenant_owner))
+    _update_in_chunks(Document.objects.all(), owner_id=Coalesce(Subquery(apartment_owner), Subquery(tenant_owner)))
+
+
+class Migration(migrations.Migration):
+    # each chunk of the backfill commits on its own instead of holding the write lock throughout
+    atomic = False
+
+    dependencies = [
+        ('apartments', '0013_periodclose'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='rentpayment',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_owner, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['owner', '-uploaded_at'], name='document_owner_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rentpayment',
+            index=models.Index(fields=['owner', '-year', '-month'], name='rentpayment_owner_period_idx'),
+        ),
+    ]
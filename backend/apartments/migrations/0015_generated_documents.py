@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0014_denormalised_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='generated_key',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='document_type',
+            field=models.CharField(choices=[('contract', 'Contract'), ('receipt', 'Receipt'), ('statement', 'Statement'), ('insurance', 'Insurance'), ('other', 'Other')], default='other', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(condition=models.Q(('generated_key', ''), _negated=True), fields=['generated_key'], name='document_generated_key_idx'),
+        ),
+    ]
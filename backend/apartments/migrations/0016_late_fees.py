@@ -0,0 +1,55 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0015_generated_documents'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LateFeeRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flat_fee', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('daily_rate', models.DecimalField(decimal_places=4, default=0, help_text='Ποσοστό (%) του ενοικίου ανά ημέρα καθυστέρησης', max_digits=6)),
+                ('grace_days', models.PositiveIntegerField(default=0)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_percent', models.DecimalField(blank=True, decimal_places=2, help_text='Ανώτατο όριο ως ποσοστό (%) του ενοικίου', max_digits=6, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('apartment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='late_fee_rules', to='apartments.apartment')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='late_fee_rules', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LateFee',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('days_late', models.IntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('computed_at', models.DateField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('payment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='late_fee', to='apartments.rentpayment')),
+                ('rule', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='apartments.latefeerule')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='latefeerule',
+            constraint=models.UniqueConstraint(fields=('owner', 'apartment'), name='latefeerule_owner_apartment_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='latefeerule',
+            constraint=models.UniqueConstraint(condition=models.Q(('apartment__isnull', True)), fields=('owner',), name='latefeerule_owner_default_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='latefee',
+            index=models.Index(fields=['owner'], name='latefee_owner_idx'),
+        ),
+    ]
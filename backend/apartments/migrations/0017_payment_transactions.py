@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0016_late_fees'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('paid_date', models.DateField()),
+                ('payment_method', models.CharField(blank=True, choices=[('cash', 'Μετρητά'), ('bank_transfer', 'Τραπεζική Μεταφορά'), ('check', 'Επιταγή'), ('card', 'Κάρτα'), ('other', 'Άλλο')], max_length=20, null=True)),
+                ('receipt_number', models.CharField(blank=True, max_length=100)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transactions', to='apartments.rentpayment')),
+            ],
+            options={
+                'ordering': ['paid_date', 'id'],
+                'indexes': [models.Index(fields=['payment', 'paid_date'], name='paymenttx_payment_idx'), models.Index(fields=['owner', 'paid_date'], name='paymenttx_owner_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0017_payment_transactions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['apartment', 'contract_start', 'contract_end'], name='tenant_contract_interval_idx'),
+        ),
+    ]
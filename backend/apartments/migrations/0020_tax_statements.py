@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:47
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apartments', '0019_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxStatement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.IntegerField()),
+                ('year', models.IntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('owner_id', 'year'), name='taxstatement_owner_year_uniq')],
+            },
+        ),
+    ]
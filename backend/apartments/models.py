@@ -1,5 +1,7 @@
 from django.conf import settings
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
@@ -37,6 +39,13 @@ class Apartment(models.Model):
     lng = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # an owner change has to be copied to the denormalised owner of payments/documents
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        return instance
+
     def save(self, *args, **kwargs):
         # keep is_rented in sync with status for compatibility
         self.is_rented = self.status == "rented"
@@ -59,9 +68,40 @@ class Tenant(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # contract intervals per apartment: overlap checks and occupancy lookups
+            models.Index(fields=['apartment', 'contract_start', 'contract_end'], name='tenant_contract_interval_idx'),
+        ]
+
     def __str__(self):
         return f"{self.full_name} - {self.apartment.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_apartment_id = instance.__dict__.get('apartment_id')
+        return instance
+
+
+class RentPaymentQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        bulk_create that fills the denormalised owner and appends a 'created'
+        PaymentEvent per row in the same transaction.
+        """
+        objs = list(objs)
+        missing = {obj.tenant_id for obj in objs if obj.owner_id is None}
+        if missing:
+            owners = dict(Tenant.objects.using(self.db).filter(pk__in=missing).values_list('pk', 'apartment__owner_id'))
+            for obj in objs:
+                if obj.owner_id is None:
+                    obj.owner_id = owners.get(obj.tenant_id)
+        with transaction.atomic(using=self.db, savepoint=False):
+            created = super().bulk_create(objs, *args, **kwargs)
+            PaymentEvent.objects.using(self.db).bulk_create(PaymentEvent.for_payments(created, 'created'))
+        return created
+
 
 class RentPayment(models.Model):
     PAYMENT_METHODS = (
@@ -73,6 +113,8 @@ class RentPayment(models.Model):
     )
 
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name="payments")
+    # denormalised tenant.apartment.owner so owner scoping is a single-table filter
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, editable=False, related_name="+")
     month = models.IntegerField()
     year = models.IntegerField()
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -84,13 +126,40 @@ class RentPayment(models.Model):
     notes = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RentPaymentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-year', '-month']
         unique_together = ['tenant', 'month', 'year']
+        indexes = [
+            # arrears/overdue scans only ever look at unpaid rows
+            models.Index(fields=['due_date', 'tenant'], condition=models.Q(paid=False), name='rentpayment_unpaid_due_idx'),
+            models.Index(fields=['owner', '-year', '-month'], name='rentpayment_owner_period_idx'),
+        ]
 
     def __str__(self):
         return f"{self.tenant.full_name} - {self.year}/{self.month} - {'Paid' if self.paid else 'Unpaid'}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets the event log tell paid/unpaid transitions from other edits
+        instance._loaded_paid = instance.__dict__.get('paid')
+        instance._loaded_tenant_id = instance.__dict__.get('tenant_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.owner_id is None or self.tenant_id != getattr(self, '_loaded_tenant_id', self.tenant_id):
+            if RentPayment.tenant.is_cached(self) and Tenant.apartment.is_cached(self.tenant):
+                self.owner_id = self.tenant.apartment.owner_id
+            else:
+                self.owner_id = Tenant.objects.filter(pk=self.tenant_id).values_list('apartment__owner_id', flat=True).first()
+            self._loaded_tenant_id = self.tenant_id
+        # the PaymentEvent written by the post_save receiver commits or rolls back with the row
+        using = kwargs.get('using') or router.db_for_write(RentPayment, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
     @property
     def is_overdue(self):
         if self.paid:
@@ -98,28 +167,98 @@ class RentPayment(models.Model):
         return timezone.now().date() > self.due_date
 
 
+class PaymentEvent(models.Model):
+    """
+    Append-only log of RentPayment state changes. ``data`` is the full payment
+    state after the change, so replaying events up to an id rebuilds any past
+    state; the id doubles as the cursor of the /api/changes/ feed.
+    """
+    EVENT_TYPES = (
+        ("created", "Created"),
+        ("updated", "Updated"),
+        ("paid", "Paid"),
+        ("unpaid", "Unpaid"),
+        ("deleted", "Deleted"),
+    )
+    SNAPSHOT_FIELDS = (
+        'tenant_id', 'year', 'month', 'amount', 'due_date',
+        'paid', 'paid_date', 'payment_method', 'receipt_number', 'notes',
+    )
+
+    # plain ids rather than foreign keys: events outlive the rows they describe
+    payment_id = models.IntegerField()
+    owner_id = models.IntegerField(null=True)
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['owner_id', 'id'], name='paymentevent_owner_cursor_idx'),
+            models.Index(fields=['payment_id', 'id'], name='paymentevent_payment_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.event_type} payment {self.payment_id}"
+
+    @classmethod
+    def snapshot(cls, payment):
+        return {name: getattr(payment, name) for name in cls.SNAPSHOT_FIELDS}
+
+    @classmethod
+    def for_payments(cls, payments, event_type):
+        """Unsaved events for ``payments``."""
+        return [
+            cls(
+                payment_id=payment.pk,
+                owner_id=payment.owner_id,
+                event_type=event_type,
+                data=cls.snapshot(payment),
+            )
+            for payment in payments
+        ]
+
+
 class Document(models.Model):
     DOC_TYPES = (
         ("contract", "Contract"),
         ("receipt", "Receipt"),
+        ("statement", "Statement"),
         ("insurance", "Insurance"),
         ("other", "Other"),
     )
 
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name="documents", null=True, blank=True)
     apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name="documents", null=True, blank=True)
+    # denormalised owner of the apartment (or of the tenant's apartment) for single-table scoping
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, editable=False, related_name="+")
     document_type = models.CharField(max_length=20, choices=DOC_TYPES, default="other")
     title = models.CharField(max_length=200)
     file = models.FileField(upload_to="documents/%Y/%m/")
     description = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # set on server-generated receipts/statements (apartments.receipts): what the file is for and its content hash
+    generated_key = models.CharField(max_length=100, blank=True, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['owner', '-uploaded_at'], name='document_owner_uploaded_idx'),
+            models.Index(fields=['generated_key'], condition=~models.Q(generated_key=''), name='document_generated_key_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.get_document_type_display()}"
 
+    def save(self, *args, **kwargs):
+        if self.apartment_id is not None:
+            self.owner_id = Apartment.objects.filter(pk=self.apartment_id).values_list('owner_id', flat=True).first()
+        elif self.tenant_id is not None:
+            self.owner_id = Tenant.objects.filter(pk=self.tenant_id).values_list('apartment__owner_id', flat=True).first()
+        super().save(*args, **kwargs)
+
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
@@ -140,6 +279,213 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notification_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.title}"
+
+
+class NotificationEvent(models.Model):
+    """Notification held back for the hourly/daily digest of a user who does not get them immediately"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notification_events")
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['user', 'id']
+
+    def __str__(self):
+        return f"{self.user.username} - {self.title}"
+
+
+
+class ArchivedNotification(models.Model):
+    """Read notification moved out of the hot table by the retention job"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="archived_notifications")
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPES)
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archived_notif_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.title}"
+
+
+class PeriodClose(models.Model):
+    """
+    Frozen month-end totals of one owner's payments. ``totals`` holds the
+    by-method and by-apartment breakdown; ``amended`` is set when a payment
+    of the period is changed after closing.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="period_closes")
+    year = models.IntegerField()
+    month = models.IntegerField()
+    expected = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    collected = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    outstanding = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    payments = models.IntegerField(default=0)
+    totals = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    amended = models.BooleanField(default=False)
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    closed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-year', '-month']
+        unique_together = ['owner', 'year', 'month']
+
+    def __str__(self):
+        return f"{self.owner.username} - {self.year}/{self.month}"
+
+
+class LateFeeRule(models.Model):
+    """
+    How late fees accrue on an owner's overdue payments: ``flat_fee`` once
+    ``grace_days`` have passed, plus ``daily_rate`` percent of the outstanding
+    balance per day after that, capped by ``max_amount`` and ``max_percent``
+    of that balance.
+    A rule with an apartment overrides the owner-wide rule (apartment empty).
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="late_fee_rules")
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, null=True, blank=True, related_name="late_fee_rules")
+    flat_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    daily_rate = models.DecimalField(max_digits=6, decimal_places=4, default=0, help_text="Ποσοστό (%) του ενοικίου ανά ημέρα καθυστέρησης")
+    grace_days = models.PositiveIntegerField(default=0)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_percent = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, help_text="Ανώτατο όριο ως ποσοστό (%) του ενοικίου")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'apartment'], name='latefeerule_owner_apartment_uniq'),
+            models.UniqueConstraint(fields=['owner'], condition=models.Q(apartment__isnull=True), name='latefeerule_owner_default_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} - {self.apartment_id or 'default'}"
+
+
+class LateFee(models.Model):
+    """Fee accrued so far on an overdue payment; recomputed nightly until the payment is paid."""
+    payment = models.OneToOneField(RentPayment, on_delete=models.CASCADE, related_name="late_fee")
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    rule = models.ForeignKey(LateFeeRule, on_delete=models.SET_NULL, null=True, related_name="+")
+    days_late = models.IntegerField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    computed_at = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner'], name='latefee_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.payment_id} - {self.amount}"
+
+
+class PaymentTransaction(models.Model):
+    """
+    Money received towards a RentPayment; a payment can be settled by several
+    partial transactions. apartments.ledger keeps ``RentPayment.paid`` in step
+    with them and computes balances in SQL.
+    """
+    payment = models.ForeignKey(RentPayment, on_delete=models.CASCADE, related_name="transactions")
+    # denormalised payment.owner, like RentPayment.owner
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, editable=False, related_name="+")
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    paid_date = models.DateField()
+    payment_method = models.CharField(max_length=20, choices=RentPayment.PAYMENT_METHODS, null=True, blank=True)
+    receipt_number = models.CharField(max_length=100, blank=True)
+    notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['paid_date', 'id']
+        indexes = [
+            models.Index(fields=['payment', 'paid_date'], name='paymenttx_payment_idx'),
+            models.Index(fields=['owner', 'paid_date'], name='paymenttx_owner_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.payment_id} - {self.amount} ({self.paid_date})"
+
+    def save(self, *args, **kwargs):
+        if self.owner_id is None:
+            self.owner_id = RentPayment.objects.filter(pk=self.payment_id).values_list('owner_id', flat=True).first()
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def collected(cls):
+        """
+        SQL expression, on RentPayment, of the amount collected: the full
+        amount once the payment is paid, else the sum of its transactions.
+        """
+        received = cls.objects.filter(payment=models.OuterRef('pk')).order_by().values('payment').annotate(
+            total=models.Sum('amount'),
+        ).values('total')
+        return models.Case(
+            models.When(paid=True, then=models.F('amount')),
+            default=Coalesce(models.Subquery(received), models.Value(0), output_field=models.DecimalField()),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+
+
+class IdempotencyKey(models.Model):
+    """
+    Outcome of a request sent with an ``Idempotency-Key`` header (see
+    apartments.idempotency): a retry with the same key gets the stored
+    response instead of repeating the side effects. ``status_code`` is empty
+    while the first request is still running.
+    """
+    # plain user id: with sharding the users table may be in another database
+    user_id = models.IntegerField()
+    key = models.CharField(max_length=64)
+    request_hash = models.CharField(max_length=32)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'key'], name='idempotencykey_user_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotencykey_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} - {self.key}"
+
+
+class TaxStatement(models.Model):
+    """
+    Stored E2 statement of one owner and year (see apartments.tax), valid
+    while the owner's analytics ``version`` is unchanged. A table rather than
+    the cache, so statements precomputed by a management command reach every
+    worker process.
+    """
+    # plain owner id: with sharding the users table may be in another database
+    owner_id = models.IntegerField()
+    year = models.IntegerField()
+    version = models.PositiveIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner_id', 'year'], name='taxstatement_owner_year_uniq'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.title}"
\ No newline at end of file
+        return f"{self.owner_id} - {self.year}"
@@ -0,0 +1,149 @@
+"""
+Notification delivery: fan-out to an owner's accountants, digests and retention.
+
+Every owner event is delivered to the owner and to each accountant linked
+through AccountantOwner. Users with ``notification_delivery == 'immediate'``
+get a Notification right away; the others get a NotificationEvent that the
+hourly/daily digest job rolls up into a single Notification per user.
+Read notifications older than settings.NOTIFICATION_RETENTION_DAYS are moved
+to ArchivedNotification so the hot table stays small.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import AccountantOwner
+from .models import Notification, NotificationEvent, ArchivedNotification
+
+DIGEST_BATCH_SIZE = 500
+
+
+def notify_owners(events):
+    """
+    Deliver ``(owner_id, notification_type, title, message)`` events to the
+    owners and their accountants with two lookups and two bulk inserts,
+    however many events there are. Returns the number of rows written.
+    """
+    events = list(events)
+    owner_ids = {owner_id for owner_id, *_ in events}
+    if not owner_ids:
+        return 0
+
+    recipients = defaultdict(set)
+    for owner_id in owner_ids:
+        recipients[owner_id].add(owner_id)
+    for owner_id, accountant_id in AccountantOwner.objects.filter(owner_id__in=owner_ids).values_list(
+        'owner_id', 'accountant_id'
+    ):
+        recipients[owner_id].add(accountant_id)
+
+    user_ids = set().union(*recipients.values())
+    delivery = dict(
+        get_user_model().objects.filter(id__in=user_ids, is_active=True).values_list('id', 'notification_delivery')
+    )
+
+    notifications, held = [], []
+    for owner_id, notification_type, title, message in events:
+        for user_id in sorted(recipients[owner_id]):
+            if user_id not in delivery:
+                continue
+            model, rows = (Notification, notifications) if delivery[user_id] == 'immediate' else (NotificationEvent, held)
+            rows.append(model(user_id=user_id, notification_type=notification_type, title=title, message=message))
+
+    Notification.objects.bulk_create(notifications, batch_size=DIGEST_BATCH_SIZE)
+    NotificationEvent.objects.bulk_create(held, batch_size=DIGEST_BATCH_SIZE)
+    return len(notifications) + len(held)
+
+
+def notify_owner(owner_id, notification_type, title, message):
+    return notify_owners([(owner_id, notification_type, title, message)])
+
+
+def _digest(user_id, events):
+    types = {notification_type for _, notification_type, _, _ in events}
+    return Notification(
+        user_id=user_id,
+        notification_type=types.pop() if len(types) == 1 else 'other',
+        title=f"Σύνοψη ειδοποιήσεων ({len(events)})",
+        message="\n".join(f"• {title}: {message}" for _, _, title, message in events),
+    )
+
+
+def send_notification_digests(delivery, batch_size=DIGEST_BATCH_SIZE):
+    """
+    Roll the pending events of every ``delivery`` user (plus users who have
+    since switched to immediate) into one Notification each, ``batch_size``
+    users at a time. Events queued while the job runs wait for the next run.
+    Returns ``(digests, events)``.
+    """
+    last_id = NotificationEvent.objects.order_by('-id').values_list('id', flat=True).first()
+    if last_id is None:
+        return 0, 0
+
+    user_ids = list(
+        NotificationEvent.objects.filter(
+            id__lte=last_id, user__notification_delivery__in=[delivery, 'immediate'],
+        ).order_by('user_id').values_list('user_id', flat=True).distinct()
+    )
+    digests = events = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        pending = NotificationEvent.objects.filter(user_id__in=batch, id__lte=last_id)
+        rows = pending.order_by('user_id', 'id').values_list('user_id', 'notification_type', 'title', 'message')
+        notifications = [_digest(user_id, list(group)) for user_id, group in groupby(rows, key=lambda row: row[0])]
+        with transaction.atomic():
+            Notification.objects.bulk_create(notifications)
+            events += pending.delete()[0]
+        digests += len(notifications)
+    return digests, events
+
+
+def _retention_querysets(now):
+    """``(notification_type, queryset)`` of read notifications past retention, per configured type."""
+    retention = dict(settings.NOTIFICATION_RETENTION_DAYS)
+    default_days = retention.pop('default', None)
+    read = Notification.objects.filter(is_read=True)
+    for notification_type, days in retention.items():
+        if days is not None:
+            yield notification_type, read.filter(
+                notification_type=notification_type, created_at__lt=now - timedelta(days=days),
+            )
+    if default_days is not None:
+        yield 'default', read.exclude(notification_type__in=retention).filter(
+            created_at__lt=now - timedelta(days=default_days),
+        )
+
+
+def archive_notifications(chunk_size=None, now=None):
+    """
+    Move expired read notifications to ArchivedNotification and delete them,
+    ``chunk_size`` rows per transaction so each chunk holds the SQLite write
+    lock only briefly. Returns the number of rows archived per type.
+    """
+    chunk_size = chunk_size or settings.NOTIFICATION_PRUNE_CHUNK_SIZE
+    now = now or timezone.now()
+    archived = {}
+    for notification_type, expired in _retention_querysets(now):
+        count = 0
+        while True:
+            rows = list(expired.order_by('id').values_list(
+                'id', 'user_id', 'notification_type', 'title', 'message', 'created_at',
+            )[:chunk_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                ArchivedNotification.objects.bulk_create([
+                    ArchivedNotification(
+                        user_id=user_id, notification_type=kind, title=title, message=message, created_at=created_at,
+                    )
+                    for _, user_id, kind, title, message, created_at in rows
+                ])
+                Notification.objects.filter(id__in=[row[0] for row in rows]).delete()
+            count += len(rows)
+        archived[notification_type] = count
+    return archived
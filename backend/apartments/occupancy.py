@@ -0,0 +1,185 @@
+"""
+Occupancy from tenant contracts.
+
+``ContractIndex`` holds the contracts of a set of apartments as per-apartment
+arrays sorted by contract_start together with the running maximum of
+contract_end, so "is it occupied on day X / during a range" and "who lives
+there" are a bisect per apartment, and a timeline walks only the contracts
+that intersect the range. Open-ended contracts run to ``date.max``.
+
+Contracts of one apartment may not overlap (a handover on the same day is
+allowed); ``refresh_apartment_statuses`` derives ``Apartment.status`` from
+the contracts running today, leaving apartments under maintenance alone.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .analytics import invalidate_owner_analytics
+from .models import Apartment, Tenant
+
+ONE_DAY = timedelta(days=1)
+
+
+def overlapping_contracts(apartment_id, start, end=None, exclude=None):
+    """Tenants of the apartment whose contract overlaps ``start``..``end`` (None: open-ended)."""
+    tenants = Tenant.objects.filter(apartment_id=apartment_id).filter(
+        Q(contract_end__isnull=True) | Q(contract_end__gt=start),
+    )
+    if end is not None:
+        tenants = tenants.filter(contract_start__lt=end)
+    if exclude is not None:
+        tenants = tenants.exclude(pk=exclude)
+    return tenants
+
+
+def running_contracts(day):
+    """Tenants whose contract covers ``day``."""
+    return Tenant.objects.filter(Q(contract_end__isnull=True) | Q(contract_end__gte=day), contract_start__lte=day)
+
+
+def contracts_between(apartments, start=None, end=None):
+    """Tenants of ``apartments`` whose contract meets ``start``..``end`` (inclusive; None: unbounded)."""
+    contracts = Tenant.objects.filter(apartment__in=apartments)
+    if start is not None:
+        contracts = contracts.filter(Q(contract_end__isnull=True) | Q(contract_end__gte=start))
+    if end is not None:
+        contracts = contracts.filter(contract_start__lte=end)
+    return contracts
+
+
+class ContractIndex:
+    """Per-apartment contract intervals for bisect lookups (see the module docstring)."""
+
+    def __init__(self, contracts):
+        """``contracts``: ``(apartment_id, tenant_id, start, end)`` ordered by apartment and start."""
+        self.starts, self.ends, self.tenants, self.reach, self.reach_tenants = {}, {}, {}, {}, {}
+        for apartment_id, tenant_id, start, end in contracts:
+            end = end or date.max
+            starts = self.starts.setdefault(apartment_id, [])
+            reach = self.reach.setdefault(apartment_id, [])
+            reach_tenants = self.reach_tenants.setdefault(apartment_id, [])
+            starts.append(start)
+            self.ends.setdefault(apartment_id, []).append(end)
+            self.tenants.setdefault(apartment_id, []).append(tenant_id)
+            if reach and reach[-1] >= end:
+                reach.append(reach[-1])
+                reach_tenants.append(reach_tenants[-1])
+            else:
+                reach.append(end)
+                reach_tenants.append(tenant_id)
+
+    @classmethod
+    def load(cls, apartments, start=None, end=None):
+        """Index the contracts of ``apartments`` (a queryset or ids), optionally only those meeting ``start``..``end``."""
+        return cls(contracts_between(apartments, start, end).order_by('apartment_id', 'contract_start', 'id').values_list(
+            'apartment_id', 'id', 'contract_start', 'contract_end',
+        ))
+
+    def occupant(self, apartment_id, day):
+        """Tenant id whose contract covers ``day`` (the latest started one), or None."""
+        starts = self.starts.get(apartment_id, [])
+        index = bisect_right(starts, day) - 1
+        if index < 0 or self.reach[apartment_id][index] < day:
+            return None
+        ends = self.ends[apartment_id]
+        while ends[index] < day:
+            index -= 1
+        return self.tenants[apartment_id][index]
+
+    def is_occupied(self, apartment_id, start, end=None):
+        """Whether any contract covers a day of ``start``..``end`` (inclusive; None: just ``start``)."""
+        index = bisect_right(self.starts.get(apartment_id, []), end or start) - 1
+        return index >= 0 and self.reach[apartment_id][index] >= start
+
+    def vacant(self, apartment_ids, start, end=None):
+        """The apartments of ``apartment_ids`` with no contract during ``start``..``end``."""
+        return [apartment_id for apartment_id in apartment_ids if not self.is_occupied(apartment_id, start, end)]
+
+    def timeline(self, apartment_id, start, end):
+        """
+        ``start``..``end`` split into ``{'start', 'end', 'tenant_id'}`` segments,
+        ``tenant_id`` None while vacant.
+        """
+        starts = self.starts.get(apartment_id, [])
+        segments = []
+        cursor = start
+        # reach never decreases, so the first contract that can still be running is found by bisection
+        index = bisect_left(self.reach.get(apartment_id, []), start)
+        while index < len(starts) and starts[index] <= end and cursor <= end:
+            contract_start, contract_end = starts[index], self.ends[apartment_id][index]
+            if contract_end >= cursor:
+                if contract_start > cursor:
+                    segments.append({'start': cursor, 'end': contract_start - ONE_DAY, 'tenant_id': None})
+                    cursor = contract_start
+                last = min(contract_end, end)
+                segments.append({'start': cursor, 'end': last, 'tenant_id': self.tenants[apartment_id][index]})
+                cursor = last + ONE_DAY if last < date.max else last
+            index += 1
+        if cursor <= end:
+            segments.append({'start': cursor, 'end': end, 'tenant_id': None})
+        return segments
+
+    def overlaps(self, apartment_id):
+        """``(tenant_id, tenant_id)`` pairs of contracts that overlap by more than a handover day."""
+        starts = self.starts.get(apartment_id, [])
+        reach, reach_tenants = self.reach.get(apartment_id, []), self.reach_tenants.get(apartment_id, [])
+        return [
+            (reach_tenants[index - 1], self.tenants[apartment_id][index])
+            for index in range(1, len(starts))
+            if starts[index] < reach[index - 1]
+        ]
+
+
+def refresh_apartment_statuses(apartments=None, today=None):
+    """
+    Set ``status`` (and ``is_rented``) of ``apartments`` (default all) from the
+    contracts running today, with one UPDATE per direction; apartments under
+    maintenance keep their status. Returns the number of apartments changed.
+    """
+    today = today or timezone.now().date()
+    apartments = Apartment.objects.all() if apartments is None else apartments
+    candidates = apartments.exclude(status='maintenance').annotate(
+        occupied=Exists(running_contracts(today).filter(apartment_id=OuterRef('pk'))),
+    )
+    to_rented = candidates.filter(occupied=True).exclude(status='rented')
+    to_vacant = candidates.filter(occupied=False).exclude(status='vacant')
+    owner_ids = set(to_rented.values_list('owner_id', flat=True)) | set(to_vacant.values_list('owner_id', flat=True))
+    changed = to_rented.update(status='rented', is_rented=True) + to_vacant.update(status='vacant', is_rented=False)
+    if owner_ids:
+        invalidate_owner_analytics(*owner_ids)
+    return changed
+
+
+def vacancy_calendar(apartments, start, end):
+    """
+    Occupancy timeline of every apartment in ``apartments`` over
+    ``start``..``end`` with vacant days, occupancy rate and overlapping
+    contracts, plus the apartments vacant for the whole range.
+    """
+    index = ContractIndex.load(apartments, start, end)
+    names = dict(contracts_between(apartments, start, end).values_list('id', 'full_name'))
+    days = (end - start).days + 1
+    rows = []
+    for apartment_id, title, status in apartments.order_by('id').values_list('id', 'title', 'status'):
+        timeline = index.timeline(apartment_id, start, end)
+        vacant_days = sum((segment['end'] - segment['start']).days + 1 for segment in timeline if segment['tenant_id'] is None)
+        for segment in timeline:
+            segment['tenant_name'] = names.get(segment['tenant_id'])
+        rows.append({
+            'apartment_id': apartment_id,
+            'title': title,
+            'status': status,
+            'vacant_days': vacant_days,
+            'occupancy_rate': round(100 * (days - vacant_days) / days, 1),
+            'timeline': timeline,
+            'overlaps': index.overlaps(apartment_id),
+        })
+    return {
+        'from': start,
+        'to': end,
+        'apartments': rows,
+        'vacant_throughout': [row['apartment_id'] for row in rows if row['vacant_days'] == days],
+    }
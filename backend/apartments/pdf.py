@@ -0,0 +1,77 @@
+"""
+PDF rendering for generated receipts and statements.
+
+Free of Django imports so the bulk generator's worker processes can render
+without setting Django up. Needs reportlab; Greek text needs a TrueType font
+(settings.PDF_FONT_PATH, e.g. DejaVuSans), otherwise Helvetica is used.
+"""
+import os
+from io import BytesIO
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:  # pragma: no cover - optional dependency
+    canvas = None
+
+FONT_NAME = 'DocumentFont'
+
+
+def available():
+    return canvas is not None
+
+
+def _font(font_path):
+    if not font_path or not os.path.exists(font_path):
+        return 'Helvetica'
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+    return FONT_NAME
+
+
+def render_pdf(content, font_path=None):
+    """
+    Render ``content`` to PDF bytes: a ``title``, ``lines`` of (label, value)
+    pairs and an optional ``table`` of ``columns`` and ``rows`` (all strings).
+    """
+    font = _font(font_path)
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    pdf.setTitle(content['title'])
+    width, height = A4
+    left, y = 20 * mm, height - 25 * mm
+
+    def new_page_if_needed(y):
+        if y > 20 * mm:
+            return y
+        pdf.showPage()
+        return height - 20 * mm
+
+    pdf.setFont(font, 15)
+    pdf.drawString(left, y, content['title'])
+    y -= 12 * mm
+
+    pdf.setFont(font, 10)
+    for label, value in content['lines']:
+        pdf.drawString(left, y, f'{label}:')
+        pdf.drawString(left + 50 * mm, y, value)
+        y = new_page_if_needed(y - 6 * mm)
+
+    table = content.get('table')
+    if table:
+        y -= 6 * mm
+        column_width = (width - 2 * left) / len(table['columns'])
+        for index, row in enumerate([table['columns'], *table['rows']]):
+            pdf.setFont(font, 9 if index else 9.5)
+            for column, value in enumerate(row):
+                pdf.drawString(left + column * column_width, y, value)
+            if index == 0:
+                pdf.line(left, y - 1.5 * mm, width - left, y - 1.5 * mm)
+            y = new_page_if_needed(y - 5.5 * mm)
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
@@ -0,0 +1,184 @@
+"""
+Month-end period close.
+
+Closing (owner, year, month) freezes that month's payment totals into a
+PeriodClose row. Reports read closed months from those rows and aggregate
+RentPayment only for months that are still open, so history costs one row
+per closed month. Edits to payments of a closed month are rejected by the
+API when settings.PERIOD_CLOSE_EDIT_POLICY is 'block'; any change that does
+reach the database marks the snapshot ``amended``.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import RentPayment, PeriodClose, PaymentTransaction
+
+
+class PeriodCloseError(Exception):
+    pass
+
+
+def _month_index(year, month):
+    return year * 12 + month - 1
+
+
+def _collected(payments):
+    """
+    ``payments`` with ``received`` (PaymentTransaction.collected(), so partial
+    payments count) and ``method``: the payment's method, or that of its
+    latest transaction while it is only partly paid.
+    """
+    latest_method = PaymentTransaction.objects.filter(payment=OuterRef('pk')).order_by(
+        '-paid_date', '-id',
+    ).values('payment_method')[:1]
+    return payments.alias(received=PaymentTransaction.collected()).annotate(
+        method=Coalesce('payment_method', Subquery(latest_method)),
+    )
+
+
+def is_period_closed(owner_id, year, month):
+    return PeriodClose.objects.filter(owner_id=owner_id, year=year, month=month).exists()
+
+
+def close_period(owner_id, year, month, closed_by_id=None):
+    """Freeze (owner, year, month) totals; the month must have ended and not be closed yet."""
+    today = timezone.now().date()
+    if not 1 <= month <= 12:
+        raise PeriodCloseError("Μη έγκυρος μήνας")
+    if _month_index(year, month) >= _month_index(today.year, today.month):
+        raise PeriodCloseError("Μόνο μήνες που έχουν λήξει μπορούν να κλείσουν")
+
+    rows = _collected(RentPayment.objects.filter(
+        owner_id=owner_id, year=year, month=month,
+    )).order_by().values('tenant__apartment_id', 'tenant__apartment__title', 'method').annotate(
+        expected=Sum('amount'),
+        collected=Sum('received'),
+        payments=Count('id'),
+    )
+
+    by_method = defaultdict(Decimal)
+    by_apartment = {}
+    expected = collected = Decimal(0)
+    payments = 0
+    for row in rows:
+        row_expected, row_collected = row['expected'] or 0, row['collected'] or 0
+        expected += row_expected
+        collected += row_collected
+        payments += row['payments']
+        if row_collected:
+            by_method[row['method'] or 'unknown'] += row_collected
+        apartment = by_apartment.setdefault(row['tenant__apartment_id'], {
+            'apartment_id': row['tenant__apartment_id'],
+            'apartment_title': row['tenant__apartment__title'],
+            'expected': Decimal(0),
+            'collected': Decimal(0),
+        })
+        apartment['expected'] += row_expected
+        apartment['collected'] += row_collected
+
+    for apartment in by_apartment.values():
+        apartment['outstanding'] = apartment['expected'] - apartment['collected']
+
+    try:
+        with transaction.atomic(using=router.db_for_write(PeriodClose)):
+            return PeriodClose.objects.create(
+                owner_id=owner_id,
+                year=year,
+                month=month,
+                expected=expected,
+                collected=collected,
+                outstanding=expected - collected,
+                payments=payments,
+                totals={'by_method': dict(by_method), 'by_apartment': list(by_apartment.values())},
+                closed_by_id=closed_by_id,
+            )
+    except IntegrityError:
+        raise PeriodCloseError("Η περίοδος έχει ήδη κλείσει")
+
+
+def flag_amended(owner_id, year, month, using=None):
+    """Mark a closed period as changed after closing; returns whether it was closed."""
+    return PeriodClose.objects.db_manager(using).filter(owner_id=owner_id, year=year, month=month).update(amended=True) > 0
+
+
+def period_report(owner_ids, start, end):
+    """
+    Monthly expected / collected / outstanding and collected-by-method for
+    ``start..end`` ((year, month) tuples, inclusive). Closed months come from
+    their snapshots; only months after each owner's first open month in the
+    range are aggregated from RentPayment.
+    """
+    first, last = _month_index(*start), _month_index(*end)
+    closes = PeriodClose.objects.annotate(month_index=F('year') * 12 + F('month') - 1).filter(
+        month_index__gte=first, month_index__lte=last,
+    )
+    if owner_ids is not None:
+        closes = closes.filter(owner_id__in=owner_ids)
+
+    months = defaultdict(lambda: {'expected': Decimal(0), 'collected': Decimal(0), 'closed': 0, 'amended': 0})
+    by_method = defaultdict(Decimal)
+    closed = defaultdict(set)
+    for close in closes.only('owner_id', 'year', 'month', 'expected', 'collected', 'totals', 'amended'):
+        index = _month_index(close.year, close.month)
+        closed[close.owner_id].add(index)
+        bucket = months[index]
+        bucket['expected'] += close.expected
+        bucket['collected'] += close.collected
+        bucket['closed'] += 1
+        bucket['amended'] += close.amended
+        for method, amount in close.totals.get('by_method', {}).items():
+            by_method[method] += Decimal(amount)
+
+    # live rows only from each owner's first open month; owners without closes scan the whole range.
+    # Owners are grouped by that month, so the filter has one term per month rather than per owner.
+    first_open = defaultdict(list)
+    for owner_id, indexes in closed.items():
+        first_open[next(index for index in range(first, last + 2) if index not in indexes)].append(owner_id)
+    live_scope = Q()
+    if closed:
+        live_scope = ~Q(owner_id__in=list(closed))
+        for index, ids in first_open.items():
+            live_scope |= Q(owner_id__in=ids, month_index__gte=index)
+    payments = RentPayment.objects.annotate(month_index=F('year') * 12 + F('month') - 1).filter(
+        live_scope, month_index__gte=first, month_index__lte=last,
+    )
+    if owner_ids is not None:
+        payments = payments.filter(owner_id__in=owner_ids)
+    rows = _collected(payments).order_by().values('owner_id', 'month_index', 'method').annotate(
+        expected=Sum('amount'),
+        collected=Sum('received'),
+    )
+    for row in rows:
+        if row['month_index'] in closed.get(row['owner_id'], ()):
+            continue
+        bucket = months[row['month_index']]
+        bucket['expected'] += row['expected'] or 0
+        bucket['collected'] += row['collected'] or 0
+        if row['collected']:
+            by_method[row['method'] or 'unknown'] += row['collected']
+
+    periods = []
+    for index in range(first, last + 1):
+        bucket = months[index]
+        year, month = divmod(index, 12)
+        periods.append({
+            'period': f'{year}-{month + 1:02d}',
+            'expected': bucket['expected'],
+            'collected': bucket['collected'],
+            'outstanding': bucket['expected'] - bucket['collected'],
+            'closed_owners': bucket['closed'],
+            'amended_owners': bucket['amended'],
+        })
+    return {
+        'periods': periods,
+        'totals': {
+            name: sum((period[name] for period in periods), Decimal(0))
+            for name in ('expected', 'collected', 'outstanding')
+        },
+        'by_method': dict(by_method),
+    }
@@ -0,0 +1,257 @@
+"""
+Server-side PDF receipts and yearly tenant statements.
+
+Every paid RentPayment gets a receipt and every tenant a statement per year,
+stored as Document rows (``receipt`` / ``statement``) identified by
+``generated_key``. ``content_hash`` is the SHA-256 of the data a document was
+rendered from, so a run only renders the documents whose data changed and
+regenerating unchanged ones costs a single lookup. Bulk runs render in a
+process pool (apartments.pdf has no Django dependencies).
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+from django.utils import timezone
+
+from . import pdf
+from .models import Document, PaymentTransaction, RentPayment
+
+# bump when the layout changes so every document is rendered again
+RENDER_VERSION = 1
+BATCH_SIZE = 500
+POOL_THRESHOLD = 20
+
+PAYMENT_FIELDS = (
+    'id', 'owner_id', 'tenant_id', 'tenant__full_name', 'tenant__apartment_id', 'tenant__apartment__title',
+    'tenant__apartment__address', 'year', 'month', 'amount', 'paid', 'paid_date', 'payment_method', 'receipt_number',
+)
+
+
+class ReceiptError(Exception):
+    pass
+
+
+def _money(amount):
+    return f"{amount:.2f} €"
+
+
+def _method(code):
+    return dict(RentPayment.PAYMENT_METHODS).get(code, code or "-")
+
+
+def _owner_names(owner_ids):
+    # users may live in another database than the payments (sharding)
+    return {
+        user_id: f"{first} {last}".strip() or username
+        for user_id, first, last, username in get_user_model().objects.filter(id__in=owner_ids).values_list(
+            'id', 'first_name', 'last_name', 'username',
+        )
+    }
+
+
+def receipt_content(row, owner_name):
+    return {
+        'title': f"Απόδειξη είσπραξης ενοικίου {row['month']:02d}/{row['year']}",
+        'lines': [
+            ("Αριθμός απόδειξης", row['receipt_number'] or f"R-{row['id']}"),
+            ("Ιδιοκτήτης", owner_name),
+            ("Μισθωτής", row['tenant__full_name']),
+            ("Ακίνητο", f"{row['tenant__apartment__title']}, {row['tenant__apartment__address']}"),
+            ("Περίοδος", f"{row['month']:02d}/{row['year']}"),
+            ("Ποσό", _money(row['amount'])),
+            ("Ημερομηνία πληρωμής", row['paid_date'].strftime('%d/%m/%Y') if row['paid_date'] else "-"),
+            ("Τρόπος πληρωμής", _method(row['payment_method'])),
+        ],
+    }
+
+
+def statement_content(rows, year, owner_name):
+    """Statement of one tenant's ``rows`` (payment values, oldest first) for ``year``."""
+    first = rows[0]
+    total = sum(row['amount'] for row in rows)
+    paid = sum(row['collected'] for row in rows)
+    return {
+        'title': f"Ετήσια κατάσταση ενοικίων {year}",
+        'lines': [
+            ("Ιδιοκτήτης", owner_name),
+            ("Μισθωτής", first['tenant__full_name']),
+            ("Ακίνητο", f"{first['tenant__apartment__title']}, {first['tenant__apartment__address']}"),
+            ("Σύνολο", _money(total)),
+            ("Εισπράχθηκε", _money(paid)),
+            ("Υπόλοιπο", _money(total - paid)),
+        ],
+        'table': {
+            'columns': ["Περίοδος", "Ποσό", "Εισπράχθηκε", "Κατάσταση", "Πληρωμή", "Τρόπος", "Απόδειξη"],
+            'rows': [
+                [
+                    f"{row['month']:02d}/{row['year']}",
+                    _money(row['amount']),
+                    _money(row['collected']),
+                    "Εξοφλήθη" if row['paid'] else "Μερική" if row['collected'] else "Εκκρεμεί",
+                    row['paid_date'].strftime('%d/%m/%Y') if row['paid_date'] else "-",
+                    _method(row['payment_method']) if row['paid'] else "-",
+                    row['receipt_number'] or "-",
+                ]
+                for row in rows
+            ],
+        },
+    }
+
+
+def content_hash(content):
+    payload = json.dumps([RENDER_VERSION, content], sort_keys=True, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _receipt_items(payments):
+    rows = list(payments.filter(paid=True).order_by('id').values(*PAYMENT_FIELDS))
+    owners = _owner_names({row['owner_id'] for row in rows})
+    for row in rows:
+        yield {
+            'key': f"receipt:{row['id']}",
+            'document_type': 'receipt',
+            'title': f"Απόδειξη {row['month']:02d}/{row['year']} - {row['tenant__full_name']}",
+            'filename': f"receipt-{row['id']}.pdf",
+            'tenant_id': row['tenant_id'],
+            'apartment_id': row['tenant__apartment_id'],
+            'owner_id': row['owner_id'],
+            'content': receipt_content(row, owners.get(row['owner_id'], "")),
+        }
+
+
+def _statement_items(payments, year):
+    rows = list(payments.filter(year=year).annotate(collected=PaymentTransaction.collected()).order_by(
+        'tenant_id', 'month',
+    ).values(*PAYMENT_FIELDS, 'collected'))
+    owners = _owner_names({row['owner_id'] for row in rows})
+    by_tenant = {}
+    for row in rows:
+        by_tenant.setdefault(row['tenant_id'], []).append(row)
+    for tenant_id, tenant_rows in by_tenant.items():
+        first = tenant_rows[0]
+        yield {
+            'key': f"statement:{tenant_id}:{year}",
+            'document_type': 'statement',
+            'title': f"Κατάσταση {year} - {first['tenant__full_name']}",
+            'filename': f"statement-{tenant_id}-{year}.pdf",
+            'tenant_id': tenant_id,
+            'apartment_id': first['tenant__apartment_id'],
+            'owner_id': first['owner_id'],
+            'content': statement_content(tenant_rows, year, owners.get(first['owner_id'], "")),
+        }
+
+
+def _render(contents, pool=None, workers=1):
+    render = partial(pdf.render_pdf, font_path=settings.PDF_FONT_PATH)
+    if pool is None or len(contents) < POOL_THRESHOLD:
+        return [render(content) for content in contents]
+    return list(pool.map(render, contents, chunksize=max(1, len(contents) // (workers * 4))))
+
+
+def _store(items, pool=None, workers=1):
+    """
+    Render and save the items whose content hash differs from their stored
+    Document; returns ``{key: Document}`` plus the number rendered.
+    """
+    documents = Document.objects.db_manager(router.db_for_write(Document))
+    for item in items:
+        item['hash'] = content_hash(item['content'])
+    existing = {
+        document.generated_key: document
+        for document in documents.filter(generated_key__in=[item['key'] for item in items])
+    }
+    stale = [item for item in items if item['key'] not in existing or existing[item['key']].content_hash != item['hash']]
+    if not stale:
+        return existing, 0
+
+    created, updated, replaced = [], [], []
+    for item, data in zip(stale, _render([item['content'] for item in stale], pool, workers)):
+        document = existing.get(item['key'])
+        if document is None:
+            document = Document(
+                tenant_id=item['tenant_id'],
+                apartment_id=item['apartment_id'],
+                owner_id=item['owner_id'],
+                document_type=item['document_type'],
+                generated_key=item['key'],
+            )
+            created.append(document)
+        else:
+            replaced.append(document.file.name)
+            updated.append(document)
+        document.title = item['title']
+        document.content_hash = item['hash']
+        document.file.save(item['filename'], ContentFile(data), save=False)
+        existing[item['key']] = document
+
+    with transaction.atomic(using=documents.db):
+        documents.bulk_create(created)
+        documents.bulk_update(updated, ['title', 'file', 'content_hash'])
+    for name in replaced:
+        Document.file.field.storage.delete(name)
+    return existing, len(stale)
+
+
+def _generate(items, workers=None):
+    if not pdf.available():
+        raise ReceiptError("Η δημιουργία PDF απαιτεί το reportlab")
+    workers = workers or settings.PDF_RENDER_WORKERS or os.cpu_count() or 1
+    items = list(items)
+    rendered = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(items) >= POOL_THRESHOLD else None
+    try:
+        for start in range(0, len(items), BATCH_SIZE):
+            rendered += _store(items[start:start + BATCH_SIZE], pool, workers)[1]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return {'rendered': rendered, 'unchanged': len(items) - rendered}
+
+
+def _scoped_payments(owner_ids):
+    payments = RentPayment.objects.all()
+    if owner_ids is not None:
+        payments = payments.filter(owner_id__in=owner_ids)
+    return payments
+
+
+def generate_receipts(owner_ids, year, month=None, workers=None):
+    """Receipts for every paid payment of ``year`` (and ``month``); returns rendered/unchanged counts."""
+    payments = _scoped_payments(owner_ids).filter(year=year)
+    if month is not None:
+        payments = payments.filter(month=month)
+    return _generate(_receipt_items(payments), workers)
+
+
+def generate_statements(owner_ids, year, workers=None):
+    """One statement per tenant with payments in ``year``; returns rendered/unchanged counts."""
+    return _generate(_statement_items(_scoped_payments(owner_ids), year), workers)
+
+
+def receipt_document(payment_id):
+    """The receipt Document of a paid payment, rendered now if missing or outdated."""
+    if not pdf.available():
+        raise ReceiptError("Η δημιουργία PDF απαιτεί το reportlab")
+    items = list(_receipt_items(RentPayment.objects.filter(pk=payment_id)))
+    if not items:
+        raise ReceiptError("Η απόδειξη εκδίδεται μόνο για εξοφλημένες πληρωμές")
+    return _store(items)[0][items[0]['key']]
+
+
+def statement_document(tenant_id, year=None):
+    """The ``year`` statement Document of a tenant, rendered now if missing or outdated."""
+    if not pdf.available():
+        raise ReceiptError("Η δημιουργία PDF απαιτεί το reportlab")
+    year = year or timezone.now().year
+    items = list(_statement_items(RentPayment.objects.filter(tenant_id=tenant_id), year))
+    if not items:
+        raise ReceiptError(f"Δεν υπάρχουν πληρωμές για το {year}")
+    return _store(items)[0][items[0]['key']]
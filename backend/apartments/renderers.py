@@ -0,0 +1,63 @@
+"""
+Columnar renderers for bulk list endpoints.
+
+Lists rendered with these return ``{"columns": [...], "rows": [[...]]}`` so
+keys are sent once instead of once per row.
+"""
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional format
+    msgpack = None
+
+
+def _encode_default(obj):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+class ColumnarRenderer(BaseRenderer):
+    """Marker base class; views check for it to build rows from ``values_list``."""
+    charset = None
+
+
+class ColumnarJSONRenderer(ColumnarRenderer):
+    media_type = 'application/x-columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is not None:
+            return orjson.dumps(data, default=_encode_default)
+        return json.dumps(
+            data, default=_encode_default, ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8')
+
+
+class ColumnarMsgPackRenderer(ColumnarRenderer):
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_encode_default, use_bin_type=True)
+
+
+COLUMNAR_RENDERER_CLASSES = [ColumnarJSONRenderer]
+if msgpack is not None:
+    COLUMNAR_RENDERER_CLASSES.append(ColumnarMsgPackRenderer)
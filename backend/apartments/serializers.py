@@ -1,16 +1,124 @@
 # apartments/serializers.py
+from django.core.files.storage import default_storage
+from django.db.models import BooleanField, Case, CharField, F, Q, Value, When
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Apartment, Tenant, RentPayment, Document, Notification
+from rest_framework.permissions import SAFE_METHODS
+from .models import (
+    Apartment, Tenant, RentPayment, Document, Notification, ArchivedNotification, PaymentEvent, PeriodClose, LateFeeRule,
+    PaymentTransaction,
+)
+from .occupancy import overlapping_contracts
 
 
-class ApartmentSerializer(serializers.ModelSerializer):
+def _split_param(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def selected_field_names(request, names):
+    """Filter ``names`` by the ``?fields=`` and ``?omit=`` query params."""
+    if request is None:
+        return list(names)
+    wanted = _split_param(request.query_params.get('fields'))
+    omitted = _split_param(request.query_params.get('omit'))
+    return [name for name in names if (not wanted or name in wanted) and name not in omitted]
+
+
+class SparseFieldsetsMixin:
+    """
+    Serializer mixin that honours ``?fields=`` and ``?omit=``. Writes still
+    validate every field; only their response is trimmed.
+    """
+
+    def _is_write(self):
+        request = self.context.get('request')
+        return request is not None and request.method not in SAFE_METHODS
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self._is_write():
+            return fields
+        keep = selected_field_names(self.context.get('request'), fields)
+        return {name: fields[name] for name in keep}
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if not self._is_write():
+            return data
+        keep = selected_field_names(self.context['request'], data)
+        return {name: data[name] for name in keep}
+
+
+class LeanListSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
+    """
+    Read-only list serializer fed by ``values()`` rows instead of model instances.
+    Related lookups are flattened into SQL expressions via ``get_expressions``.
+    """
+
+    @classmethod
+    def get_expressions(cls):
+        return {}
+
+    @classmethod
+    def values_queryset(cls, queryset, names):
+        expressions = cls.get_expressions()
+        columns = [name for name in names if name not in expressions]
+        annotations = {name: expressions[name] for name in names if name in expressions}
+        return queryset.values(*columns, **annotations)
+
+    @classmethod
+    def values_list_queryset(cls, queryset, names):
+        expressions = cls.get_expressions()
+        annotations = {name: expressions[name] for name in names if name in expressions}
+        return queryset.annotate(**annotations).values_list(*names)
+
+
+class StoredFileField(serializers.FileField):
+    """FileField that also renders the bare storage name coming from ``values()``."""
+
+    def to_representation(self, value):
+        if isinstance(value, str):
+            if not value:
+                return None
+            url = default_storage.url(value)
+            request = self.context.get('request')
+            return request.build_absolute_uri(url) if request is not None else url
+        return super().to_representation(value)
+
+
+def _choice_display(field, choices):
+    return Case(
+        *[When(**{field: key}, then=Value(label)) for key, label in choices],
+        default=Value(None),
+        output_field=CharField(),
+    )
+
+
+class ApartmentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Apartment
         fields = '__all__'
         read_only_fields = ['owner']
 
 
-class TenantSerializer(serializers.ModelSerializer):
+class ApartmentListSerializer(LeanListSerializer):
+    owner = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Apartment
+        fields = [
+            'id', 'owner', 'title', 'address', 'square_meters', 'property_type', 'is_rented',
+            'status', 'floor', 'year_built', 'area', 'city', 'region', 'lat', 'lng', 'created_at',
+        ]
+        read_only_fields = fields
+
+
+def validate_contract_dates(start, end):
+    if end is not None and start is not None and end < start:
+        raise serializers.ValidationError({'contract_end': ["Η λήξη της σύμβασης είναι πριν την έναρξη"]})
+
+
+class TenantSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     apartment_address = serializers.CharField(source='apartment.address', read_only=True)
     apartment_title = serializers.CharField(source='apartment.title', read_only=True)
 
@@ -18,8 +126,56 @@ class TenantSerializer(serializers.ModelSerializer):
         model = Tenant
         fields = '__all__'
 
+    def validate(self, attrs):
+        instance = self.instance
+        apartment = attrs.get('apartment', instance.apartment if instance else None)
+        start = attrs.get('contract_start', instance.contract_start if instance else None)
+        end = attrs['contract_end'] if 'contract_end' in attrs else (instance.contract_end if instance else None)
+        validate_contract_dates(start, end)
+        conflict = overlapping_contracts(apartment.pk, start, end, exclude=instance.pk if instance else None).first()
+        if conflict is not None:
+            until = conflict.contract_end.strftime('%d/%m/%Y') if conflict.contract_end else "αόριστη διάρκεια"
+            raise serializers.ValidationError({'contract_start': [
+                f"Η σύμβαση επικαλύπτεται με τη σύμβαση του/της {conflict.full_name} "
+                f"({conflict.contract_start.strftime('%d/%m/%Y')} - {until})"
+            ]})
+        return attrs
+
+
+class TenantListSerializer(LeanListSerializer):
+    apartment = serializers.IntegerField(read_only=True)
+    apartment_address = serializers.CharField(read_only=True)
+    apartment_title = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = Tenant
+        fields = [
+            'id', 'apartment', 'apartment_address', 'apartment_title', 'full_name', 'phone', 'email',
+            'contract_start', 'contract_end', 'monthly_rent', 'payment_due_day', 'deposit', 'created_at',
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def get_expressions(cls):
+        return {
+            'apartment_address': F('apartment__address'),
+            'apartment_title': F('apartment__title'),
+        }
+
+
+class TenantImportSerializer(serializers.ModelSerializer):
+    """Validates the tenant columns of an import row; the apartment is created alongside it."""
+
+    class Meta:
+        model = Tenant
+        exclude = ['apartment']
+
+    def validate(self, attrs):
+        validate_contract_dates(attrs.get('contract_start'), attrs.get('contract_end'))
+        return attrs
 
-class RentPaymentSerializer(serializers.ModelSerializer):
+
+class RentPaymentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     tenant_name = serializers.CharField(source='tenant.full_name', read_only=True)
     apartment_title = serializers.CharField(source='tenant.apartment.title', read_only=True)
     apartment_address = serializers.CharField(source='tenant.apartment.address', read_only=True)
@@ -31,7 +187,40 @@ class RentPaymentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class DocumentSerializer(serializers.ModelSerializer):
+class RentPaymentListSerializer(LeanListSerializer):
+    tenant = serializers.IntegerField(read_only=True)
+    tenant_name = serializers.CharField(read_only=True)
+    apartment_title = serializers.CharField(read_only=True)
+    apartment_address = serializers.CharField(read_only=True)
+    is_overdue = serializers.BooleanField(read_only=True)
+    payment_method_display = serializers.CharField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = RentPayment
+        fields = [
+            'id', 'tenant', 'tenant_name', 'apartment_title', 'apartment_address', 'is_overdue',
+            'payment_method_display', 'month', 'year', 'amount', 'due_date', 'paid', 'paid_date',
+            'payment_method', 'receipt_number', 'notes', 'created_at',
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def get_expressions(cls):
+        today = timezone.now().date()
+        return {
+            'tenant_name': F('tenant__full_name'),
+            'apartment_title': F('tenant__apartment__title'),
+            'apartment_address': F('tenant__apartment__address'),
+            'is_overdue': Case(
+                When(Q(paid=False) & Q(due_date__lt=today), then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            'payment_method_display': _choice_display('payment_method', RentPayment.PAYMENT_METHODS),
+        }
+
+
+class DocumentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     tenant_name = serializers.CharField(source='tenant.full_name', read_only=True, allow_null=True)
     apartment_title = serializers.CharField(source='apartment.title', read_only=True, allow_null=True)
 
@@ -40,8 +229,92 @@ class DocumentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class DocumentListSerializer(LeanListSerializer):
+    tenant = serializers.IntegerField(read_only=True, allow_null=True)
+    apartment = serializers.IntegerField(read_only=True, allow_null=True)
+    tenant_name = serializers.CharField(read_only=True, allow_null=True)
+    apartment_title = serializers.CharField(read_only=True, allow_null=True)
+    file = StoredFileField(read_only=True)
+
+    class Meta:
+        model = Document
+        fields = [
+            'id', 'tenant', 'apartment', 'tenant_name', 'apartment_title', 'document_type',
+            'title', 'file', 'description', 'uploaded_at',
+        ]
+        read_only_fields = fields
+
+    @classmethod
+    def get_expressions(cls):
+        return {
+            'tenant_name': F('tenant__full_name'),
+            'apartment_title': F('apartment__title'),
+        }
+
+
+class NotificationSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = '__all__'
         read_only_fields = ['user', 'created_at']
+
+
+class NotificationListSerializer(LeanListSerializer):
+    user = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'user', 'notification_type', 'title', 'message', 'is_read', 'created_at']
+        read_only_fields = fields
+
+
+class ArchivedNotificationListSerializer(LeanListSerializer):
+    user = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ArchivedNotification
+        fields = ['id', 'user', 'notification_type', 'title', 'message', 'created_at', 'archived_at']
+        read_only_fields = fields
+
+
+class PaymentEventListSerializer(LeanListSerializer):
+    class Meta:
+        model = PaymentEvent
+        fields = ['id', 'payment_id', 'owner_id', 'event_type', 'data', 'created_at']
+        read_only_fields = fields
+
+
+class PeriodCloseSerializer(serializers.ModelSerializer):
+    owner_username = serializers.CharField(source='owner.username', read_only=True)
+
+    class Meta:
+        model = PeriodClose
+        fields = '__all__'
+        read_only_fields = [
+            'owner', 'expected', 'collected', 'outstanding', 'payments', 'totals', 'amended', 'closed_by', 'closed_at',
+        ]
+
+
+class LateFeeRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LateFeeRule
+        fields = '__all__'
+        read_only_fields = ['owner', 'created_at']
+
+
+class PaymentTransactionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentTransaction
+        fields = '__all__'
+        read_only_fields = ['owner', 'created_at']
+        extra_kwargs = {'paid_date': {'required': False}}
+
+
+class RentIndexationSerializer(serializers.Serializer):
+    """Input of a rent indexation: a fixed ``percent`` or a ``table`` of percent per anniversary month."""
+    effective_date = serializers.DateField()
+    percent = serializers.DecimalField(max_digits=5, decimal_places=2, required=False)
+    table = serializers.DictField(child=serializers.DecimalField(max_digits=5, decimal_places=2), required=False)
+    apartments = serializers.ListField(child=serializers.IntegerField(), required=False)
+    tenants = serializers.ListField(child=serializers.IntegerField(), required=False)
+    dry_run = serializers.BooleanField(default=False)
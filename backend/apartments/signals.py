@@ -0,0 +1,153 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from config.sharding import prepare_shard, shard_aliases
+from .analytics import invalidate_owner_analytics
+from .models import Apartment, Tenant, RentPayment, Document, PaymentEvent, LateFee, PaymentTransaction
+from .occupancy import refresh_apartment_statuses
+from .periods import flag_amended
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Apply settings.SQLITE_PRAGMAS (WAL, busy timeout, cache sizes) to new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if connection.alias in shard_aliases():
+            # owners/users live in the default database, out of reach of SQLite foreign keys
+            cursor.execute('PRAGMA foreign_keys = OFF')
+
+
+@receiver(post_migrate)
+def prepare_migrated_shard(sender, using, **kwargs):
+    if sender.label == 'apartments' and using in shard_aliases():
+        prepare_shard(using)
+
+
+def owner_id_for(instance):
+    """Owner of an Apartment, Tenant or RentPayment without loading the whole chain."""
+    using = instance._state.db
+    if isinstance(instance, Apartment):
+        return instance.owner_id
+    if isinstance(instance, Tenant):
+        if Tenant.apartment.is_cached(instance):
+            return instance.apartment.owner_id
+        return Apartment.objects.db_manager(using).filter(pk=instance.apartment_id).values_list('owner_id', flat=True).first()
+    if instance.owner_id is not None:
+        return instance.owner_id
+    if RentPayment.tenant.is_cached(instance):
+        return owner_id_for(instance.tenant)
+    return Tenant.objects.db_manager(using).filter(pk=instance.tenant_id).values_list('apartment__owner_id', flat=True).first()
+
+
+@receiver(post_save, sender=Apartment)
+def propagate_apartment_owner(sender, instance, created, raw=False, using=None, **kwargs):
+    """Copy a changed apartment owner onto the denormalised owner of its payments, fees, transactions and documents."""
+    previous = getattr(instance, '_loaded_owner_id', instance.owner_id)
+    instance._loaded_owner_id = instance.owner_id
+    if raw or created or previous == instance.owner_id:
+        return
+    RentPayment.objects.using(using).filter(tenant__apartment=instance).update(owner_id=instance.owner_id)
+    LateFee.objects.using(using).filter(payment__tenant__apartment=instance).update(owner_id=instance.owner_id)
+    PaymentTransaction.objects.using(using).filter(payment__tenant__apartment=instance).update(owner_id=instance.owner_id)
+    Document.objects.using(using).filter(
+        Q(apartment=instance) | Q(apartment__isnull=True, tenant__apartment=instance)
+    ).update(owner_id=instance.owner_id)
+    if previous is not None:
+        invalidate_owner_analytics(previous, using=using)
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def refresh_occupancy(sender, instance, raw=False, using=None, **kwargs):
+    """Re-derive the status of the tenant's apartment (and the one it moved from) from the contracts."""
+    # connected before propagate_tenant_apartment, which resets _loaded_apartment_id
+    if raw:
+        return
+    apartment_ids = {instance.apartment_id, getattr(instance, '_loaded_apartment_id', instance.apartment_id)}
+    refresh_apartment_statuses(Apartment.objects.using(using).filter(pk__in=apartment_ids))
+
+
+@receiver(post_save, sender=Tenant)
+def propagate_tenant_apartment(sender, instance, created, raw=False, using=None, **kwargs):
+    """Re-own a moved tenant's payments and tenant-only documents."""
+    previous = getattr(instance, '_loaded_apartment_id', instance.apartment_id)
+    instance._loaded_apartment_id = instance.apartment_id
+    if raw or created or previous == instance.apartment_id:
+        return
+    owner_id = owner_id_for(instance)
+    RentPayment.objects.using(using).filter(tenant=instance).update(owner_id=owner_id)
+    LateFee.objects.using(using).filter(payment__tenant=instance).update(owner_id=owner_id)
+    PaymentTransaction.objects.using(using).filter(payment__tenant=instance).update(owner_id=owner_id)
+    Document.objects.using(using).filter(tenant=instance, apartment__isnull=True).update(owner_id=owner_id)
+    previous_owner = Apartment.objects.using(using).filter(pk=previous).values_list('owner_id', flat=True).first()
+    if previous_owner is not None:
+        invalidate_owner_analytics(previous_owner, using=using)
+
+
+@receiver(post_save, sender=Apartment)
+@receiver(post_save, sender=Tenant)
+@receiver(post_save, sender=RentPayment)
+@receiver(post_save, sender=PaymentTransaction)
+@receiver(post_delete, sender=Apartment)
+@receiver(post_delete, sender=Tenant)
+@receiver(post_delete, sender=RentPayment)
+@receiver(post_delete, sender=PaymentTransaction)
+def invalidate_analytics(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    owner_id = owner_id_for(instance)
+    if owner_id is not None:
+        invalidate_owner_analytics(owner_id, using=using)
+
+
+
+def _append_payment_event(payment, event_type):
+    owner_id = owner_id_for(payment)
+    PaymentEvent.objects.db_manager(payment._state.db).create(
+        payment_id=payment.pk,
+        owner_id=owner_id,
+        event_type=event_type,
+        data=PaymentEvent.snapshot(payment),
+    )
+    if owner_id is not None:
+        flag_amended(owner_id, payment.year, payment.month, using=payment._state.db)
+
+
+@receiver(post_save, sender=RentPayment)
+def log_payment_save(sender, instance, created, raw=False, **kwargs):
+    """Append the payment's new state to PaymentEvent inside the saving transaction."""
+    if raw:
+        return
+    if created:
+        event_type = 'created'
+    elif instance.paid != getattr(instance, '_loaded_paid', instance.paid):
+        event_type = 'paid' if instance.paid else 'unpaid'
+    else:
+        event_type = 'updated'
+    instance._loaded_paid = instance.paid
+    _append_payment_event(instance, event_type)
+
+
+@receiver(post_delete, sender=RentPayment)
+def log_payment_delete(sender, instance, **kwargs):
+    _append_payment_event(instance, 'deleted')
+
+
+@receiver(post_save, sender=PaymentTransaction)
+@receiver(post_delete, sender=PaymentTransaction)
+def flag_transaction_period(sender, instance, raw=False, **kwargs):
+    """Partial payments count as collected, so they amend a closed month too."""
+    if raw:
+        return
+    payment = RentPayment.objects.db_manager(instance._state.db).filter(pk=instance.payment_id).values(
+        'year', 'month',
+    ).first()
+    if payment is not None:
+        flag_amended(instance.owner_id, payment['year'], payment['month'], using=instance._state.db)
@@ -0,0 +1,159 @@
+"""
+Annual rental-income statement per owner (the figures of form E2).
+
+For a tax year every apartment lists the rent collected for that year's
+rental periods, its address and square metres, and each tenant's period
+within the year taken from the contract. All owners of a batch come from a
+single grouped RentPayment query. Statements are stored per owner and year
+in TaxStatement together with the owner's analytics version, so any change
+to the owner's apartments, tenants or payments invalidates them in every
+process; ``precompute_tax_statements`` fills the table for every owner in
+batches. A stored statement is also recomputed once it is older than
+MAX_AGE, which is shorter than the interval of the nightly jobs.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .analytics import owner_versions
+from .models import RentPayment, PaymentTransaction, TaxStatement
+
+MAX_AGE = timedelta(hours=20)
+BATCH_SIZE = 200
+
+E2_COLUMNS = [
+    'owner_id', 'owner_username', 'apartment_id', 'title', 'address', 'city', 'square_meters',
+    'tenant_id', 'tenant_name', 'period_start', 'period_end', 'monthly_rent', 'months_paid', 'expected', 'collected',
+]
+
+
+def _period(start, end, year):
+    """The part of a contract running from ``start`` to ``end`` (None: open-ended) that falls in ``year``."""
+    first, last = date(year, 1, 1), date(year, 12, 31)
+    return max(start, first), min(end, last) if end else last
+
+
+def compute_e2_statements(owner_ids, year):
+    """``{owner_id: statement}`` for ``owner_ids`` from one grouped query."""
+    rows = RentPayment.objects.filter(owner_id__in=owner_ids, year=year).alias(
+        received=PaymentTransaction.collected(),
+    ).order_by(
+        'owner_id', 'tenant__apartment_id', 'tenant__contract_start', 'tenant_id',
+    ).values(
+        'owner_id', 'tenant__apartment_id', 'tenant__apartment__title', 'tenant__apartment__address',
+        'tenant__apartment__city', 'tenant__apartment__square_meters', 'tenant_id', 'tenant__full_name',
+        'tenant__contract_start', 'tenant__contract_end', 'tenant__monthly_rent',
+    ).annotate(
+        expected=Sum('amount'),
+        collected=Sum('received'),
+        months_paid=Count('id', filter=Q(paid=True)),
+    )
+    # usernames separately: with sharding the users table is in another database
+    usernames = dict(get_user_model().objects.filter(id__in=owner_ids).values_list('id', 'username'))
+
+    statements = {
+        owner_id: {
+            'owner_id': owner_id,
+            'owner_username': usernames.get(owner_id),
+            'year': year,
+            'apartments': [],
+            'totals': {'expected': Decimal(0), 'collected': Decimal(0), 'outstanding': Decimal(0)},
+        }
+        for owner_id in owner_ids
+    }
+    apartments = {}
+    for row in rows:
+        statement = statements[row['owner_id']]
+        apartment = apartments.get(row['tenant__apartment_id'])
+        if apartment is None:
+            apartment = apartments[row['tenant__apartment_id']] = {
+                'apartment_id': row['tenant__apartment_id'],
+                'title': row['tenant__apartment__title'],
+                'address': row['tenant__apartment__address'],
+                'city': row['tenant__apartment__city'],
+                'square_meters': row['tenant__apartment__square_meters'],
+                'expected': Decimal(0),
+                'collected': Decimal(0),
+                'tenants': [],
+            }
+            statement['apartments'].append(apartment)
+        period_start, period_end = _period(row['tenant__contract_start'], row['tenant__contract_end'], year)
+        collected = row['collected'] or Decimal(0)
+        apartment['tenants'].append({
+            'tenant_id': row['tenant_id'],
+            'full_name': row['tenant__full_name'],
+            'period_start': period_start,
+            'period_end': period_end,
+            'monthly_rent': row['tenant__monthly_rent'],
+            'months_paid': row['months_paid'],
+            'expected': row['expected'],
+            'collected': collected,
+        })
+        apartment['expected'] += row['expected']
+        apartment['collected'] += collected
+        statement['totals']['expected'] += row['expected']
+        statement['totals']['collected'] += collected
+
+    for statement in statements.values():
+        totals = statement['totals']
+        totals['outstanding'] = totals['expected'] - totals['collected']
+        for apartment in statement['apartments']:
+            apartment['outstanding'] = apartment['expected'] - apartment['collected']
+    return statements
+
+
+def precompute_e2_statements(owner_ids, year):
+    """Compute and store the statements of ``owner_ids``; returns them."""
+    versions = owner_versions(owner_ids)
+    statements = compute_e2_statements(list(versions), year)
+    now = timezone.now()
+    TaxStatement.objects.bulk_create(
+        [
+            TaxStatement(owner_id=owner_id, year=year, version=versions[owner_id], data=statement, computed_at=now)
+            for owner_id, statement in statements.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['owner_id', 'year'],
+        update_fields=['version', 'data', 'computed_at'],
+    )
+    return statements
+
+
+def e2_statements(owner_ids, year):
+    """Stored statements of ``owner_ids`` (in that order); missing or outdated ones are computed together."""
+    versions = owner_versions(owner_ids)
+    stored = TaxStatement.objects.filter(
+        owner_id__in=list(versions), year=year, computed_at__gte=timezone.now() - MAX_AGE,
+    ).values_list('owner_id', 'version', 'data')
+    statements = {owner_id: data for owner_id, version, data in stored if version == versions[owner_id]}
+    missing = [owner_id for owner_id in versions if owner_id not in statements]
+    for start in range(0, len(missing), BATCH_SIZE):
+        statements.update(precompute_e2_statements(missing[start:start + BATCH_SIZE], year))
+    return [statements[owner_id] for owner_id in owner_ids]
+
+
+def e2_rows(statements):
+    """Flat per-tenant rows of ``statements`` for CSV export (E2_COLUMNS)."""
+    for statement in statements:
+        for apartment in statement['apartments']:
+            for tenant in apartment['tenants']:
+                yield {
+                    'owner_id': statement['owner_id'],
+                    'owner_username': statement['owner_username'],
+                    'apartment_id': apartment['apartment_id'],
+                    'title': apartment['title'],
+                    'address': apartment['address'],
+                    'city': apartment['city'],
+                    'square_meters': apartment['square_meters'],
+                    'tenant_id': tenant['tenant_id'],
+                    'tenant_name': tenant['full_name'],
+                    'period_start': tenant['period_start'],
+                    'period_end': tenant['period_end'],
+                    'monthly_rent': tenant['monthly_rent'],
+                    'months_paid': tenant['months_paid'],
+                    'expected': tenant['expected'],
+                    'collected': tenant['collected'],
+                }
@@ -1,3 +1,1159 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from config import db_routers, sharding
+from config.sharding import move_owner
+from config.throttles import _locked, consume
+from users.models import AccountantOwner, User
+from . import pdf
+from .analytics import AGING_BUCKETS, arrears_aging, owner_versions, portfolio_analytics
+from .forecast import cash_flow_forecast
+from .latefees import compute_fee, recompute_late_fees
+from .ledger import mark_payment_paid, record_transaction
+from .models import (
+    Apartment, ArchivedNotification, Document, Notification, PaymentEvent, PaymentTransaction, PeriodClose, RentPayment,
+    LateFee, LateFeeRule, TaxStatement, Tenant,
+)
+from .notifications import archive_notifications
+from .occupancy import ContractIndex
+from .periods import period_report
+from .receipts import generate_statements
+from .renderers import msgpack
+from .tax import MAX_AGE, compute_e2_statements, e2_statements
+from .utils import (
+    create_contract_notifications, create_overdue_payment_notifications, extend_rent_schedules,
+)
+
+
+class ReplicaDatabasesMixin:
+    """
+    Two SQLite replica files registered as ``replica_test1``/``replica_test2``
+    and kept in sync with the test database by ``sync_replicas``; every test
+    starts with empty, never synced replicas.
+    """
+    replica_aliases = ['replica_test1', 'replica_test2']
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        replicas = {
+            alias: {**connections.settings['default'], 'NAME': os.path.join(directory, f'{alias}.sqlite3')}
+            for alias in cls.replica_aliases
+        }
+        for patcher in (mock.patch.dict(settings.DATABASES, replicas), mock.patch.dict(connections.settings, replicas)):
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+        routing = override_settings(DATABASE_REPLICAS=cls.replica_aliases)
+        routing.enable()
+        cls.addClassCleanup(routing.disable)
+        cls.addClassCleanup(cls.close_replicas)
+        # added here rather than as a class attribute: the test runner would
+        # try to create test databases for them before they are registered
+        cls.databases = {'default', *cls.replica_aliases}
+        super().setUpClass()
+
+    @classmethod
+    def close_replicas(cls):
+        for alias in cls.replica_aliases:
+            connections[alias].close()
+            del connections[alias]
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for alias in self.replica_aliases:
+            connections[alias].close()
+            if os.path.exists(settings.DATABASES[alias]['NAME']):
+                os.remove(settings.DATABASES[alias]['NAME'])
+
+    def sync_replicas(self):
+        call_command('sync_replicas', stdout=open(os.devnull, 'w'))
+
+    def replica_for(self, user_id):
+        """Replica a read by ``user_id`` would go to, or None for the primary."""
+        token = db_routers.route_reads_to_replica(user_id)
+        if token is None:
+            return None
+        alias = token.var.get()
+        db_routers.reset_read_routing(token)
+        return alias
+
+    def age_replicas(self, seconds):
+        """Pretend the last sync happened ``seconds`` ago."""
+        for alias in self.replica_aliases:
+            connections[alias].close()
+            target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+            try:
+                db_routers.record_sync(target, time.time() - seconds)
+            finally:
+                target.close()
+
+
+class ReplicaRoutingTests(ReplicaDatabasesMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.other = User.objects.create_user('other', password='x', role='owner')
+        Apartment.objects.create(owner=self.owner, title='A1', address='Odos 1', square_meters=50)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def count(self):
+        response = self.client.get('/api/apartments/')
+        self.assertEqual(response.status_code, 200)
+        return response.data['count']
+
+    def test_reads_use_a_synced_replica(self):
+        self.sync_replicas()
+        # written after the sync by someone else: the replicas do not have it yet
+        Apartment.objects.create(owner=self.owner, title='A2', address='Odos 2', square_meters=60)
+        self.assertEqual(self.count(), 1)
+        self.sync_replicas()
+        self.assertEqual(self.count(), 2)
+
+    def test_writer_reads_the_primary_until_a_replica_catches_up(self):
+        self.sync_replicas()
+        response = self.client.post('/api/apartments/', {'title': 'A2', 'address': 'Odos 2', 'square_meters': 60})
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(self.replica_for(self.owner.pk))
+        self.assertEqual(self.count(), 2)
+        # a user without recent writes is served from a (stale) replica
+        self.assertIn(self.replica_for(self.other.pk), self.replica_aliases)
+
+        self.sync_replicas()
+        self.assertIn(self.replica_for(self.owner.pk), self.replica_aliases)
+        self.assertEqual(self.count(), 2)
+
+    def test_replicas_older_than_the_max_lag_are_skipped(self):
+        self.sync_replicas()
+        Apartment.objects.create(owner=self.owner, title='A2', address='Odos 2', square_meters=60)
+        self.age_replicas(settings.REPLICA_MAX_LAG_SECONDS + 1)
+        self.assertIsNone(self.replica_for(self.owner.pk))
+        self.assertEqual(self.count(), 2)
+
+    def test_never_synced_replicas_are_skipped(self):
+        self.assertIsNone(self.replica_for(self.owner.pk))
+        self.assertEqual(self.count(), 1)
+
+
+def token_client(username, password='x'):
+    """APIClient authenticated with a JWT access token, like the frontend."""
+    client = APIClient()
+    response = client.post('/api/token/', {'username': username, 'password': password}, format='json')
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    return client
+
+
+def create_payment(owner, title='A1', amount=Decimal('450.00')):
+    apartment = Apartment.objects.create(owner=owner, title=title, address='Odos 1', square_meters=50)
+    tenant = Tenant.objects.create(
+        apartment=apartment, full_name='Tenant', contract_start=date(2025, 1, 1), monthly_rent=amount,
+    )
+    return RentPayment.objects.create(tenant=tenant, year=2025, month=3, amount=amount, due_date=date(2025, 3, 5))
+
+
+class SparseFieldsetsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.apartment = Apartment.objects.create(owner=self.owner, title='A1', address='Odos 1', square_meters=50)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_lists_return_only_the_selected_fields(self):
+        response = self.client.get('/api/apartments/?fields=id,title,owner&omit=owner')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title'])
+
+    def test_writes_validate_every_field_and_trim_the_response(self):
+        data = {
+            'apartment': self.apartment.pk, 'full_name': 'Tenant', 'contract_start': '2025-01-01',
+            'contract_end': '2025-12-31', 'monthly_rent': '450.00',
+        }
+        response = self.client.post('/api/tenants/?fields=id,full_name', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.data), {'id', 'full_name'})
+        self.assertEqual(Tenant.objects.get().apartment_id, self.apartment.pk)
+
+        response = self.client.post('/api/tenants/?fields=id,full_name', {'full_name': 'Other'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('apartment', response.data)
+
+
+class ColumnarRendererTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_columnar_json_sends_keys_once(self):
+        response = self.client.get(
+            '/api/payments/?fields=id,amount,due_date', HTTP_ACCEPT='application/x-columnar+json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-columnar+json')
+        self.assertEqual(json.loads(response.content), {
+            'columns': ['id', 'amount', 'due_date'],
+            'rows': [[self.payment.pk, '450.00', '2025-03-05']],
+        })
+
+    @skipUnless(msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        response = self.client.get('/api/apartments/?fields=id,title', HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(msgpack.unpackb(response.content), {
+            'columns': ['id', 'title'], 'rows': [[self.payment.tenant.apartment_id, 'A1']],
+        })
+
+
+class SqliteConnectionTests(TestCase):
+    def test_new_connections_get_the_pragmas(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        wrapper = connections['default'].__class__(
+            {**connections.settings['default'], 'NAME': os.path.join(directory, 'db.sqlite3')}, alias='pragma_test',
+        )
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {
+                name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                for name in ('journal_mode', 'synchronous', 'busy_timeout')
+            }
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000})
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+
+class AnalyticsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+
+    def add_apartment(self, title):
+        return Apartment.objects.create(owner=self.owner, title=title, address='Odos 1', square_meters=50)
+
+    def test_version_is_bumped_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.add_apartment('A1')
+            self.assertEqual(owner_versions([self.owner.pk]), {self.owner.pk: 0})
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(owner_versions([self.owner.pk])[self.owner.pk], 0)
+
+    def test_cached_snapshot_follows_writes(self):
+        self.assertEqual(portfolio_analytics([self.owner.pk])['totals']['apartments'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_apartment('A1')
+        self.assertEqual(portfolio_analytics([self.owner.pk])['totals']['apartments'], 1)
+        self.assertEqual(portfolio_analytics(None)['totals']['apartments'], 1)
+
+    def test_version_lives_in_the_database(self):
+        # another worker process or a management command only shares the database
+        portfolio_analytics([self.owner.pk])
+        User.objects.filter(pk=self.owner.pk).update(analytics_version=5)
+        Apartment.objects.bulk_create([Apartment(owner=self.owner, title='A1', address='Odos 1', square_meters=50)])
+        self.assertEqual(portfolio_analytics([self.owner.pk])['totals']['apartments'], 1)
+
+
+class AgingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.other = User.objects.create_user('other', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.tenant = self.payment.tenant
+        for month, due in ((1, date(2025, 1, 5)), (2, date(2025, 2, 5)), (4, date(2025, 4, 5))):
+            RentPayment.objects.create(tenant=self.tenant, year=2025, month=month, amount=Decimal('450.00'), due_date=due)
+        create_payment(self.other, title='B1')
+
+    def test_buckets_by_days_past_due(self):
+        record_transaction(self.payment, Decimal('150.00'))
+        # not yet due: 2025-04-05
+        [row] = arrears_aging([self.owner.pk], today=date(2025, 4, 1))
+        self.assertEqual(row['tenant_id'], self.tenant.pk)
+        self.assertEqual(
+            [row[bucket] for bucket in AGING_BUCKETS],
+            [Decimal('300.00'), Decimal('450.00'), Decimal('450.00'), Decimal(0)],
+        )
+        self.assertEqual(row['total'], Decimal('1200.00'))
+        self.assertEqual(row['payments'], 3)
+        self.assertEqual(row['oldest_due_date'], date(2025, 1, 5))
+
+    def test_paid_payments_drop_out(self):
+        mark_payment_paid(self.payment)
+        [row] = arrears_aging([self.owner.pk], group='owner', today=date(2025, 4, 1))
+        self.assertEqual(row['owner_username'], 'owner')
+        self.assertEqual(row['total'], Decimal('900.00'))
+
+    def test_endpoint_is_scoped_to_the_owner(self):
+        response = token_client('owner').get('/api/analytics/aging/?group=apartment')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['owner_id'] for row in response.data['rows']], [self.owner.pk])
+        self.assertEqual(response.data['totals']['total'], Decimal('1800.00'))
+
+    def test_unknown_group(self):
+        self.assertEqual(token_client('owner').get('/api/analytics/aging/?group=city').status_code, 400)
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.tenant = self.payment.tenant
+
+    def series(self, forecast, name):
+        [group] = forecast['groups']
+        return [month[name] for month in group['months']]
+
+    def test_contract_terms_and_actual_payments(self):
+        Tenant.objects.filter(pk=self.tenant.pk).update(contract_end=date(2025, 6, 30))
+        record_transaction(self.payment, Decimal('100.00'))
+        forecast = cash_flow_forecast([self.owner.pk], start=date(2025, 3, 10))
+        self.assertEqual(forecast['start'], '2025-03')
+        self.assertEqual(forecast['groups'][0]['label'], 'owner')
+        self.assertEqual(self.series(forecast, 'projected'), [0.0, 450.0, 450.0, 450.0] + [0.0] * 8)
+        self.assertEqual(self.series(forecast, 'collected')[0], 100.0)
+        self.assertEqual(self.series(forecast, 'outstanding')[0], 350.0)
+        self.assertEqual([month['expected'] for month in forecast['totals']][:5], [450.0] * 4 + [0.0])
+
+    def test_open_ended_contract_runs_to_the_horizon(self):
+        forecast = cash_flow_forecast([self.owner.pk], group='apartment', months=24, start=date(2025, 3, 1))
+        self.assertEqual(forecast['groups'][0]['label'], 'A1')
+        self.assertEqual(self.series(forecast, 'expected'), [450.0] * 24)
+
+    def test_endpoint_clamps_months(self):
+        response = token_client('owner').get('/api/analytics/forecast/?months=100')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['months'], 60)
+        self.assertEqual(token_client('owner').get('/api/analytics/forecast/?group=tenant').status_code, 400)
+
+
+class ScheduleExtensionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.tenant = self.payment.tenant
+
+    def periods(self, tenant):
+        return list(RentPayment.objects.filter(tenant=tenant).order_by('year', 'month').values_list('year', 'month'))
+
+    def test_fills_up_to_the_horizon_once(self):
+        self.assertEqual(extend_rent_schedules(3, today=date(2025, 3, 15)), (1, 3))
+        self.assertEqual(self.periods(self.tenant), [(2025, 3), (2025, 4), (2025, 5), (2025, 6)])
+        payment = RentPayment.objects.get(tenant=self.tenant, month=6)
+        self.assertEqual(
+            (payment.owner_id, payment.amount, payment.due_date), (self.owner.pk, Decimal('450.00'), date(2025, 6, 5)),
+        )
+        self.assertEqual(PaymentEvent.objects.filter(payment_id=payment.pk, event_type='created').count(), 1)
+
+        self.assertEqual(extend_rent_schedules(3, today=date(2025, 3, 20)), (0, 0))
+
+    def test_stops_at_the_contract_end(self):
+        Tenant.objects.filter(pk=self.tenant.pk).update(contract_end=date(2025, 4, 30))
+        ended = Tenant.objects.create(
+            apartment=Apartment.objects.create(owner=self.owner, title='A2', address='Odos 2', square_meters=40),
+            full_name='Former', contract_start=date(2024, 1, 1), contract_end=date(2024, 12, 31),
+            monthly_rent=Decimal('300.00'),
+        )
+        self.assertEqual(extend_rent_schedules(12, today=date(2025, 3, 15)), (1, 1))
+        self.assertEqual(self.periods(self.tenant), [(2025, 3), (2025, 4)])
+        self.assertEqual(self.periods(ended), [])
+
+    def test_tenant_without_rows_starts_at_the_contract_start(self):
+        tenant = Tenant.objects.create(
+            apartment=Apartment.objects.create(owner=self.owner, title='A2', address='Odos 2', square_meters=40),
+            full_name='New', contract_start=date(2025, 3, 20), monthly_rent=Decimal('300.00'),
+        )
+        extend_rent_schedules(1, today=date(2025, 3, 15))
+        self.assertEqual(self.periods(tenant), [(2025, 3), (2025, 4)])
+        self.assertEqual(RentPayment.objects.get(tenant=tenant, month=3).due_date, date(2025, 3, 20))
+
+
+class NotificationGeneratorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.other = User.objects.create_user('other', password='x', role='owner')
+        self.accountant = User.objects.create_user('accountant', password='x', role='accountant')
+        AccountantOwner.objects.create(accountant=self.accountant, owner=self.owner)
+        self.payment = create_payment(self.owner)
+        RentPayment.objects.create(
+            tenant=self.payment.tenant, year=2025, month=4, amount=Decimal('450.00'), due_date=date(2025, 4, 5),
+        )
+        create_payment(self.other, title='B1')
+
+    def test_overdue_payments_in_one_batch(self):
+        # payments, unread notices, accountant links, recipients, one insert
+        with self.assertNumQueries(5):
+            self.assertEqual(create_overdue_payment_notifications(today=date(2025, 5, 1)), 3)
+        notice = Notification.objects.get(user=self.owner)
+        self.assertEqual(notice.title, 'Overdue Payments (2)')
+        self.assertIn('Tenant (2025/4)', notice.message)
+        self.assertTrue(Notification.objects.filter(user=self.accountant, notification_type='overdue_payment').exists())
+
+        self.assertEqual(create_overdue_payment_notifications(today=date(2025, 5, 2)), 0)
+
+    def test_contract_start_and_end(self):
+        Tenant.objects.filter(pk=self.payment.tenant_id).update(contract_end=date(2025, 1, 8))
+        self.assertEqual(create_contract_notifications(today=date(2025, 1, 1)), 5)
+        self.assertEqual(
+            sorted(Notification.objects.filter(user=self.owner).values_list('notification_type', flat=True)),
+            ['contract_ending', 'contract_starting'],
+        )
+        self.assertEqual(Notification.objects.filter(user=self.other).count(), 1)
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.now = timezone.now()
+
+    def notify(self, notification_type, days_old, is_read=True):
+        notice = Notification.objects.create(
+            user=self.owner, notification_type=notification_type, title=f'{notification_type} {days_old}',
+            message='', is_read=is_read,
+        )
+        Notification.objects.filter(pk=notice.pk).update(created_at=self.now - timedelta(days=days_old))
+        return notice
+
+    def test_archives_expired_read_notifications_per_type(self):
+        self.notify('payment_received', 31)
+        self.notify('payment_received', 40)
+        kept = [
+            self.notify('payment_received', 31, is_read=False).pk,
+            self.notify('payment_received', 10).pk,
+            self.notify('overdue_payment', 100).pk,
+            self.notify('other', 80).pk,
+        ]
+        self.notify('other', 91)
+
+        archived = archive_notifications(chunk_size=1, now=self.now)
+        self.assertEqual(archived, {'payment_received': 2, 'payment_due': 0, 'overdue_payment': 0, 'default': 1})
+        self.assertEqual(sorted(Notification.objects.values_list('pk', flat=True)), kept)
+        self.assertEqual(ArchivedNotification.objects.filter(user=self.owner).count(), 3)
+
+        response = token_client('owner').get('/api/notifications/archive/?notification_type=other')
+        self.assertEqual([row['title'] for row in response.data['results']], ['other 91'])
+
+    @override_settings(NOTIFICATION_RETENTION_DAYS={'default': None, 'payment_received': 30})
+    def test_none_keeps_forever(self):
+        self.notify('other', 1000)
+        self.notify('payment_received', 31)
+        self.assertEqual(archive_notifications(now=self.now), {'payment_received': 1})
+        self.assertEqual(Notification.objects.get().notification_type, 'other')
+
+
+class PaymentChangesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.other = User.objects.create_user('other', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        create_payment(self.other, title='B1')
+        self.client = token_client('owner')
+
+    def test_every_change_appends_an_event(self):
+        mark_payment_paid(self.payment)
+        self.payment.notes = 'late'
+        self.payment.save()
+        payment_id = self.payment.pk
+        self.payment.delete()
+        events = list(PaymentEvent.objects.filter(payment_id=payment_id).order_by('id'))
+        self.assertEqual([event.event_type for event in events], ['created', 'paid', 'updated', 'deleted'])
+        self.assertTrue(events[1].data['paid'])
+        self.assertEqual(events[2].data['notes'], 'late')
+        self.assertEqual({event.owner_id for event in events}, {self.owner.pk})
+
+    def test_feed_pages_with_the_cursor(self):
+        mark_payment_paid(self.payment)
+        first = self.client.get('/api/changes/?limit=1').data
+        self.assertEqual([row['event_type'] for row in first['results']], ['created'])
+        self.assertTrue(first['has_more'])
+
+        rest = self.client.get(f"/api/changes/?since={first['cursor']}").data
+        self.assertEqual([row['event_type'] for row in rest['results']], ['paid'])
+        self.assertEqual({row['owner_id'] for row in rest['results']}, {self.owner.pk})
+        self.assertFalse(rest['has_more'])
+
+        empty = self.client.get(f"/api/changes/?since={rest['cursor']}").data
+        self.assertEqual((empty['results'], empty['cursor']), ([], rest['cursor']))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/changes/?since=abc').status_code, 400)
+
+
+class PeriodCloseTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.client = token_client('owner')
+
+    def close(self, year=2025, month=3):
+        return self.client.post('/api/periods/', {'year': year, 'month': month}, format='json')
+
+    def report(self):
+        return self.client.get('/api/periods/report/?from=2025-02&to=2025-04').data
+
+    def test_close_freezes_the_month(self):
+        record_transaction(self.payment, Decimal('100.00'), payment_method='cash')
+        response = self.close()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            (Decimal(response.data['expected']), Decimal(response.data['collected']), response.data['payments']),
+            (Decimal('450.00'), Decimal('100.00'), 1),
+        )
+        self.assertEqual(self.close().status_code, 400)
+        today = timezone.now().date()
+        self.assertEqual(self.close(today.year, today.month).status_code, 400)
+
+    def test_closed_month_rejects_edits(self):
+        self.close()
+        response = self.client.post(f'/api/payments/{self.payment.pk}/mark_paid/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.payment.refresh_from_db()
+        self.assertFalse(self.payment.paid)
+
+    @override_settings(PERIOD_CLOSE_EDIT_POLICY='flag')
+    def test_report_reads_closed_months_from_the_snapshot(self):
+        self.close()
+        RentPayment.objects.create(
+            tenant=self.payment.tenant, year=2025, month=4, amount=Decimal('450.00'), due_date=date(2025, 4, 5),
+        )
+        mark_payment_paid(self.payment)
+        [february, march, april] = self.report()['periods']
+        self.assertEqual(february['expected'], Decimal(0))
+        self.assertEqual((march['collected'], march['closed_owners'], march['amended_owners']), (Decimal(0), 1, 1))
+        self.assertEqual((april['expected'], april['closed_owners']), (Decimal('450.00'), 0))
+
+    def test_report_with_many_closed_owners(self):
+        # one filter term per owner would exceed SQLite's expression depth limit of 1000
+        owners = User.objects.bulk_create([User(username=f'owner{number}') for number in range(1100)])
+        PeriodClose.objects.bulk_create([
+            PeriodClose(owner=owner, year=2025, month=2 + number % 2) for number, owner in enumerate(owners)
+        ])
+        report = period_report(None, (2025, 2), (2025, 4))
+        self.assertEqual([period['closed_owners'] for period in report['periods']], [550, 550, 0])
+        self.assertEqual(report['periods'][1]['expected'], Decimal('450.00'))
+
+
+class OwnerDenormalisationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.other = User.objects.create_user('other', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.tenant = self.payment.tenant
+        self.apartment = self.tenant.apartment
+        record_transaction(self.payment, Decimal('50.00'))
+        self.document = Document.objects.create(tenant=self.tenant, document_type='other', title='Notes', file='x.pdf')
+
+    def owners(self):
+        return {
+            'payment': RentPayment.objects.get(pk=self.payment.pk).owner_id,
+            'transaction': PaymentTransaction.objects.get(payment=self.payment).owner_id,
+            'document': Document.objects.get(pk=self.document.pk).owner_id,
+        }
+
+    def test_rows_take_the_owner_when_created(self):
+        self.assertEqual(set(self.owners().values()), {self.owner.pk})
+        [payment] = RentPayment.objects.bulk_create([RentPayment(
+            tenant=self.tenant, year=2025, month=4, amount=Decimal('450.00'), due_date=date(2025, 4, 5),
+        )])
+        self.assertEqual(RentPayment.objects.get(pk=payment.pk).owner_id, self.owner.pk)
+
+    def test_apartment_changing_owner_moves_its_rows(self):
+        self.apartment.owner = self.other
+        self.apartment.save()
+        self.assertEqual(set(self.owners().values()), {self.other.pk})
+        self.assertEqual(token_client('owner').get('/api/payments/').data['count'], 0)
+        self.assertEqual(token_client('other').get('/api/payments/').data['count'], 1)
+
+    def test_tenant_moving_apartment_moves_its_rows(self):
+        moved_to = Apartment.objects.create(owner=self.other, title='B1', address='Odos 2', square_meters=40)
+        self.tenant.apartment = moved_to
+        self.tenant.save()
+        self.assertEqual(set(self.owners().values()), {self.other.pk})
+
+
+@skipUnless(pdf.available(), "reportlab is not installed")
+class ReceiptTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.client = token_client('owner')
+
+    def receipt(self):
+        return self.client.get(f'/api/payments/{self.payment.pk}/receipt/')
+
+    def test_receipt_is_rendered_once_per_content(self):
+        self.assertEqual(self.receipt().status_code, 400)
+        mark_payment_paid(self.payment, payment_method='cash')
+
+        response = self.receipt()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        document = Document.objects.get(generated_key=f'receipt:{self.payment.pk}')
+        self.assertEqual((document.document_type, document.owner_id), ('receipt', self.owner.pk))
+
+        self.receipt()
+        self.assertEqual(Document.objects.get(pk=document.pk).file.name, document.file.name)
+
+        RentPayment.objects.filter(pk=self.payment.pk).update(receipt_number='R-7')
+        self.receipt()
+        renewed = Document.objects.get(pk=document.pk)
+        self.assertNotEqual(renewed.content_hash, document.content_hash)
+        self.assertEqual(Document.objects.filter(generated_key=document.generated_key).count(), 1)
+
+    def test_bulk_statements_skip_unchanged_tenants(self):
+        record_transaction(self.payment, Decimal('100.00'))
+        self.assertEqual(generate_statements([self.owner.pk], 2025, workers=1), {'rendered': 1, 'unchanged': 0})
+        self.assertEqual(generate_statements([self.owner.pk], 2025, workers=1), {'rendered': 0, 'unchanged': 1})
+        record_transaction(self.payment, Decimal('50.00'))
+        self.assertEqual(generate_statements([self.owner.pk], 2025, workers=1), {'rendered': 1, 'unchanged': 0})
+
+    def test_statement_without_payments(self):
+        response = self.client.get(f'/api/tenants/{self.payment.tenant_id}/statement/?year=2024')
+        self.assertEqual(response.status_code, 400)
+
+
+class TaxStatementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        Tenant.objects.filter(pk=self.payment.tenant_id).update(contract_end=date(2026, 6, 30))
+
+    def statement(self):
+        [statement] = e2_statements([self.owner.pk], 2025)
+        return statement
+
+    def test_statement_figures(self):
+        mark_payment_paid(self.payment)
+        [tenant] = compute_e2_statements([self.owner.pk], 2025)[self.owner.pk]['apartments'][0]['tenants']
+        self.assertEqual((tenant['period_start'], tenant['period_end']), (date(2025, 1, 1), date(2025, 12, 31)))
+        self.assertEqual((tenant['months_paid'], tenant['collected']), (1, Decimal('450.00')))
+
+    def test_precomputed_statements_are_served_from_the_table(self):
+        call_command('precompute_tax_statements', year=2025, stdout=open(os.devnull, 'w'))
+        self.assertEqual(TaxStatement.objects.get(owner_id=self.owner.pk, year=2025).version, 0)
+        with mock.patch('apartments.tax.compute_e2_statements') as compute:
+            self.assertEqual(Decimal(self.statement()['totals']['expected']), Decimal('450.00'))
+        compute.assert_not_called()
+
+    def test_changes_and_age_invalidate_the_stored_statement(self):
+        self.assertEqual(Decimal(self.statement()['totals']['collected']), Decimal(0))
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_payment_paid(self.payment)
+        self.assertEqual(Decimal(self.statement()['totals']['collected']), Decimal('450.00'))
+
+        # a change that skipped invalidation is picked up once the row expires
+        RentPayment.objects.filter(pk=self.payment.pk).update(amount=Decimal('500.00'))
+        self.assertEqual(Decimal(self.statement()['totals']['expected']), Decimal('450.00'))
+        TaxStatement.objects.update(computed_at=timezone.now() - MAX_AGE)
+        self.assertEqual(Decimal(self.statement()['totals']['expected']), Decimal('500.00'))
+
+
+class LateFeeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        LateFeeRule.objects.create(
+            owner=self.owner, flat_fee=Decimal('10.00'), daily_rate=Decimal('0.1'), grace_days=5,
+            max_percent=Decimal('10'),
+        )
+
+    def fee(self):
+        fee = LateFee.objects.filter(payment=self.payment).first()
+        return fee and fee.amount
+
+    def test_fee_accrues_on_the_outstanding_balance(self):
+        record_transaction(self.payment, Decimal('150.00'))
+        recompute_late_fees(today=date(2025, 3, 25))
+        # 10 + 300 * 0.1% * (20 - 5) days
+        self.assertEqual(self.fee(), Decimal('14.50'))
+        recompute_late_fees(today=date(2025, 6, 5))
+        self.assertEqual(self.fee(), Decimal('30.00'))
+
+    def test_grace_period_and_paid_payments(self):
+        recompute_late_fees(today=date(2025, 3, 8))
+        self.assertIsNone(self.fee())
+        recompute_late_fees(today=date(2025, 3, 25))
+        self.assertEqual(self.fee(), Decimal('16.75'))
+
+        mark_payment_paid(self.payment)
+        recompute_late_fees(today=date(2025, 4, 25))
+        self.assertEqual(self.fee(), Decimal('16.75'))
+
+    def test_compute_fee_is_exact(self):
+        self.assertEqual(
+            compute_fee(Decimal('333.33'), 4, Decimal(0), Decimal('0.0333'), 0, None, None), Decimal('0.44'),
+        )
+        self.assertEqual(
+            compute_fee(Decimal('100.00'), 30, Decimal('5.00'), Decimal('1'), 0, Decimal('20.00'), None), Decimal('20.00'),
+        )
+
+
+class IndexationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.tenant = self.payment.tenant
+        apartment = Apartment.objects.create(owner=self.owner, title='A2', address='Odos 2', square_meters=60)
+        self.june = Tenant.objects.create(
+            apartment=apartment, full_name='June', contract_start=date(2024, 6, 1), monthly_rent=Decimal('300.00'),
+        )
+
+    def index(self, **data):
+        return token_client('owner').post(
+            '/api/tenants/index_rents/', {'effective_date': '2025-03-01', **data}, format='json',
+        )
+
+    def test_fixed_percent(self):
+        response = self.index(percent='3.3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['tenants'], 2)
+        self.assertEqual(response.data['totals']['amount_after'], Decimal('464.85'))
+        self.tenant.refresh_from_db()
+        self.payment.refresh_from_db()
+        self.june.refresh_from_db()
+        self.assertEqual(self.tenant.monthly_rent, Decimal('464.85'))
+        self.assertEqual(self.payment.amount, Decimal('464.85'))
+        self.assertEqual(self.june.monthly_rent, Decimal('309.90'))
+        self.assertTrue(PaymentEvent.objects.filter(payment_id=self.payment.pk, event_type='updated').exists())
+
+    def test_table_uses_the_anniversary_month(self):
+        self.assertEqual(self.index(table={'1': '2', '6': '4'}).status_code, 200)
+        self.tenant.refresh_from_db()
+        self.june.refresh_from_db()
+        self.assertEqual(self.tenant.monthly_rent, Decimal('459.00'))
+        self.assertEqual(self.june.monthly_rent, Decimal('312.00'))
+
+    def test_dry_run_writes_nothing_and_takes_no_write_lock(self):
+        refuse = mock.Mock(side_effect=AssertionError("dry run opened a transaction"))
+        with mock.patch('apartments.indexation.transaction.atomic', refuse), \
+                mock.patch('apartments.views.transaction.atomic', refuse):
+            response = self.index(percent='3.3', dry_run=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals']['monthly_rent_after'], Decimal('774.75'))
+        self.tenant.refresh_from_db()
+        self.assertEqual(self.tenant.monthly_rent, Decimal('450.00'))
+        self.assertFalse(PaymentEvent.objects.filter(event_type='updated').exists())
+
+    def test_invalid_percent(self):
+        response = self.index(percent='80')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('indexation', response.data)
+
+
+class OccupancyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.apartment = Apartment.objects.create(owner=self.owner, title='A1', address='Odos 1', square_meters=50)
+        self.first = Tenant.objects.create(
+            apartment=self.apartment, full_name='First', contract_start=date(2025, 1, 1),
+            contract_end=date(2025, 3, 1), monthly_rent=Decimal('400.00'),
+        )
+        self.client = token_client('owner')
+
+    def add_tenant(self, start, end=None):
+        return self.client.post('/api/tenants/', {
+            'apartment': self.apartment.pk, 'full_name': 'Next', 'contract_start': start,
+            'contract_end': end, 'monthly_rent': '450.00',
+        }, format='json')
+
+    def test_overlapping_contract_is_refused(self):
+        response = self.add_tenant('2025-02-15', '2025-06-30')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('contract_start', response.data)
+        self.assertEqual(self.add_tenant('2024-06-01').status_code, 400)
+
+    def test_handover_on_the_same_day_is_allowed(self):
+        self.assertEqual(self.add_tenant('2025-03-01', '2025-12-31').status_code, 201)
+
+    def test_index_reports_overlaps_and_timeline(self):
+        second = Tenant.objects.bulk_create([Tenant(
+            apartment=self.apartment, full_name='Second', contract_start=date(2025, 2, 1), monthly_rent=Decimal('1'),
+        )])[0]
+        index = ContractIndex.load([self.apartment.pk])
+        self.assertEqual(index.overlaps(self.apartment.pk), [(self.first.pk, second.pk)])
+        self.assertEqual(index.occupant(self.apartment.pk, date(2025, 2, 10)), second.pk)
+        self.assertEqual(
+            [(s['start'], s['end'], s['tenant_id']) for s in index.timeline(self.apartment.pk, date(2024, 12, 30), date(2025, 1, 2))],
+            [(date(2024, 12, 30), date(2024, 12, 31), None), (date(2025, 1, 1), date(2025, 1, 2), self.first.pk)],
+        )
+
+    def test_vacancy_is_paginated(self):
+        Apartment.objects.bulk_create([
+            Apartment(owner=self.owner, title=f'B{number}', address='Odos 2', square_meters=40) for number in range(100)
+        ])
+        query = '?from=2025-02-01&to=2025-03-02'
+        response = self.client.get(f'/api/apartments/vacancy/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 101)
+        self.assertEqual(len(response.data['results']), 100)
+        [row] = [row for row in response.data['results'] if row['apartment_id'] == self.apartment.pk]
+        self.assertEqual(row['vacant_days'], 1)
+        self.assertEqual(response.data['from'], date(2025, 2, 1))
+        self.assertNotIn(self.apartment.pk, response.data['vacant_throughout'])
+
+        response = self.client.get(f'/api/apartments/vacancy/{query}&page=2')
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['vacant_throughout'], [response.data['results'][0]['apartment_id']])
+
+
+class OwnerApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.other = User.objects.create_user('other', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.client = token_client('owner')
+
+    def test_e2_counts_partial_payments(self):
+        response = self.client.post(
+            '/api/payment-transactions/', {'payment': self.payment.pk, 'amount': '100.00'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.payment.refresh_from_db()
+        self.assertFalse(self.payment.paid)
+
+        response = self.client.get('/api/analytics/e2/?year=2025')
+        self.assertEqual(response.status_code, 200)
+        [statement] = response.data['owners']
+        self.assertEqual(statement['owner_id'], self.owner.pk)
+        self.assertEqual(Decimal(statement['totals']['collected']), Decimal('100'))
+        self.assertEqual(Decimal(statement['totals']['outstanding']), Decimal('350'))
+
+    def test_transactions_settle_the_payment(self):
+        for amount in ('200.00', '250.00'):
+            response = self.client.post(
+                '/api/payment-transactions/', {'payment': self.payment.pk, 'amount': amount}, format='json',
+            )
+            self.assertEqual(response.status_code, 201)
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.paid)
+
+        response = self.client.post(
+            '/api/payment-transactions/', {'payment': self.payment.pk, 'amount': '1.00'}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_mark_unpaid_is_refused_while_transactions_cover_the_payment(self):
+        first = record_transaction(self.payment, Decimal('200.00'))
+        record_transaction(self.payment, Decimal('250.00'))
+        url = f'/api/payments/{self.payment.pk}/mark_unpaid/'
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('paid', response.data)
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.paid)
+
+        self.assertEqual(self.client.delete(f'/api/payment-transactions/{first.pk}/').status_code, 204)
+        self.payment.refresh_from_db()
+        self.assertFalse(self.payment.paid)
+        record_transaction(self.payment, Decimal('200.00'))
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.paid)
+
+    def test_transactions_of_other_owners_are_refused(self):
+        payment = create_payment(self.other, title='B1')
+        response = self.client.post('/api/payment-transactions/', {'payment': payment.pk, 'amount': '10.00'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PaymentTransaction.objects.exists())
+
+    def test_notifications_list_own_notifications(self):
+        Notification.objects.create(user=self.owner, notification_type='other', title='Mine', message='m')
+        Notification.objects.create(user=self.other, notification_type='other', title='Theirs', message='m')
+        response = self.client.get('/api/notifications/')
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([row['title'] for row in rows], ['Mine'])
+
+
+class CompositeViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        other = User.objects.create_user('other', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        create_payment(other, title='B1')
+        tenant = self.payment.tenant
+        today = timezone.now().date()
+        self.current = RentPayment.objects.create(
+            tenant=tenant, year=today.year, month=today.month, amount=Decimal('450.00'), due_date=today,
+        )
+        record_transaction(self.current, Decimal('100.00'))
+        Notification.objects.create(user=self.owner, notification_type='other', title='N', message='m')
+        self.client = token_client('owner')
+
+    def test_overview_totals(self):
+        response = self.client.get(f'/api/apartments/{self.payment.tenant.apartment_id}/overview/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['apartment']['title'], 'A1')
+        self.assertEqual(len(data['tenants']), 1)
+        self.assertEqual(len(data['payments']), 2)
+        self.assertEqual(data['totals'], {
+            'total_paid': 100.0, 'total_unpaid': 800.0, 'overdue_count': 1, 'payment_count': 2,
+        })
+
+    def test_overview_of_another_owner_is_not_found(self):
+        other_apartment = Apartment.objects.get(title='B1')
+        self.assertEqual(self.client.get(f'/api/apartments/{other_apartment.pk}/overview/').status_code, 404)
+
+    def test_dashboard(self):
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_apartments'], 1)
+        self.assertEqual(data['monthly_income'], 100.0)
+        self.assertEqual(data['yearly_income'], 100.0)
+        self.assertEqual(data['overdue_count'], 1)
+        self.assertEqual([row['id'] for row in data['overdue_payments']], [self.payment.pk])
+        self.assertEqual(data['unread_notifications'], 1)
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get('/api/dashboard/').status_code, 401)
+
+
+class PortfolioImportTests(TestCase):
+    header = 'title,address,square_meters,status,tenant_full_name,tenant_contract_start,tenant_contract_end,tenant_monthly_rent'
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def upload(self, *rows):
+        content = '\n'.join([self.header, *rows]).encode()
+        return self.client.post(
+            '/api/imports/portfolio/', {'file': SimpleUploadedFile('portfolio.csv', content)}, format='multipart',
+        )
+
+    def test_import_creates_apartments_tenants_and_schedules(self):
+        today = timezone.now().date()
+        response = self.upload(
+            f'Running,Odos 1,50,vacant,Tenant 1,{today.year - 1}-01-01,,400',
+            'Ended,Odos 2,60,rented,Tenant 2,2020-01-01,2020-06-30,400',
+            'Empty,Odos 3,70,,,,,',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['apartments'], 3)
+        self.assertEqual(response.data['tenants'], 2)
+        self.assertEqual(RentPayment.objects.filter(tenant__full_name='Tenant 2').count(), 6)
+        statuses = dict(Apartment.objects.values_list('title', 'status'))
+        self.assertEqual(statuses, {'Running': 'rented', 'Ended': 'vacant', 'Empty': 'vacant'})
+
+    def test_invalid_rows_write_nothing(self):
+        response = self.upload(
+            'Good,Odos 1,50,,Tenant 1,2025-01-01,,400',
+            'Backwards,Odos 2,60,,Tenant 2,2025-06-01,2025-01-31,400',
+            'Bad,Odos 3,abc,,,,,',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertIn('tenant_contract_end', response.data['errors'][0]['errors'])
+        self.assertIn('square_meters', response.data['errors'][1]['errors'])
+        self.assertFalse(Apartment.objects.exists())
+
+
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('owner', password='x', role='owner')
+        User.objects.create_user('other', password='x', role='owner')
+
+    def test_heavy_requests_of_one_user_do_not_block_another(self):
+        client = token_client('owner')
+        statuses = [client.get('/api/analytics/e2/?year=2025').status_code for _ in range(40)]
+        # a burst of 30 heavy views fits the owner's bucket
+        self.assertEqual(statuses[:30], [200] * 30)
+        self.assertIn(429, statuses[30:])
+        self.assertEqual(token_client('other').get('/api/analytics/e2/?year=2025').status_code, 200)
+
+    def test_cheap_requests_are_not_throttled(self):
+        client = token_client('owner')
+        while client.get('/api/analytics/e2/?year=2025').status_code != 429:
+            pass
+        statuses = {client.get('/api/apartments/').status_code for _ in range(150)}
+        self.assertEqual(statuses, {200})
+        response = APIClient().post('/api/token/', {'username': 'owner', 'password': 'x'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_buckets_of_different_users_use_different_locks(self):
+        with _locked(['throttle:user:1']):
+            finished = threading.Event()
+            thread = threading.Thread(target=lambda: consume([('throttle:user:2', 10, 1, 0)], 1) or finished.set())
+            thread.start()
+            thread.join(5)
+        self.assertTrue(finished.is_set())
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        self.client = token_client('owner')
+
+    def mark_paid(self, key):
+        return self.client.post(
+            f'/api/payments/{self.payment.pk}/mark_paid/', {'payment_method': 'cash'}, format='json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replayed_key_returns_the_first_response(self):
+        first = self.mark_paid('key-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        replay = self.mark_paid('key-1')
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.json(), first.json())
+
+        self.assertEqual(Notification.objects.filter(user=self.owner, notification_type='payment_received').count(), 1)
+        self.assertEqual(PaymentEvent.objects.filter(payment_id=self.payment.pk, event_type='paid').count(), 1)
+
+
+class MoveOwnerTests(TransactionTestCase):
+    """Moves the owner from the test database to an on-disk copy of it registered as ``shard_test``."""
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        shard = {'shard_test': {**connections.settings['default'], 'NAME': os.path.join(directory, 'shard.sqlite3')}}
+        for patcher in (mock.patch.dict(settings.DATABASES, shard), mock.patch.dict(connections.settings, shard)):
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+        cls.addClassCleanup(lambda: (connections['shard_test'].close(), delattr(connections._connections, 'shard_test')))
+        # registered here for the same reason as ReplicaDatabasesMixin's replicas
+        cls.databases = {'default', 'shard_test'}
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+        connections['shard_test'].close()
+        database = sqlite3.connect(settings.DATABASES['shard_test']['NAME'])
+        try:
+            connections['default'].connection.backup(database)
+        finally:
+            database.close()
+
+    def owner_payments(self, alias):
+        return RentPayment.objects.using(alias).filter(owner_id=self.owner.pk).count()
+
+    def test_move(self):
+        moved = move_owner(self.owner.pk, 'default', 'shard_test')
+        self.assertEqual(moved['apartments.rentpayment'], 1)
+        self.assertEqual((self.owner_payments('default'), self.owner_payments('shard_test')), (0, 1))
+
+    def test_failed_source_delete_removes_the_copy(self):
+        delete_rows = sharding._delete_rows
+
+        def fail_on_source(alias, *args):
+            if alias == 'default':
+                raise OperationalError('disk I/O error')
+            delete_rows(alias, *args)
+
+        with mock.patch.object(sharding, '_delete_rows', fail_on_source), self.assertRaises(OperationalError):
+            move_owner(self.owner.pk, 'default', 'shard_test')
+        self.assertEqual((self.owner_payments('default'), self.owner_payments('shard_test')), (1, 0))
+
+
+class ConcurrentTransitionTests(TransactionTestCase):
+    """
+    The worker threads use an on-disk copy of the test database: the shared
+    in-memory one fails lock waits with "table is locked" instead of queueing
+    them on busy_timeout like a database file does.
+    """
+    threads = 4
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.payment = create_payment(self.owner)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.database = os.path.join(directory, 'db.sqlite3')
+        target = sqlite3.connect(self.database)
+        try:
+            connections['default'].connection.backup(target)
+        finally:
+            target.close()
+        # only connections opened from now on (those of the worker threads) use the copy
+        patcher = mock.patch.dict(connections.settings, {'default': {**connections.settings['default'], 'NAME': self.database}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def paid_events(self):
+        database = sqlite3.connect(self.database)
+        try:
+            return database.execute(
+                "SELECT COUNT(*) FROM apartments_paymentevent WHERE payment_id = ? AND event_type = 'paid'",
+                (self.payment.pk,),
+            ).fetchone()[0]
+        finally:
+            database.close()
+
+    def test_only_one_of_concurrent_transitions_wins(self):
+        barrier = threading.Barrier(self.threads)
+        results, errors = [], []
+
+        def mark_paid():
+            try:
+                payment = RentPayment.objects.get(pk=self.payment.pk)
+                barrier.wait()
+                results.append(mark_payment_paid(payment, payment_method='cash'))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=mark_paid) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(results), [False] * (self.threads - 1) + [True])
+        self.assertEqual(self.paid_events(), 1)
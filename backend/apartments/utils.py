@@ -1,107 +1,198 @@
 """
 Utility functions for managing apartments and tenants
 """
+from collections import defaultdict
 from datetime import date, timedelta
+from itertools import islice
 from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db.models import F, Max, Q
 from django.utils import timezone
+from .analytics import invalidate_owner_analytics
 from .models import Tenant, RentPayment, Notification
+from .notifications import notify_owners
 
 
-def generate_rent_payments(tenant):
+def iter_rent_schedule(tenant):
     """
-    Auto-generate monthly rent payments for a tenant's contract period.
-    Creates payments from contract_start to contract_end (or 12 months ahead if no end date).
-    Skips months that already have payment records.
+    Yield (year, month, due_date) for every month of a tenant's contract period:
+    contract_start to contract_end, or 12 months ahead if there is no end date.
+    The first month is due on contract_start, the rest on the 5th.
     """
     if not tenant.contract_start:
         return
-    
-    # Determine end date - use contract_end or 12 months from start
-    if tenant.contract_end:
-        end_date = tenant.contract_end
-    else:
-        end_date = tenant.contract_start + relativedelta(months=12)
-    
-    # Start from contract start date
-    current_date = tenant.contract_start
-    
-    # Generate payments for each month
-    while current_date <= end_date:
-        month = current_date.month
-        year = current_date.year
-        
-        # Check if payment already exists for this month/year
-        if not RentPayment.objects.filter(tenant=tenant, month=month, year=year).exists():
-            # Due date is the 5th of each month (or first day if contract starts mid-month)
-            if current_date == tenant.contract_start:
-                due_date = current_date
-            else:
-                due_date = date(year, month, 5)
-            
-            RentPayment.objects.create(
+    start = tenant.contract_start
+    end_date = tenant.contract_end or start + relativedelta(months=12)
+
+    # months are counted as an index from year 0 so each step is plain arithmetic
+    first = start.year * 12 + start.month - 1
+    last = end_date.year * 12 + end_date.month - 1
+    if start + relativedelta(months=last - first) > end_date:
+        last -= 1
+
+    for index in range(first, last + 1):
+        year, month = divmod(index, 12)
+        month += 1
+        due_date = start if index == first else date(year, month, 5)
+        yield year, month, due_date
+
+
+def build_rent_payments(tenants, skip=frozenset()):
+    """Unsaved RentPayment rows for the full schedule of every tenant, minus (tenant_id, year, month) in ``skip``."""
+    for tenant in tenants:
+        for year, month, due_date in iter_rent_schedule(tenant):
+            if (tenant.pk, year, month) in skip:
+                continue
+            yield RentPayment(
                 tenant=tenant,
                 month=month,
                 year=year,
                 amount=tenant.monthly_rent,
                 due_date=due_date,
-                paid=False
+                paid=False,
             )
-        
-        # Move to next month
-        current_date = current_date + relativedelta(months=1)
 
 
-def create_contract_notifications():
+def bulk_create_in_chunks(model, objs, batch_size=1000):
+    """bulk_create an iterable without materialising it; returns the number of rows written."""
+    created = 0
+    iterator = iter(objs)
+    while True:
+        chunk = list(islice(iterator, batch_size))
+        if not chunk:
+            return created
+        model.objects.bulk_create(chunk)
+        created += len(chunk)
+
+
+def generate_rent_payments(tenant):
     """
-    Create notifications for:
-    - Contract starting today
-    - Contract ending in 7 days
+    Auto-generate monthly rent payments for a tenant's contract period.
+    Creates payments from contract_start to contract_end (or 12 months ahead if no end date).
+    Skips months that already have payment records.
     """
-    today = timezone.now().date()
-    in_7_days = today + timedelta(days=7)
-    
-    # Contract starting today
-    starting_today = Tenant.objects.filter(contract_start=today)
-    for tenant in starting_today:
-        Notification.objects.get_or_create(
-            user=tenant.apartment.owner,
-            notification_type='contract_starting',
-            defaults={
-                'title': f'Contract Starting - {tenant.full_name}',
-                'message': f'Contract for {tenant.full_name} at {tenant.apartment.title} starts today'
-            }
-        )
-    
-    # Contract ending in 7 days
-    ending_in_7_days = Tenant.objects.filter(contract_end=in_7_days)
-    for tenant in ending_in_7_days:
-        Notification.objects.get_or_create(
-            user=tenant.apartment.owner,
-            notification_type='contract_ending',
-            defaults={
-                'title': f'Contract Ending Soon - {tenant.full_name}',
-                'message': f'Contract for {tenant.full_name} at {tenant.apartment.title} ends in 7 days'
-            }
-        )
+    existing = {
+        (tenant.pk, year, month)
+        for year, month in RentPayment.objects.filter(tenant=tenant).values_list('year', 'month')
+    }
+    return bulk_create_in_chunks(RentPayment, build_rent_payments([tenant], skip=existing))
 
 
-def create_overdue_payment_notifications():
+def iter_schedule_extension(tenants, target):
     """
-    Create notifications for overdue payments
+    Unsaved RentPayment rows continuing each schedule after its last stored
+    month, up to month index ``target`` or the contract end. ``tenants``
+    yields ``(tenant_id, contract_start, contract_end, monthly_rent, last_index)``
+    with month indexes counted as in ``iter_rent_schedule``.
     """
-    today = timezone.now().date()
-    
-    overdue_payments = RentPayment.objects.filter(paid=False, due_date__lt=today)
-    for payment in overdue_payments:
-        # Check if notification already exists
-        if not Notification.objects.filter(
-            user=payment.tenant.apartment.owner,
-            notification_type='overdue_payment'
-        ).exists():
-            Notification.objects.create(
-                user=payment.tenant.apartment.owner,
-                notification_type='overdue_payment',
-                title=f'Overdue Payment - {payment.tenant.full_name}',
-                message=f'Payment for {payment.tenant.full_name} ({payment.year}/{payment.month}) is overdue'
+    for tenant_id, start, end, rent, last_index in tenants:
+        first = start.year * 12 + start.month - 1
+        stop = target
+        if end:
+            last = end.year * 12 + end.month - 1
+            if start + relativedelta(months=last - first) > end:
+                last -= 1
+            stop = min(stop, last)
+        begin = first if last_index is None else max(last_index + 1, first)
+        for index in range(begin, stop + 1):
+            year, month = divmod(index, 12)
+            month += 1
+            yield RentPayment(
+                tenant_id=tenant_id,
+                month=month,
+                year=year,
+                amount=rent,
+                due_date=start if index == first else date(year, month, 5),
+                paid=False,
             )
 
+
+def extend_rent_schedules(horizon_months=None, today=None, batch_size=1000):
+    """
+    Fill every active tenant's rent schedule up to ``horizon_months`` past the
+    current month. Tenants that need rows are found with one aggregate query
+    over their latest (year, month); returns ``(tenants_extended, payments_created)``.
+    """
+    today = today or timezone.now().date()
+    if horizon_months is None:
+        horizon_months = settings.RENT_SCHEDULE_HORIZON_MONTHS
+    target = today.year * 12 + today.month - 1 + horizon_months
+
+    tenants = Tenant.objects.filter(
+        Q(contract_end__isnull=True) | Q(contract_end__gte=today),
+        contract_start__isnull=False,
+    ).annotate(
+        last_index=Max(F('payments__year') * 12 + F('payments__month') - 1),
+    ).filter(
+        # no rows yet, or short of the horizon and (for fixed terms) of the contract's last month
+        Q(last_index__isnull=True) | Q(last_index__lt=target) & (
+            Q(contract_end__isnull=True)
+            | Q(last_index__lt=F('contract_end__year') * 12 + F('contract_end__month') - 1)
+        ),
+    ).values_list('id', 'contract_start', 'contract_end', 'monthly_rent', 'last_index', 'apartment__owner_id')
+
+    # fetched up front: SQLite gives no isolation between a cursor and inserts on the same connection
+    candidates = list(tenants)
+    extended, owner_ids = set(), set()
+
+    def rows():
+        for tenant_id, start, end, rent, last_index, owner_id in candidates:
+            for payment in iter_schedule_extension([(tenant_id, start, end, rent, last_index)], target):
+                extended.add(tenant_id)
+                owner_ids.add(owner_id)
+                yield payment
+
+    created = bulk_create_in_chunks(RentPayment, rows(), batch_size)
+    if owner_ids:
+        invalidate_owner_analytics(*owner_ids)
+    return len(extended), created
+
+
+def create_contract_notifications(today=None):
+    """
+    Notify owners (and their accountants) of contracts starting today or
+    ending in 7 days, from one query and one notify_owners batch. Run once a day.
+    """
+    today = today or timezone.now().date()
+    in_7_days = today + timedelta(days=7)
+    tenants = Tenant.objects.filter(Q(contract_start=today) | Q(contract_end=in_7_days)).values_list(
+        'apartment__owner_id', 'full_name', 'apartment__title', 'contract_start', 'contract_end',
+    )
+    events = []
+    for owner_id, full_name, title, contract_start, contract_end in tenants:
+        if contract_start == today:
+            events.append((
+                owner_id, 'contract_starting', f'Contract Starting - {full_name}',
+                f'Contract for {full_name} at {title} starts today',
+            ))
+        if contract_end == in_7_days:
+            events.append((
+                owner_id, 'contract_ending', f'Contract Ending Soon - {full_name}',
+                f'Contract for {full_name} at {title} ends in 7 days',
+            ))
+    return notify_owners(events)
+
+
+def create_overdue_payment_notifications(today=None):
+    """
+    One overdue-payment notification per owner listing all their overdue
+    payments; owners with an unread one are skipped until they read it.
+    """
+    today = today or timezone.now().date()
+    overdue = defaultdict(list)
+    for owner_id, full_name, year, month in RentPayment.objects.filter(paid=False, due_date__lt=today).order_by(
+        'owner_id', 'due_date',
+    ).values_list('owner_id', 'tenant__full_name', 'year', 'month'):
+        overdue[owner_id].append(f'{full_name} ({year}/{month})')
+    # notifications live in the default database, payments possibly in a shard: no join
+    notified = set(Notification.objects.filter(
+        user_id__in=overdue, notification_type='overdue_payment', is_read=False,
+    ).values_list('user_id', flat=True))
+    return notify_owners(
+        (
+            owner_id, 'overdue_payment', f'Overdue Payments ({len(payments)})',
+            f"Payments overdue: {', '.join(payments)}",
+        )
+        for owner_id, payments in overdue.items()
+        if owner_id not in notified
+    )
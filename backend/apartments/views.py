@@ -1,11 +1,48 @@
-from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.viewsets import ModelViewSet, ViewSet
+from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.exceptions import PermissionDenied
-from django.db import models
-from .models import Apartment, Tenant, RentPayment, Document, Notification
-from .serializers import ApartmentSerializer, TenantSerializer, RentPaymentSerializer, DocumentSerializer, NotificationSerializer
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from contextlib import ExitStack, contextmanager, nullcontext
+from datetime import date, timedelta
+import csv
+import os
+from config import db_routers, sharding
+from config.throttles import TokenBucketThrottle
+from .models import (
+    Apartment, Tenant, RentPayment, Document, Notification, ArchivedNotification, PaymentEvent, PeriodClose,
+    LateFee, LateFeeRule, PaymentTransaction,
+)
+from .serializers import (
+    ApartmentSerializer, ApartmentListSerializer,
+    TenantSerializer, TenantListSerializer,
+    RentPaymentSerializer, RentPaymentListSerializer,
+    DocumentSerializer, DocumentListSerializer,
+    NotificationSerializer, NotificationListSerializer, ArchivedNotificationListSerializer,
+    PaymentEventListSerializer, PeriodCloseSerializer, LateFeeRuleSerializer, RentIndexationSerializer,
+    PaymentTransactionSerializer,
+    selected_field_names,
+)
+from .analytics import AGING_BUCKETS, AGING_GROUPS, arrears_aging, portfolio_analytics
+from .forecast import FORECAST_GROUPS, cash_flow_forecast
+from .importers import PortfolioImportError, read_rows, validate_rows, write_portfolio
+from .indexation import IndexationError, index_rents
+from .idempotency import idempotent
+from .ledger import LedgerError, delete_transaction, mark_payment_paid, mark_payment_unpaid, record_transaction, tenant_ledger
+from .notifications import notify_owner
+from .occupancy import vacancy_calendar
+from .periods import PeriodCloseError, close_period, is_period_closed, period_report
+from .receipts import ReceiptError, receipt_document, statement_document
+from .tax import E2_COLUMNS, e2_rows, e2_statements
+from .renderers import COLUMNAR_RENDERER_CLASSES, ColumnarRenderer
 
 
 def get_allowed_owner_ids(user):
@@ -14,14 +51,237 @@ def get_allowed_owner_ids(user):
     if user.role == 'owner':
         return [user.id]
     if user.role == 'accountant':
+        # stateless token users already carry their owner ids
+        owner_ids = getattr(user, 'owner_ids', None)
+        if owner_ids is not None:
+            return list(owner_ids)
         from users.models import AccountantOwner
-        return list(AccountantOwner.objects.filter(accountant=user).values_list('owner_id', flat=True))
+        return list(AccountantOwner.objects.filter(accountant_id=user.id).values_list('owner_id', flat=True))
     return []
 
 
-class ApartmentViewSet(ModelViewSet):
+def csv_response(filename, columns, rows):
+    """CSV download of ``rows`` (dicts) restricted to ``columns``."""
+    response = HttpResponse(content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.write('\ufeff')  # BOM so Excel opens Greek text correctly
+    writer = csv.DictWriter(response, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(rows)
+    return response
+
+
+def ensure_open_period(owner_id, year, month):
+    """Reject changes to a payment month the owner has closed (PERIOD_CLOSE_EDIT_POLICY 'block')."""
+    if settings.PERIOD_CLOSE_EDIT_POLICY != 'block':
+        return
+    if is_period_closed(owner_id, year, month):
+        raise ValidationError({'period': [f"Η περίοδος {month}/{year} έχει κλείσει"]})
+
+
+def pdf_response(document):
+    """Inline download of a generated (receipt/statement) Document."""
+    return FileResponse(
+        document.file.open('rb'), content_type='application/pdf', filename=os.path.basename(document.file.name),
+    )
+
+
+def resolve_owner_id(user, owner_id):
+    """Owner to create records for: the user itself, or a permitted ``owner_id`` for admins/accountants."""
+    if user.role == 'owner':
+        return user.id
+    # admin or accountant must provide owner
+    if not owner_id:
+        raise PermissionDenied("Απαιτείται owner για δημιουργία")
+    try:
+        owner_id = int(owner_id)
+    except ValueError:
+        raise PermissionDenied("Μη έγκυρο owner")
+    owner_ids = get_allowed_owner_ids(user)
+    if owner_ids is not None and owner_id not in owner_ids:
+        raise PermissionDenied("Δεν έχετε πρόσβαση σε αυτόν τον ιδιοκτήτη")
+    return owner_id
+
+
+class OwnerMoved(APIException):
+    status_code = 409
+    default_detail = "Τα δεδομένα μεταφέρονται σε άλλη βάση, δοκιμάστε ξανά σε λίγο"
+    default_code = 'owner_moved'
+
+
+class OwnerShardMixin:
+    """
+    Route the sharded models to the shard of the request's owner scope (a
+    no-op unless settings.DATABASE_SHARDS is set); writes run atomically on
+    that shard. A scope spread over several shards is narrowed by ``?owner=``
+    or an ``owner`` field, or by the shard holding the object (detail routes)
+    or the referenced tenant/apartment/payment (create). Lean lists are gathered
+    from every shard; anything else is rejected. Writes for an owner that is
+    being moved between shards get 409. Views with ``atomic_writes = False``
+    open the write transaction themselves with ``write_atomic()``.
+    """
+    atomic_writes = True
+
+    def dispatch(self, request, *args, **kwargs):
+        with ExitStack() as self._shard_stack:
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._shard = None
+        if not sharding.sharding_enabled():
+            return
+        self._shard = self.get_shard_alias(request)
+        if self._shard is not None:
+            self._shard_stack.enter_context(sharding.use_shard(self._shard))
+            if request.method not in SAFE_METHODS:
+                owner_ids = get_allowed_owner_ids(request.user)
+                if sharding.placement_conflict(owner_ids, self._shard):
+                    raise OwnerMoved()
+                if self.atomic_writes:
+                    self._shard_stack.enter_context(self.write_atomic())
+
+    @contextmanager
+    def write_atomic(self):
+        """Atomic block on the request's shard (default without sharding)."""
+        shard = getattr(self, '_shard', None)
+        with transaction.atomic(using=shard):
+            # the owner may have been moved while this request waited for the shard's write lock
+            if shard is not None and sharding.placement_conflict(get_allowed_owner_ids(self.request.user), shard):
+                raise OwnerMoved()
+            yield
+
+    def get_shard_alias(self, request):
+        aliases = sharding.shards_for_owners(get_allowed_owner_ids(request.user))
+        if len(aliases) <= 1:
+            return aliases[0] if aliases else None
+        owner_id = request.query_params.get('owner') or request.data.get('owner')
+        if owner_id:
+            return sharding.shard_for_owner(resolve_owner_id(request.user, owner_id))
+        if self.kwargs.get('pk') is not None:
+            # ids are unique across shards, so at most one of them has the object
+            queryset = self.get_queryset().filter(pk=self.kwargs['pk'])
+            return next((alias for alias in aliases if queryset.using(alias).exists()), aliases[0])
+        for field, model in (('tenant', Tenant), ('apartment', Apartment), ('payment', RentPayment)):
+            if request.data.get(field):
+                related = model.objects.filter(pk=request.data[field])
+                return next((alias for alias in aliases if related.using(alias).exists()), aliases[0])
+        if getattr(self, 'action', None) == 'list' and getattr(self, 'list_serializer_class', None) is not None:
+            self.scatter_aliases = aliases
+            return None
+        raise ValidationError({'owner': ["Τα δεδομένα σας είναι σε περισσότερες βάσεις: ορίστε owner"]})
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        shard = getattr(self, '_shard', None)
+        if shard is not None and response.status_code >= 400 and transaction.get_connection(shard).in_atomic_block:
+            transaction.set_rollback(True, using=shard)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaReadMixin:
+    """
+    Route safe-method reads to a read replica. Successful writes keep the
+    user on the primary until a replica has been synced past them, so they
+    always read their own changes (see config.db_routers).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self._replica_token = db_routers.route_reads_to_replica(request.user.pk)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_token', None)
+        if token is not None:
+            db_routers.reset_read_routing(token)
+            self._replica_token = None
+        elif request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            db_routers.record_write(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ImmediateWriteMixin:
+    """
+    Run unsafe-method requests in one atomic block. With the SQLite
+    ``transaction_mode: IMMEDIATE`` option this is a ``BEGIN IMMEDIATE``,
+    so concurrent writers queue on busy_timeout instead of deadlocking.
+    Views that set ``atomic_writes = False`` take the write lock themselves.
+    """
+    atomic_writes = True
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in SAFE_METHODS or not self.atomic_writes:
+            return super().dispatch(request, *args, **kwargs)
+        with transaction.atomic():
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+            return response
+
+
+class LeanListMixin:
+    """
+    Serve ``list`` through ``list_serializer_class`` from ``values()`` rows,
+    selecting only the columns left after ``?fields=`` / ``?omit=``.
+    Columnar renderers get the whole filtered set as ``values_list`` rows, so
+    those lists (and the actions in ``throttle_cost_classes``) are throttled.
+    """
+    throttle_classes = [TokenBucketThrottle]
+    list_serializer_class = None
+    # shards a list is gathered from (set by OwnerShardMixin)
+    scatter_aliases = None
+
+    def get_throttle_cost_class(self, request):
+        # columnar renderers return the whole filtered set in one response
+        if self.action == 'list' and isinstance(getattr(request, 'accepted_renderer', None), ColumnarRenderer):
+            return 'heavy'
+        return None
+
+    def get_serializer_class(self):
+        if self.action == 'list' and self.list_serializer_class is not None:
+            return self.list_serializer_class
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        if self.list_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+        serializer_class = self.list_serializer_class
+        names = selected_field_names(request, serializer_class.Meta.fields)
+        queryset = self.filter_queryset(self.get_queryset())
+
+        if self.scatter_aliases:
+            ordering = queryset.query.order_by or queryset.model._meta.ordering
+            rows = sharding.scatter_gather(
+                serializer_class.values_queryset(queryset, names), self.scatter_aliases, ordering,
+            )
+            if isinstance(request.accepted_renderer, ColumnarRenderer):
+                return Response({'columns': names, 'rows': [[row[name] for name in names] for row in rows]})
+            page = self.paginate_queryset(rows)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer(rows, many=True).data)
+
+        if isinstance(request.accepted_renderer, ColumnarRenderer):
+            rows = serializer_class.values_list_queryset(queryset, names)
+            return Response({'columns': names, 'rows': [list(row) for row in rows]})
+
+        queryset = serializer_class.values_queryset(queryset, names)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class ApartmentViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, LeanListMixin, ModelViewSet):
     serializer_class = ApartmentSerializer
+    list_serializer_class = ApartmentListSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *COLUMNAR_RENDERER_CLASSES]
+    throttle_cost_classes = {'vacancy': 'heavy'}
+    max_vacancy_days = 3 * 366
 
     def get_queryset(self):
         owner_ids = get_allowed_owner_ids(self.request.user)
@@ -31,27 +291,35 @@ class ApartmentViewSet(ModelViewSet):
         return qs
 
     def perform_create(self, serializer):
-        user = self.request.user
-        if user.role == 'owner':
-            serializer.save(owner=user)
-            return
-        # admin or accountant must provide owner
-        owner_id = self.request.data.get('owner')
-        if not owner_id:
-            raise PermissionDenied("Απαιτείται owner για δημιουργία")
+        serializer.save(owner_id=resolve_owner_id(self.request.user, self.request.data.get('owner')))
+
+    @action(detail=False, methods=['get'])
+    def vacancy(self, request):
+        """Paginated occupancy timeline per apartment for ?from=&to= (YYYY-MM-DD, default the next 90 days), optionally ?apartment="""
+        today = timezone.now().date()
         try:
-            owner_id = int(owner_id)
+            start = date.fromisoformat(request.query_params['from']) if request.query_params.get('from') else today
+            end = date.fromisoformat(request.query_params['to']) if request.query_params.get('to') else start + timedelta(days=89)
         except ValueError:
-            raise PermissionDenied("Μη έγκυρο owner")
-        owner_ids = get_allowed_owner_ids(user)
-        if owner_ids is not None and owner_id not in owner_ids:
-            raise PermissionDenied("Δεν έχετε πρόσβαση σε αυτόν τον ιδιοκτήτη")
-        serializer.save(owner_id=owner_id)
+            return Response({'period': ["Μη έγκυρο διάστημα (YYYY-MM-DD)"]}, status=400)
+        if not start <= end <= start + timedelta(days=self.max_vacancy_days):
+            return Response({'period': [f"Το διάστημα πρέπει να είναι έως {self.max_vacancy_days} ημέρες"]}, status=400)
+        apartments = self.get_queryset()
+        if request.query_params.get('apartment'):
+            apartments = apartments.filter(pk=request.query_params['apartment'])
+        page = self.paginate_queryset(apartments.order_by('id').values_list('id', flat=True))
+        calendar = vacancy_calendar(apartments.filter(pk__in=page), start, end)
+        response = self.get_paginated_response(calendar.pop('apartments'))
+        # from, to and the apartments of the page vacant throughout
+        response.data.update(calendar)
+        return response
 
 
-class TenantViewSet(ModelViewSet):
+class TenantViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, LeanListMixin, ModelViewSet):
     serializer_class = TenantSerializer
+    list_serializer_class = TenantListSerializer
     permission_classes = [IsAuthenticated]
+    throttle_cost_classes = {'index_rents': 'heavy'}
 
     def get_queryset(self):
         owner_ids = get_allowed_owner_ids(self.request.user)
@@ -72,83 +340,197 @@ class TenantViewSet(ModelViewSet):
         from .utils import generate_rent_payments
         generate_rent_payments(tenant)
 
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Yearly payment statement PDF (?year=, default this year), kept as a Document"""
+        tenant = self.get_object()
+        try:
+            year = int(request.query_params.get('year', timezone.now().year))
+            document = statement_document(tenant.pk, year)
+        except ValueError:
+            return Response({'year': ["Μη έγκυρο έτος"]}, status=400)
+        except ReceiptError as exc:
+            return Response({'statement': [str(exc)]}, status=400)
+        return pdf_response(document)
+
+    @action(detail=True, methods=['get'])
+    def ledger(self, request, pk=None):
+        """Payments with balances and running balance, and partial payments, optionally for ?year="""
+        tenant = self.get_object()
+        try:
+            year = int(request.query_params['year']) if request.query_params.get('year') else None
+        except ValueError:
+            return Response({'year': ["Μη έγκυρο έτος"]}, status=400)
+        return Response(tenant_ledger(tenant.pk, year))
+
+    # a dry run is only reads and must not take the write lock
+    @action(detail=False, methods=['post'], atomic_writes=False)
+    def index_rents(self, request):
+        """Raise rents and unpaid payments from effective_date by a percent or a per-month table (dry_run previews)"""
+        params = RentIndexationSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        owner_ids = get_allowed_owner_ids(request.user)
+        if request.data.get('owner'):
+            owner_ids = [resolve_owner_id(request.user, request.data['owner'])]
+        try:
+            with nullcontext() if data['dry_run'] else self.write_atomic():
+                result = index_rents(
+                    owner_ids,
+                    data['effective_date'],
+                    percent=data.get('percent'),
+                    table=data.get('table'),
+                    apartment_ids=data.get('apartments'),
+                    tenant_ids=data.get('tenants'),
+                    dry_run=data['dry_run'],
+                )
+        except IndexationError as exc:
+            return Response({'indexation': [str(exc)]}, status=400)
+        return Response(result)
+
 
-class RentPaymentViewSet(ModelViewSet):
+class RentPaymentViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, LeanListMixin, ModelViewSet):
     serializer_class = RentPaymentSerializer
+    list_serializer_class = RentPaymentListSerializer
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *COLUMNAR_RENDERER_CLASSES]
 
     def get_queryset(self):
         owner_ids = get_allowed_owner_ids(self.request.user)
         qs = RentPayment.objects.select_related('tenant__apartment')
         if owner_ids is not None:
-            qs = qs.filter(tenant__apartment__owner_id__in=owner_ids)
+            qs = qs.filter(owner_id__in=owner_ids)
         return qs
 
+    def ensure_open_period(self, tenant, year, month):
+        ensure_open_period(tenant.apartment.owner_id, year, month)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        self.ensure_open_period(data['tenant'], data['year'], data['month'])
+        serializer.save()
+
+    def perform_update(self, serializer):
+        payment, data = serializer.instance, serializer.validated_data
+        self.ensure_open_period(payment.tenant, payment.year, payment.month)
+        self.ensure_open_period(data.get('tenant', payment.tenant), data.get('year', payment.year), data.get('month', payment.month))
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        self.ensure_open_period(instance.tenant, instance.year, instance.month)
+        instance.delete()
+
     @action(detail=True, methods=['post'])
+    @idempotent
     def mark_paid(self, request, pk=None):
-        """Mark a payment as paid"""
-        from django.utils import timezone
+        """Mark a payment as paid (a conditional update: only the first of concurrent calls notifies)"""
         payment = self.get_object()
-        payment.paid = True
-        payment.paid_date = timezone.now().date()
-        
+        self.ensure_open_period(payment.tenant, payment.year, payment.month)
         # Update payment with additional info if provided
-        if 'payment_method' in request.data:
-            payment.payment_method = request.data['payment_method']
-        if 'receipt_number' in request.data:
-            payment.receipt_number = request.data['receipt_number']
-        if 'notes' in request.data:
-            payment.notes = request.data['notes']
-        
-        payment.save()
-        
-        # Create notification for owner
-        owner = payment.tenant.apartment.owner
-        Notification.objects.create(
-            user=owner,
-            notification_type="payment_received",
-            title=f"Ενοίκιο Λήφθηκε - {payment.tenant.full_name}",
-            message=f"Λήφθηκε ενοίκιο {payment.tenant.full_name} για το {payment.month}/{payment.year} ποσού {payment.amount}€"
-        )
+        fields = {name: request.data[name] for name in ('payment_method', 'receipt_number', 'notes') if name in request.data}
+
+        if mark_payment_paid(payment, **fields):
+            # Notify the owner and their accountants (immediately or in their digest)
+            notify_owner(
+                payment.owner_id,
+                "payment_received",
+                f"Ενοίκιο Λήφθηκε - {payment.tenant.full_name}",
+                f"Λήφθηκε ενοίκιο {payment.tenant.full_name} για το {payment.month}/{payment.year} ποσού {payment.amount}€",
+            )
         
         serializer = self.get_serializer(payment)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def receipt(self, request, pk=None):
+        """Receipt PDF of a paid payment, rendered once and kept as a Document"""
+        payment = self.get_object()
+        try:
+            document = receipt_document(payment.pk)
+        except ReceiptError as exc:
+            return Response({'receipt': [str(exc)]}, status=400)
+        return pdf_response(document)
+
     @action(detail=True, methods=['post'])
+    @idempotent
     def mark_unpaid(self, request, pk=None):
         """Mark a payment as unpaid"""
         payment = self.get_object()
-        payment.paid = False
-        payment.paid_date = None
-        payment.save()
+        self.ensure_open_period(payment.tenant, payment.year, payment.month)
+        try:
+            mark_payment_unpaid(payment)
+        except LedgerError as exc:
+            return Response({'paid': [str(exc)]}, status=400)
         serializer = self.get_serializer(payment)
         return Response(serializer.data)
 
 
-class DocumentViewSet(ModelViewSet):
+class PaymentTransactionViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, ModelViewSet):
+    """Partial payments: POST {payment, amount[, paid_date, payment_method, ...]} marks the payment paid once covered"""
+    serializer_class = PaymentTransactionSerializer
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'post', 'delete']
+
+    def get_queryset(self):
+        owner_ids = get_allowed_owner_ids(self.request.user)
+        qs = PaymentTransaction.objects.all()
+        if owner_ids is not None:
+            qs = qs.filter(owner_id__in=owner_ids)
+        if self.request.query_params.get('payment'):
+            qs = qs.filter(payment_id=self.request.query_params['payment'])
+        return qs
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        payment = data['payment']
+        owner_ids = get_allowed_owner_ids(self.request.user)
+        if owner_ids is not None and payment.owner_id not in owner_ids:
+            raise PermissionDenied("Δεν έχετε πρόσβαση σε αυτή την πληρωμή")
+        ensure_open_period(payment.owner_id, payment.year, payment.month)
+        try:
+            serializer.instance = record_transaction(
+                payment,
+                data['amount'],
+                paid_date=data.get('paid_date'),
+                payment_method=data.get('payment_method'),
+                receipt_number=data.get('receipt_number', ''),
+                notes=data.get('notes', ''),
+            )
+        except LedgerError as exc:
+            raise ValidationError({'amount': [str(exc)]})
+
+    def perform_destroy(self, instance):
+        ensure_open_period(instance.owner_id, instance.payment.year, instance.payment.month)
+        delete_transaction(instance)
+
+
+class DocumentViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, LeanListMixin, ModelViewSet):
     serializer_class = DocumentSerializer
+    list_serializer_class = DocumentListSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         owner_ids = get_allowed_owner_ids(self.request.user)
         qs = Document.objects.all()
         if owner_ids is not None:
-            qs = qs.filter(
-                models.Q(tenant__apartment__owner_id__in=owner_ids) |
-                models.Q(apartment__owner_id__in=owner_ids)
-            )
+            qs = qs.filter(owner_id__in=owner_ids)
         return qs
 
     def perform_create(self, serializer):
         serializer.save()
 
 
-class NotificationViewSet(ModelViewSet):
+class NotificationViewSet(ReplicaReadMixin, ImmediateWriteMixin, LeanListMixin, ModelViewSet):
     serializer_class = NotificationSerializer
+    list_serializer_class = NotificationListSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        return Notification.objects.filter(user_id=self.request.user.id)
 
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
@@ -162,14 +544,27 @@ class NotificationViewSet(ModelViewSet):
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
         """Get count of unread notifications"""
-        count = Notification.objects.filter(user=request.user, is_read=False).count()
+        count = Notification.objects.filter(user_id=request.user.id, is_read=False).count()
         return Response({'unread_count': count})
 
+    @action(detail=False, methods=['get'])
+    def archive(self, request):
+        """Archived (pruned) notifications of the user, newest first; ?notification_type= filters"""
+        queryset = ArchivedNotification.objects.filter(user_id=request.user.id)
+        if request.query_params.get('notification_type'):
+            queryset = queryset.filter(notification_type=request.query_params['notification_type'])
+        names = selected_field_names(request, ArchivedNotificationListSerializer.Meta.fields)
+        queryset = ArchivedNotificationListSerializer.values_queryset(queryset, names)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(ArchivedNotificationListSerializer(page, many=True).data)
+
 
-class TenantHistoryViewSet(ModelViewSet):
+class TenantHistoryViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, LeanListMixin, ModelViewSet):
     """ViewSet for retrieving tenant history with contracts and payments"""
     serializer_class = TenantSerializer
+    list_serializer_class = TenantListSerializer
     permission_classes = [IsAuthenticated]
+    throttle_cost_classes = {'summary': 'heavy'}
     http_method_names = ['get']
 
     def get_queryset(self):
@@ -182,7 +577,24 @@ class TenantHistoryViewSet(ModelViewSet):
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Get summary of all tenants, contracts, and payments"""
-        tenants = self.get_queryset()
+        tenants = self.get_queryset().prefetch_related(None)
+        late_fees = dict(
+            LateFee.objects.filter(payment__tenant__in=tenants).order_by().values('payment__tenant_id').annotate(
+                total=Sum('amount'),
+            ).values_list('payment__tenant_id', 'total')
+        )
+        # collected counts partial payments; one grouped query for every tenant
+        payments = {
+            row['tenant_id']: row
+            for row in RentPayment.objects.filter(tenant__in=tenants).annotate(
+                collected=PaymentTransaction.collected(),
+            ).order_by().values('tenant_id').annotate(
+                total_paid=Sum('collected'),
+                total_unpaid=Sum(F('amount') - F('collected'), filter=Q(paid=False)),
+                paid_count=Count('id', filter=Q(paid=True)),
+                unpaid_count=Count('id', filter=Q(paid=False)),
+            )
+        }
         
         summary_data = {
             'total_tenants': tenants.count(),
@@ -191,20 +603,21 @@ class TenantHistoryViewSet(ModelViewSet):
             'total_rent_collected': 0,
             'total_payments_received': 0,
             'pending_payments': 0,
+            'total_late_fees': 0,
             'tenants': []
         }
 
         for tenant in tenants:
-            payments = tenant.payments.all()
-            paid_payments = payments.filter(paid=True)
-            unpaid_payments = payments.filter(paid=False)
-            
-            total_paid = sum(p.amount for p in paid_payments)
-            total_unpaid = sum(p.amount for p in unpaid_payments)
+            totals = payments.get(tenant.id, {})
+            total_paid = totals.get('total_paid') or 0
+            total_unpaid = totals.get('total_unpaid') or 0
+            paid_count = totals.get('paid_count', 0)
+            unpaid_count = totals.get('unpaid_count', 0)
             
             summary_data['total_rent_collected'] += float(tenant.monthly_rent) if tenant.contract_end is None else 0
             summary_data['total_payments_received'] += float(total_paid)
             summary_data['pending_payments'] += float(total_unpaid)
+            summary_data['total_late_fees'] += float(late_fees.get(tenant.id, 0))
             
             tenant_data = {
                 'id': tenant.id,
@@ -220,10 +633,202 @@ class TenantHistoryViewSet(ModelViewSet):
                 'status': 'Current' if tenant.contract_end is None else 'Past',
                 'total_paid': float(total_paid),
                 'total_unpaid': float(total_unpaid),
-                'total_payments': paid_payments.count() + unpaid_payments.count(),
-                'paid_count': paid_payments.count(),
-                'unpaid_count': unpaid_payments.count(),
+                'total_payments': paid_count + unpaid_count,
+                'paid_count': paid_count,
+                'unpaid_count': unpaid_count,
+                'late_fees': float(late_fees.get(tenant.id, 0)),
             }
             summary_data['tenants'].append(tenant_data)
 
-        return Response(summary_data)
\ No newline at end of file
+        return Response(summary_data)
+
+
+class PortfolioImportView(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, APIView):
+    """Bulk import apartments and tenants from an uploaded CSV or XLSX file"""
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_cost_class = 'heavy'
+    parser_classes = [MultiPartParser]
+    # validating a large file must not hold the database write lock
+    atomic_writes = False
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ["Απαιτείται αρχείο"]}, status=400)
+        owner_id = resolve_owner_id(request.user, request.data.get('owner'))
+        try:
+            validated = validate_rows(read_rows(upload, upload.name))
+            with self.write_atomic():
+                created = write_portfolio(validated, owner_id)
+        except PortfolioImportError as exc:
+            return Response({'errors': exc.errors}, status=400)
+        return Response(created, status=201)
+
+
+class PaymentChangesView(OwnerShardMixin, ReplicaReadMixin, APIView):
+    """
+    Incremental feed of PaymentEvent rows after ``?since=<cursor>``, oldest
+    first. Pass the returned ``cursor`` back as ``since`` to get only newer
+    events; SQLite commits writers one at a time, so ids never appear late.
+    """
+    permission_classes = [IsAuthenticated]
+    page_size = 500
+    max_page_size = 5000
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(max(int(request.query_params.get('limit', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            return Response({'since': ["Μη έγκυρος δείκτης"]}, status=400)
+
+        queryset = PaymentEvent.objects.filter(id__gt=since)
+        owner_ids = get_allowed_owner_ids(request.user)
+        if owner_ids is not None:
+            queryset = queryset.filter(owner_id__in=owner_ids)
+        fields = PaymentEventListSerializer.Meta.fields
+        rows = list(PaymentEventListSerializer.values_queryset(queryset.order_by('id'), fields)[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return Response({
+            'results': PaymentEventListSerializer(rows, many=True).data,
+            'cursor': rows[-1]['id'] if rows else since,
+            'has_more': has_more,
+        })
+
+
+class PeriodCloseViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, ModelViewSet):
+    """Month-end closes: POST {year, month[, owner]} freezes a month, ``report`` reads the snapshots"""
+    serializer_class = PeriodCloseSerializer
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_cost_classes = {'create': 'heavy', 'report': 'heavy'}
+    http_method_names = ['get', 'post']
+
+    def get_queryset(self):
+        owner_ids = get_allowed_owner_ids(self.request.user)
+        qs = PeriodClose.objects.all()
+        if owner_ids is not None:
+            qs = qs.filter(owner_id__in=owner_ids)
+        return qs
+
+    def create(self, request, *args, **kwargs):
+        owner_id = resolve_owner_id(request.user, request.data.get('owner'))
+        try:
+            year, month = int(request.data.get('year')), int(request.data.get('month'))
+        except (TypeError, ValueError):
+            return Response({'period': ["Απαιτούνται έγκυρα year και month"]}, status=400)
+        try:
+            close = close_period(owner_id, year, month, closed_by_id=request.user.id)
+        except PeriodCloseError as exc:
+            return Response({'period': [str(exc)]}, status=400)
+        return Response(self.get_serializer(close).data, status=201)
+
+    @action(detail=False, methods=['get'])
+    def report(self, request):
+        """Monthly totals for ?from=YYYY-MM&to=YYYY-MM, closed months read from their snapshots"""
+        today = timezone.now().date()
+        try:
+            start = tuple(int(part) for part in request.query_params.get('from', f'{today.year}-01').split('-'))
+            end = tuple(int(part) for part in request.query_params.get('to', f'{today.year}-{today.month:02d}').split('-'))
+            if len(start) != 2 or len(end) != 2 or start > end:
+                raise ValueError
+        except ValueError:
+            return Response({'period': ["Μη έγκυρο διάστημα (YYYY-MM)"]}, status=400)
+        return Response(period_report(get_allowed_owner_ids(request.user), start, end))
+
+
+class LateFeeRuleViewSet(OwnerShardMixin, ReplicaReadMixin, ImmediateWriteMixin, ModelViewSet):
+    """Late-fee rules: one per owner (apartment empty) plus optional per-apartment overrides"""
+    serializer_class = LateFeeRuleSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        owner_ids = get_allowed_owner_ids(self.request.user)
+        qs = LateFeeRule.objects.all()
+        if owner_ids is not None:
+            qs = qs.filter(owner_id__in=owner_ids)
+        return qs
+
+    def check_apartment(self, apartment, owner_id, rule=None):
+        if apartment is not None and apartment.owner_id != owner_id:
+            raise ValidationError({'apartment': ["Το ακίνητο ανήκει σε άλλον ιδιοκτήτη"]})
+        existing = LateFeeRule.objects.filter(owner_id=owner_id, apartment=apartment)
+        if rule is not None:
+            existing = existing.exclude(pk=rule.pk)
+        if existing.exists():
+            raise ValidationError({'apartment': ["Υπάρχει ήδη κανόνας για αυτό το ακίνητο"]})
+
+    def perform_create(self, serializer):
+        owner_id = resolve_owner_id(self.request.user, self.request.data.get('owner'))
+        self.check_apartment(serializer.validated_data.get('apartment'), owner_id)
+        serializer.save(owner_id=owner_id)
+
+    def perform_update(self, serializer):
+        rule = serializer.instance
+        self.check_apartment(serializer.validated_data.get('apartment', rule.apartment), rule.owner_id, rule)
+        serializer.save()
+
+
+class AnalyticsViewSet(OwnerShardMixin, ReplicaReadMixin, ViewSet):
+    """Server-side portfolio analytics scoped to the owners the user can see"""
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_cost_class = 'heavy'
+
+    @action(detail=False, methods=['get'])
+    def portfolio(self, request):
+        """Occupancy, rent per m², collection rate and monthly trends by city, region and property type"""
+        try:
+            months = min(max(int(request.query_params.get('months', 12)), 1), 60)
+        except ValueError:
+            return Response({'months': ["Μη έγκυρος αριθμός μηνών"]}, status=400)
+        return Response(portfolio_analytics(get_allowed_owner_ids(request.user), months))
+
+    @action(detail=False, methods=['get'])
+    def forecast(self, request):
+        """Projected rent per month for 12-60 months ahead per owner, apartment or city, merged with actual payments"""
+        group = request.query_params.get('group', 'owner')
+        if group not in FORECAST_GROUPS:
+            return Response({'group': [f"Επιτρεπτές τιμές: {', '.join(FORECAST_GROUPS)}"]}, status=400)
+        try:
+            months = min(max(int(request.query_params.get('months', 12)), 12), 60)
+        except ValueError:
+            return Response({'months': ["Μη έγκυρος αριθμός μηνών"]}, status=400)
+        return Response(cash_flow_forecast(get_allowed_owner_ids(request.user), group, months))
+
+    @action(detail=False, methods=['get'])
+    def aging(self, request):
+        """Outstanding rent bucketed by days past due (0-30, 31-60, 61-90, 90+) per tenant, apartment or owner"""
+        group = request.query_params.get('group', 'tenant')
+        if group not in AGING_GROUPS:
+            return Response({'group': [f"Επιτρεπτές τιμές: {', '.join(AGING_GROUPS)}"]}, status=400)
+        today = timezone.now().date()
+        rows = arrears_aging(get_allowed_owner_ids(request.user), group, today)
+
+        if request.query_params.get('export') == 'csv':
+            columns = [*AGING_GROUPS[group], *AGING_BUCKETS, 'total', 'late_fees', 'payments', 'oldest_due_date']
+            return csv_response(f'aging-{group}-{today}.csv', columns, rows)
+
+        totals = {bucket: sum(row[bucket] for row in rows) for bucket in (*AGING_BUCKETS, 'total', 'late_fees')}
+        return Response({'as_of': today, 'group': group, 'buckets': AGING_BUCKETS, 'totals': totals, 'rows': rows})
+
+    @action(detail=False, methods=['get'])
+    def e2(self, request):
+        """Yearly rental income per apartment and tenant period (form E2) for ?year= (default last year), per owner"""
+        try:
+            year = int(request.query_params.get('year', timezone.now().year - 1))
+        except ValueError:
+            return Response({'year': ["Μη έγκυρο έτος"]}, status=400)
+        owner_ids = get_allowed_owner_ids(request.user)
+        if request.query_params.get('owner'):
+            owner_ids = [resolve_owner_id(request.user, request.query_params['owner'])]
+        elif owner_ids is None:
+            from users.models import User
+            owner_ids = list(User.objects.filter(role='owner').order_by('id').values_list('id', flat=True))
+        statements = e2_statements(owner_ids, year)
+
+        if request.query_params.get('export') == 'csv':
+            return csv_response(f'e2-{year}.csv', E2_COLUMNS, e2_rows(statements))
+        return Response({'year': year, 'owners': statements})
@@ -2,6 +2,9 @@
 ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve the composite endpoints in apartments.async_views from here, e.g.
+``uvicorn config.asgi:application``, so a request waiting for its parallel
+queries does not hold a server thread.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
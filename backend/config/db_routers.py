@@ -0,0 +1,111 @@
+"""
+Database routers.
+
+PrimaryReplicaRouter sends reads to one of ``settings.DATABASE_REPLICAS`` only
+while a request has opted in through ``route_reads_to_replica``; everything
+else (writes, migrations, management commands) stays on ``default``.
+
+Replicas are refreshed by ``sync_replicas``, which records in each replica
+file when its copy of the primary was taken. A replica is only used while
+that copy is at most REPLICA_MAX_LAG_SECONDS old, and never for a user whose
+last write is newer than the copy, so users always read their own writes.
+Write times are kept in the default cache; use a shared backend with several
+worker processes, or a read served by another process may miss the user's
+writes of the last REPLICA_MAX_LAG_SECONDS.
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+SYNC_TABLE = 'replica_sync'
+# how long a process trusts the sync time it read from a replica file
+SYNC_TIME_CACHE_SECONDS = 1
+
+_replica_alias = ContextVar('replica_alias', default=None)
+_sync_times = {}
+
+
+def replica_aliases():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in settings.DATABASES]
+
+
+def max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 60)
+
+
+def record_sync(raw_connection, synced_at):
+    """Store ``synced_at`` (when the copy was taken) in a replica's sqlite3 connection."""
+    raw_connection.execute(f'CREATE TABLE IF NOT EXISTS {SYNC_TABLE} (synced_at REAL NOT NULL)')
+    raw_connection.execute(f'DELETE FROM {SYNC_TABLE}')
+    raw_connection.execute(f'INSERT INTO {SYNC_TABLE} (synced_at) VALUES (?)', (synced_at,))
+    raw_connection.commit()
+    _sync_times.clear()
+
+
+def replica_synced_at(alias):
+    """When ``alias`` last copied the primary (0 if never), re-read at most every second."""
+    now = time.time()
+    synced_at, checked_at = _sync_times.get(alias, (0, 0))
+    if now - checked_at >= SYNC_TIME_CACHE_SECONDS:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f'SELECT MAX(synced_at) FROM {SYNC_TABLE}')
+                synced_at = cursor.fetchone()[0] or 0
+        except DatabaseError:
+            synced_at = 0
+        _sync_times[alias] = (synced_at, now)
+    return synced_at
+
+
+def route_reads_to_replica(user_id=None):
+    """
+    Pick a replica fresh enough for ``user_id`` for reads in the current
+    context; returns a reset token, or None when reads stay on the primary.
+    """
+    aliases = replica_aliases()
+    if not aliases:
+        return None
+    oldest = max(time.time() - max_lag(), last_write(user_id) if user_id is not None else 0)
+    fresh = [alias for alias in aliases if replica_synced_at(alias) >= oldest]
+    if not fresh:
+        return None
+    return _replica_alias.set(random.choice(fresh))
+
+
+def reset_read_routing(token):
+    _replica_alias.reset(token)
+
+
+def _write_key(user_id):
+    return f'db-last-write:{user_id}'
+
+
+def record_write(user_id):
+    """
+    Remember that ``user_id`` just wrote. Replicas copied before this time are
+    skipped for the user; after REPLICA_MAX_LAG_SECONDS every usable replica is newer.
+    """
+    cache.set(_write_key(user_id), time.time(), max_lag())
+
+
+def last_write(user_id):
+    return cache.get(_write_key(user_id), 0)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _replica_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary file, never migrated on their own
+        return db not in replica_aliases()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 from datetime import timedelta
@@ -18,6 +19,10 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # access tokens carry role/scope claims so API requests skip the User lookup
+    'TOKEN_OBTAIN_SERIALIZER': 'users.tokens.ScopedTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.ScopedTokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'users.tokens.ScopedTokenUser',
 }
 
 
@@ -68,7 +73,7 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ScopedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -77,6 +82,22 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 100,
 }
 
+# Token buckets per role for the expensive views that opt in to
+# config.throttles.TokenBucketThrottle: burst capacity and tokens refilled per
+# second. An owner can open 30 heavy views in a burst, then one every 2 seconds.
+THROTTLE_BUCKETS = {
+    'anon': {'capacity': 20, 'refill_per_second': 0.5},
+    'owner': {'capacity': 300, 'refill_per_second': 5},
+    'accountant': {'capacity': 600, 'refill_per_second': 10},
+    'admin': {'capacity': 1200, 'refill_per_second': 20},
+}
+# Tokens per request by cost class. 'reserve' (fraction of the bucket that must be
+# left) and 'global' (pool shared by all users) shed a class before the others.
+THROTTLE_COST_CLASSES = {
+    'list': {'cost': 2},
+    'heavy': {'cost': 10, 'global': {'capacity': 3000, 'refill_per_second': 100}},
+}
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -104,8 +125,101 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # atomic() blocks take the write lock up front instead of failing on upgrade
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+
+# Applied to every new SQLite connection by apartments.signals.configure_sqlite_connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # KiB
+    'busy_timeout': 5000,  # ms
+}
+
+# Read replicas: comma separated SQLite files, e.g. SPITIIQ_REPLICA_DBS=replica1.sqlite3
+# `python manage.py sync_replicas` copies the primary over; run it from cron more
+# often than REPLICA_MAX_LAG_SECONDS. Safe-method API reads go to a replica synced
+# within that many seconds and after the user's last write, else to the primary.
+for index, replica_name in enumerate(filter(None, os.environ.get('SPITIIQ_REPLICA_DBS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / replica_name.strip(),
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+
+# Optional per-owner sharding (config/sharding.py): comma separated SQLite files,
+# e.g. SPITIIQ_SHARD_DBS=shard1.sqlite3,shard2.sqlite3. Each one is migrated
+# with `python manage.py migrate --database shardN`; owners are moved between
+# them with `python manage.py rebalance_shards`.
+for index, shard_name in enumerate(filter(None, os.environ.get('SPITIIQ_SHARD_DBS', '').split(',')), start=1):
+    DATABASES[f'shard{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / shard_name.strip(),
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
+
+DATABASE_SHARDS = [alias for alias in DATABASES if alias.startswith('shard')]
+DATABASE_ROUTERS = ['config.sharding.OwnerShardRouter', 'config.db_routers.PrimaryReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = 60
+
+# `python manage.py extend_rent_schedules` (run nightly) keeps every active
+# tenant's RentPayment rows filled this many months past the current month
+RENT_SCHEDULE_HORIZON_MONTHS = 12
+
+# Days a *read* notification stays in the hot table before
+# `python manage.py prune_notifications` moves it to ArchivedNotification.
+# Types not listed use 'default'; None keeps that type forever.
+NOTIFICATION_RETENTION_DAYS = {
+    'default': 90,
+    'payment_received': 30,
+    'payment_due': 30,
+    'overdue_payment': 180,
 }
+NOTIFICATION_PRUNE_CHUNK_SIZE = 500
+
+# What the API does with edits to payments of a closed month (see apartments.periods):
+# 'block' rejects them, 'flag' lets them through and marks the PeriodClose amended
+PERIOD_CLOSE_EDIT_POLICY = 'block'
+
+# Responses of POSTs sent with an Idempotency-Key header (payment transitions,
+# partial payments) are replayed to retries for this long;
+# `python manage.py prune_idempotency_keys` deletes older ones.
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+
+# Generated PDF receipts/statements (apartments.receipts, needs reportlab).
+# Greek text needs a TrueType font; bulk runs render in a pool of this many
+# processes (None: one per CPU).
+PDF_FONT_PATH = os.environ.get('SPITIIQ_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+PDF_RENDER_WORKERS = None
+
+
+# Caches
+# Auth scope versions and replica pins live here; use a shared backend
+# (Redis, Memcached, DatabaseCache) when running more than one worker process.
+# With a per-process cache a scope change (role, deactivation, accountant links)
+# reaches the other workers once their cached version expires after
+# AUTH_SCOPE_CACHE_SECONDS; until then they keep accepting the older tokens.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+AUTH_SCOPE_CACHE_SECONDS = 30
 
 
 # Password validation
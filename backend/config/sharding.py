@@ -0,0 +1,341 @@
+"""
+Optional per-owner sharding.
+
+With ``settings.DATABASE_SHARDS`` configured, the owner-scoped apartments
+models (SHARDED_MODELS) live in one SQLite file per owner group; users,
+accountant links, notifications and everything else stay in ``default``.
+``users.OwnerShard`` records where an owner lives (new owners hash onto a
+shard) and ``rebalance_shards`` moves owners between shards.
+
+Requests set the shard for their owner scope with ``use_shard``; reads that
+span several shards go through ``scatter_gather``. Primary keys of sharded
+tables start at a per-shard offset so ids are unique across shards; an
+owner moved by ``move_owner`` gets new ids on the target shard. Its
+PaymentEvents are re-issued above every id the source shard ever handed
+out, so /api/changes/ cursors keep working (the feed replays the owner's
+history with the new payment ids); event ids are therefore only unique per
+shard. SQLite cannot enforce foreign keys across files, so shard
+connections run with ``foreign_keys`` off and rely on the ORM's cascades.
+
+While an owner is moved its OwnerShard row is flagged ``moving`` and the
+source shard's write lock is held, so no write for it is lost; API writes
+check ``placement_conflict`` and are refused until the move is over.
+"""
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import QuerySet
+
+# (model, lookup selecting one owner's rows, {column: model whose new ids it references}), parents first
+OWNER_TABLES = [
+    ('apartments.apartment', 'owner_id', {}),
+    ('apartments.tenant', 'apartment__owner_id', {'apartment_id': 'apartments.apartment'}),
+    ('apartments.rentpayment', 'owner_id', {'tenant_id': 'apartments.tenant'}),
+    ('apartments.document', 'owner_id', {'tenant_id': 'apartments.tenant', 'apartment_id': 'apartments.apartment'}),
+    ('apartments.paymentevent', 'owner_id', {'payment_id': 'apartments.rentpayment'}),
+    ('apartments.periodclose', 'owner_id', {}),
+    ('apartments.latefeerule', 'owner_id', {'apartment_id': 'apartments.apartment'}),
+    ('apartments.latefee', 'owner_id', {'payment_id': 'apartments.rentpayment', 'rule_id': 'apartments.latefeerule'}),
+    ('apartments.paymenttransaction', 'owner_id', {'payment_id': 'apartments.rentpayment'}),
+]
+SHARDED_MODELS = {label for label, _, _ in OWNER_TABLES}
+SHARD_ID_OFFSET = 10 ** 12
+# short, so workers that did not run a move stop routing to the old shard soon after
+MAPPING_CACHE_TIMEOUT = 60
+
+_shard_alias = ContextVar('shard_alias', default=None)
+
+
+def shard_aliases():
+    return [alias for alias in getattr(settings, 'DATABASE_SHARDS', []) if alias in settings.DATABASES]
+
+
+def sharding_enabled():
+    return bool(shard_aliases())
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def sharded_models():
+    return [apps.get_model(label) for label in sorted(SHARDED_MODELS)]
+
+
+def current_shard():
+    return _shard_alias.get()
+
+
+def route_to_shard(alias):
+    """Route sharded models to ``alias`` for the rest of the current context; returns a reset token."""
+    return _shard_alias.set(alias)
+
+
+@contextmanager
+def use_shard(alias):
+    """Route sharded models to ``alias`` inside the block (None leaves routing unchanged)."""
+    if alias is None:
+        yield
+        return
+    token = route_to_shard(alias)
+    try:
+        yield
+    finally:
+        _shard_alias.reset(token)
+
+
+def _mapping_key(owner_id):
+    return f'owner-shard:{owner_id}'
+
+
+def default_shard(owner_id):
+    aliases = shard_aliases()
+    return aliases[zlib.crc32(str(owner_id).encode()) % len(aliases)]
+
+
+def owner_placements():
+    """``{owner_id: alias}`` of every owner with a recorded shard."""
+    from users.models import OwnerShard
+
+    return dict(OwnerShard.objects.values_list('owner_id', 'alias'))
+
+
+def shard_for_owner(owner_id):
+    """Shard holding ``owner_id``'s data: the OwnerShard row, else a hash that is then recorded."""
+    alias = cache.get(_mapping_key(owner_id))
+    if alias is None:
+        from users.models import OwnerShard
+
+        alias = OwnerShard.objects.filter(owner_id=owner_id).values_list('alias', flat=True).first()
+        if alias not in shard_aliases():
+            # recorded so that adding a shard later does not re-hash existing owners
+            alias = default_shard(owner_id)
+            assign_owner(owner_id, alias)
+        cache.set(_mapping_key(owner_id), alias, MAPPING_CACHE_TIMEOUT)
+    return alias
+
+
+def assign_owner(owner_id, alias):
+    from users.models import OwnerShard
+
+    OwnerShard.objects.update_or_create(owner_id=owner_id, defaults={'alias': alias, 'moving': False})
+    cache.set(_mapping_key(owner_id), alias, MAPPING_CACHE_TIMEOUT)
+
+
+def set_moving(owner_id, moving):
+    from users.models import OwnerShard
+
+    OwnerShard.objects.filter(owner_id=owner_id).update(moving=moving)
+
+
+def placement_conflict(owner_ids, alias):
+    """
+    Whether a write for ``owner_ids`` (None: any owner) routed to ``alias``
+    must be refused: one of them is being moved off it, or has moved away
+    since its placement was cached (the cache is corrected). Reads
+    OwnerShard directly, so it sees moves made by other processes.
+    """
+    from users.models import OwnerShard
+
+    if owner_ids is None:
+        return OwnerShard.objects.filter(alias=alias, moving=True).exists()
+    conflict = False
+    for owner_id, placed, moving in OwnerShard.objects.filter(owner_id__in=owner_ids).values_list(
+        'owner_id', 'alias', 'moving',
+    ):
+        if cache.get(_mapping_key(owner_id)) != alias:
+            continue
+        if placed != alias:
+            cache.set(_mapping_key(owner_id), placed, MAPPING_CACHE_TIMEOUT)
+        conflict = conflict or moving or placed != alias
+    return conflict
+
+
+def shards_for_owners(owner_ids):
+    """Shards an owner scope touches; None (admin) means every shard."""
+    if owner_ids is None:
+        return shard_aliases()
+    return sorted({shard_for_owner(owner_id) for owner_id in owner_ids})
+
+
+def each_shard():
+    """Yield every shard alias with routing set to it (a single ``None`` pass when sharding is off)."""
+    for alias in shard_aliases() or [None]:
+        with use_shard(alias):
+            yield alias
+
+
+def _evaluate(queryset, alias):
+    try:
+        return list(queryset.using(alias))
+    finally:
+        connections[alias].close()
+
+
+def scatter_gather(queryset, aliases, ordering=()):
+    """
+    Evaluate ``queryset`` on every shard in ``aliases`` concurrently and merge
+    the rows, sorted by ``ordering`` (model-style names, ``-`` for descending)
+    when given. Rows may be model instances or ``values()`` dicts.
+    """
+    if len(aliases) == 1:
+        rows = list(queryset.using(aliases[0]))
+    else:
+        with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+            rows = [row for result in pool.map(lambda alias: _evaluate(queryset, alias), aliases) for row in result]
+    for name in reversed(list(ordering)):
+        field, descending = name.lstrip('-'), name.startswith('-')
+        getter = (lambda row: row.get(field)) if rows and isinstance(rows[0], dict) else (lambda row: getattr(row, field))
+        if rows and (not isinstance(rows[0], dict) or field in rows[0]):
+            rows.sort(key=lambda row: (getter(row) is None, getter(row)), reverse=descending)
+    return rows
+
+
+def prepare_shard(alias):
+    """Start the primary keys of sharded tables at this shard's offset (run after migrating it)."""
+    index = shard_aliases().index(alias) + 1
+    with connections[alias].cursor() as cursor:
+        # the schema editor switched foreign keys back on after migrating
+        cursor.execute('PRAGMA foreign_keys = OFF')
+    for model in sharded_models():
+        _raise_sequence(alias, model, index * SHARD_ID_OFFSET)
+
+
+def _sequence(alias, model):
+    """Largest id ``alias`` ever handed out for ``model`` (AUTOINCREMENT tables)."""
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _raise_sequence(alias, model, floor):
+    """Make ``alias`` hand out ids above ``floor`` for ``model`` from now on."""
+    table = model._meta.db_table
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, floor])
+        elif row[0] < floor:
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [floor, table])
+
+
+def _delete_rows(alias, model, ids, chunk_size):
+    # raw DELETEs: the rows live on elsewhere, so no cascades, signals or events
+    table = connections[alias].ops.quote_name(model._meta.db_table)
+    with connections[alias].cursor() as cursor:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(chunk))})', chunk)
+
+
+def _owner_row_ids(alias, owner_id):
+    return [
+        (apps.get_model(label), list(
+            QuerySet(apps.get_model(label)).using(alias).filter(**{lookup: owner_id}).values_list('pk', flat=True)
+        ))
+        for label, lookup, _ in OWNER_TABLES
+    ]
+
+
+def move_owner(owner_id, source, target, chunk_size=500):
+    """
+    Copy ``owner_id``'s rows from ``source`` to ``target`` (new ids, references
+    rewritten), delete them from ``source`` and record the new placement.
+    The owner is flagged ``moving`` throughout and ``source``'s write lock is
+    held while its rows are copied, so nothing written meanwhile is lost.
+    The copy commits before the source delete; if that delete fails the copy
+    is removed again, so scatter-gather never sees the owner on both shards.
+    Leftovers of an interrupted move on ``target`` are cleared first.
+    Returns the number of rows moved per model label.
+    """
+    set_moving(owner_id, True)
+    copied = False
+    try:
+        # BEGIN IMMEDIATE: waits for writers already running on source, then blocks new ones
+        with transaction.atomic(using=source):
+            moved = _copy_owner(owner_id, source, target, chunk_size)
+            copied = True
+            _clear_owner(source, owner_id, chunk_size)
+    except BaseException:
+        try:
+            if copied:
+                # the source kept its rows (delete or commit failed): drop the committed copy
+                with transaction.atomic(using=target):
+                    _clear_owner(target, owner_id, chunk_size)
+        finally:
+            set_moving(owner_id, False)
+        raise
+    assign_owner(owner_id, target)
+    return moved
+
+
+def _clear_owner(alias, owner_id, chunk_size):
+    for model, ids in reversed(_owner_row_ids(alias, owner_id)):
+        _delete_rows(alias, model, ids, chunk_size)
+
+
+def _copy_owner(owner_id, source, target, chunk_size):
+    with transaction.atomic(using=target):
+        _clear_owner(target, owner_id, chunk_size)
+
+        # events get ids above every cursor the source shard has handed out
+        event_model = apps.get_model('apartments.paymentevent')
+        _raise_sequence(target, event_model, _sequence(source, event_model))
+
+        new_ids, moved = {}, {}
+        for label, lookup, references in OWNER_TABLES:
+            model = apps.get_model(label)
+            rows = QuerySet(model).using(source).filter(**{lookup: owner_id}).order_by('pk').iterator(chunk_size)
+            ids = new_ids[label] = {}
+            while chunk := list(islice(rows, chunk_size)):
+                old = [obj.pk for obj in chunk]
+                for obj in chunk:
+                    obj.pk = None
+                    for column, referenced in references.items():
+                        value = getattr(obj, column)
+                        setattr(obj, column, new_ids[referenced].get(value, value))
+                # plain QuerySet: history is copied as is, no new 'created' events
+                QuerySet(model).using(target).bulk_create(chunk)
+                ids.update(zip(old, (obj.pk for obj in chunk)))
+            moved[label] = len(ids)
+    return moved
+
+
+class OwnerShardRouter:
+    """Send sharded models to the shard of the current owner scope; defers to the next router otherwise."""
+
+    def _route(self, model, hints):
+        instance = hints.get('instance')
+        on_shard = instance is not None and instance._state.db in shard_aliases()
+        if not is_sharded(model):
+            # e.g. payment.owner: Django would otherwise follow the instance onto its shard
+            return 'default' if on_shard else None
+        if on_shard:
+            return instance._state.db
+        return current_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in shard_aliases():
+            return None
+        if model_name is None:
+            # data migrations backfill rows that predate sharding; shards start empty
+            return False
+        return f'{app_label}.{model_name}' in SHARDED_MODELS
@@ -0,0 +1,99 @@
+"""
+Token-bucket throttling of expensive API views.
+
+Only views that list ``TokenBucketThrottle`` in ``throttle_classes`` are
+throttled, and only for the actions they give a cost class: views name them
+in ``throttle_cost_classes = {action: class}``, ``throttle_cost_class`` or
+``get_throttle_cost_class(request)``; other actions pass untouched. Each user
+(or client IP when anonymous) gets a bucket sized by role from
+``settings.THROTTLE_BUCKETS``, and a request spends the tokens of its class
+(``settings.THROTTLE_COST_CLASSES``). Classes with a ``reserve`` are refused
+while the bucket is below that fraction, and classes with a ``global`` bucket
+also draw from one pool shared by all users. Tokens are only spent when every
+bucket involved allows the request, so a user refused by their own bucket
+does not drain the shared pool.
+
+Buckets live in the default cache: use a shared backend with several worker
+processes. Updates of the same bucket are serialised within a process by a
+lock striped on the bucket key; across processes a concurrent request may
+occasionally spend the same token twice.
+"""
+import threading
+import time
+import zlib
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+# striped so requests of different users do not wait on each other
+_locks = [threading.Lock() for _ in range(64)]
+
+
+@contextmanager
+def _locked(keys):
+    stripes = sorted({zlib.crc32(key.encode()) % len(_locks) for key in keys})
+    with ExitStack() as stack:
+        for stripe in stripes:
+            stack.enter_context(_locks[stripe])
+        yield
+
+
+def consume(buckets, cost):
+    """
+    Spend ``cost`` tokens from every bucket in ``buckets`` (``(key, capacity,
+    refill_per_second, reserve)`` tuples), but only if each of them keeps at
+    least its ``reserve`` afterwards: a request refused by one bucket costs
+    nothing in the others. Returns 0 when allowed, otherwise the seconds
+    until every bucket will have refilled enough.
+    """
+    with _locked([key for key, *_ in buckets]):
+        now = time.time()
+        states, wait = [], 0
+        for key, capacity, refill_per_second, reserve in buckets:
+            tokens, updated = cache.get(key) or (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            states.append((key, tokens, capacity / refill_per_second))
+            wait = max(wait, (cost + reserve - tokens) / refill_per_second)
+        for key, tokens, refill_seconds in states:
+            cache.set(key, (tokens if wait > 0 else tokens - cost, now), timeout=int(refill_seconds) + 1)
+    return max(wait, 0)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def get_cost_class(self, request, view):
+        if hasattr(view, 'get_throttle_cost_class'):
+            cost_class = view.get_throttle_cost_class(request)
+            if cost_class:
+                return cost_class
+        action = getattr(view, 'action', None)
+        return getattr(view, 'throttle_cost_classes', {}).get(action, getattr(view, 'throttle_cost_class', None))
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        cost_class = self.get_cost_class(request, view)
+        if cost_class is None:
+            return True
+        user = request.user
+        if user is not None and user.is_authenticated:
+            role, ident = getattr(user, 'role', 'owner'), f'user:{user.pk}'
+        else:
+            role, ident = 'anon', f'ip:{self.get_ident(request)}'
+        bucket = settings.THROTTLE_BUCKETS.get(role, settings.THROTTLE_BUCKETS['owner'])
+        costs = settings.THROTTLE_COST_CLASSES[cost_class]
+
+        buckets = [(
+            f'throttle:{ident}',
+            bucket['capacity'],
+            bucket['refill_per_second'],
+            costs.get('reserve', 0) * bucket['capacity'],
+        )]
+        if 'global' in costs:
+            shared = costs['global']
+            buckets.append((f'throttle:global:{cost_class}', shared['capacity'], shared['refill_per_second'], 0))
+        self.wait_seconds = consume(buckets, costs['cost'])
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
@@ -6,16 +6,21 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from apartments.views import ApartmentViewSet, TenantViewSet, RentPaymentViewSet, DocumentViewSet, NotificationViewSet, TenantHistoryViewSet
+from apartments.views import ApartmentViewSet, TenantViewSet, RentPaymentViewSet, DocumentViewSet, NotificationViewSet, TenantHistoryViewSet, PortfolioImportView, AnalyticsViewSet, PaymentChangesView, PeriodCloseViewSet, LateFeeRuleViewSet, PaymentTransactionViewSet
+from apartments import async_views
 from users.views import AccountantOwnerViewSet
 
 router = DefaultRouter()
 router.register(r'apartments', ApartmentViewSet, basename='apartment')
 router.register(r'tenants', TenantViewSet, basename='tenant')
 router.register(r'payments', RentPaymentViewSet, basename='payment')
+router.register(r'payment-transactions', PaymentTransactionViewSet, basename='payment-transaction')
 router.register(r'documents', DocumentViewSet, basename='document')
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'tenant-history', TenantHistoryViewSet, basename='tenant-history')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
+router.register(r'periods', PeriodCloseViewSet, basename='period')
+router.register(r'late-fee-rules', LateFeeRuleViewSet, basename='late-fee-rule')
 router.register(r'accountant-owners', AccountantOwnerViewSet, basename='accountant-owner')
 
 urlpatterns = [
@@ -23,6 +28,10 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/users/', include('users.urls')),
+    path('api/imports/portfolio/', PortfolioImportView.as_view(), name='portfolio-import'),
+    path('api/changes/', PaymentChangesView.as_view(), name='payment-changes'),
+    path('api/dashboard/', async_views.dashboard, name='dashboard'),
+    path('api/apartments/<int:pk>/overview/', async_views.apartment_overview, name='apartment-overview'),
     path('api/', include(router.urls)),
 ]
 
@@ -0,0 +1,22 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .tokens import ScopedTokenUser, get_scope_version, remember_scope_version
+
+
+class ScopedJWTAuthentication(JWTAuthentication):
+    """
+    Authenticate from the token's role/scope claims without touching the DB.
+    Falls back to loading the User when the token predates a scope change
+    (role, is_active or accountant links) or carries no scope claims.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        version = validated_token.get('scope_version')
+        if 'role' in validated_token and version is not None and version == get_scope_version(user_id):
+            return ScopedTokenUser(validated_token)
+
+        user = super().get_user(validated_token)
+        remember_scope_version(user.pk, user.scope_version)
+        return user
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_accountantowner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='scope_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
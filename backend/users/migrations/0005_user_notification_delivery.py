@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_scope_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='notification_delivery',
+            field=models.CharField(choices=[('immediate', 'Άμεσα'), ('hourly', 'Ωριαία σύνοψη'), ('daily', 'Ημερήσια σύνοψη')], default='immediate', max_length=20),
+        ),
+    ]
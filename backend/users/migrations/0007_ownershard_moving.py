@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_ownershard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ownershard',
+            name='moving',
+            field=models.BooleanField(default=False),
+        ),
+    ]
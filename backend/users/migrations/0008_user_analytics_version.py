@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-19 18:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_ownershard_moving'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='analytics_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
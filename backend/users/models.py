@@ -10,7 +10,18 @@ class User(AbstractUser):
         ("accountant", "Accountant"),
     )
 
+    NOTIFICATION_DELIVERY_CHOICES = (
+        ("immediate", "Άμεσα"),
+        ("hourly", "Ωριαία σύνοψη"),
+        ("daily", "Ημερήσια σύνοψη"),
+    )
+
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default="owner")
+    notification_delivery = models.CharField(max_length=20, choices=NOTIFICATION_DELIVERY_CHOICES, default="immediate")
+    # bumped whenever role, is_active or accountant links change; stale JWTs fall back to the DB
+    scope_version = models.PositiveIntegerField(default=0)
+    # bumped after every commit touching the owner's apartments data; versions cached analytics
+    analytics_version = models.PositiveIntegerField(default=0)
 
 
 class AccountantOwner(models.Model):
@@ -23,3 +34,15 @@ class AccountantOwner(models.Model):
 
     def __str__(self):
         return f"{self.accountant.username} -> {self.owner.username}"
+
+
+class OwnerShard(models.Model):
+    """Database shard holding an owner's apartments data (see config.sharding)"""
+    owner = models.OneToOneField(User, on_delete=models.CASCADE, related_name="shard")
+    alias = models.CharField(max_length=50)
+    # set while rebalance_shards copies the owner; API writes for it are refused meanwhile
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.owner.username} -> {self.alias}"
@@ -5,7 +5,8 @@ from .models import User, AccountantOwner
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'email', 'role')
+        fields = ('id', 'username', 'email', 'role', 'notification_delivery')
+        read_only_fields = ('username', 'email', 'role')
 
 
 class AccountantOwnerSerializer(serializers.ModelSerializer):
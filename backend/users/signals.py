@@ -0,0 +1,30 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import User, AccountantOwner
+from .tokens import forget_scope_version
+
+
+def bump_scope_version(user_id):
+    """Invalidate access tokens issued to ``user_id`` before a scope change."""
+    User.objects.filter(pk=user_id).update(scope_version=F('scope_version') + 1)
+    forget_scope_version(user_id)
+
+
+@receiver(pre_save, sender=User)
+def bump_scope_on_role_change(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    previous = User.objects.filter(pk=instance.pk).values('role', 'is_active').first()
+    if previous and (previous['role'] != instance.role or previous['is_active'] != instance.is_active):
+        instance.scope_version += 1
+        forget_scope_version(instance.pk)
+
+
+@receiver(post_save, sender=AccountantOwner)
+@receiver(post_delete, sender=AccountantOwner)
+def bump_scope_on_link_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    bump_scope_version(instance.accountant_id)
@@ -1,3 +1,49 @@
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from apartments.models import Apartment
+from .models import AccountantOwner, User
+
+
+def token_client(username, password='x'):
+    """APIClient authenticated with a JWT access token, like the frontend."""
+    client = APIClient()
+    response = client.post('/api/token/', {'username': username, 'password': password}, format='json')
+    client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+    return client
+
+
+class AccountantOwnerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='x', role='owner')
+        self.other = User.objects.create_user('other', password='x', role='owner')
+        self.accountant = User.objects.create_user('accountant', password='x', role='accountant')
+        Apartment.objects.create(owner=self.owner, title='A1', address='Odos 1', square_meters=50)
+
+    def link(self, client, owner):
+        return client.post('/api/accountant-owners/', {'owner': owner.pk, 'accountant': self.accountant.pk}, format='json')
+
+    def test_owner_links_an_accountant_with_a_token(self):
+        client = token_client('owner')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        self.assertEqual(self.link(client, self.owner).status_code, 201)
+        self.assertTrue(AccountantOwner.objects.filter(owner=self.owner, accountant=self.accountant).exists())
+
+    def test_owner_cannot_link_another_owner(self):
+        self.assertEqual(self.link(token_client('owner'), self.other).status_code, 403)
+        self.assertFalse(AccountantOwner.objects.exists())
+
+    def test_accountant_cannot_assign_itself(self):
+        self.assertEqual(self.link(token_client('accountant'), self.owner).status_code, 403)
+
+    def test_accountant_sees_a_new_owner_without_a_new_token(self):
+        accountant = token_client('accountant')
+        self.assertEqual(accountant.get('/api/apartments/').data['count'], 0)
+
+        self.assertEqual(self.link(token_client('owner'), self.owner).status_code, 201)
+        self.assertEqual(accountant.get('/api/apartments/').data['count'], 1)
+
+        AccountantOwner.objects.get().delete()
+        self.assertEqual(accountant.get('/api/apartments/').data['count'], 0)
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User, AccountantOwner
+
+
+def _scope_cache_key(user_id):
+    return f'auth-scope:{user_id}'
+
+
+def get_scope_version(user_id):
+    """Current scope version from the cache, or None when unknown."""
+    return cache.get(_scope_cache_key(user_id))
+
+
+def remember_scope_version(user_id, version):
+    # short-lived, so a bump seen by one worker's cache reaches the others within the TTL
+    cache.set(_scope_cache_key(user_id), version, settings.AUTH_SCOPE_CACHE_SECONDS)
+
+
+def forget_scope_version(user_id):
+    cache.delete(_scope_cache_key(user_id))
+
+
+def add_scope_claims(token, user):
+    """Copy everything request handling needs about ``user`` into ``token``."""
+    token['username'] = user.username
+    token['role'] = user.role
+    token['is_staff'] = user.is_staff
+    token['scope_version'] = user.scope_version
+    if user.role == 'accountant':
+        token['owner_ids'] = list(
+            AccountantOwner.objects.filter(accountant=user).values_list('owner_id', flat=True)
+        )
+    remember_scope_version(user.pk, user.scope_version)
+
+
+class ScopedRefreshToken(RefreshToken):
+    """Refresh token whose access tokens always carry fresh role/scope claims."""
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        user = User.objects.get(**{api_settings.USER_ID_FIELD: self[api_settings.USER_ID_CLAIM]})
+        add_scope_claims(access, user)
+        return access
+
+
+class ScopedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ScopedRefreshToken
+
+
+class ScopedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ScopedRefreshToken
+
+
+class ScopedTokenUser(TokenUser):
+    """Stateless user built from access token claims; no DB row is loaded."""
+
+    @cached_property
+    def id(self):
+        # the claim is serialised as a string; model instances compare against ints
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @property
+    def role(self):
+        return self.token.get('role', 'owner')
+
+    @property
+    def owner_ids(self):
+        return self.token.get('owner_ids')
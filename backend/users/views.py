@@ -17,7 +17,14 @@ class MeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        serializer = UserSerializer(User.objects.get(pk=request.user.pk))
+        return Response(serializer.data)
+
+    def patch(self, request):
+        """Update the user's own preferences (notification_delivery)"""
+        serializer = UserSerializer(User.objects.get(pk=request.user.pk), data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
         return Response(serializer.data)
 
 
@@ -30,9 +37,9 @@ class AccountantOwnerViewSet(ModelViewSet):
         if user.role == 'admin':
             return AccountantOwner.objects.all().select_related('owner', 'accountant')
         if user.role == 'owner':
-            return AccountantOwner.objects.filter(owner=user).select_related('owner', 'accountant')
+            return AccountantOwner.objects.filter(owner_id=user.id).select_related('owner', 'accountant')
         if user.role == 'accountant':
-            return AccountantOwner.objects.filter(accountant=user).select_related('owner', 'accountant')
+            return AccountantOwner.objects.filter(accountant_id=user.id).select_related('owner', 'accountant')
         return AccountantOwner.objects.none()
 
     def perform_create(self, serializer):
@@ -45,7 +52,7 @@ class AccountantOwnerViewSet(ModelViewSet):
             serializer.save()
             return
         if user.role == 'owner':
-            if owner != user:
+            if owner.pk != user.pk:
                 raise PermissionDenied("Δεν μπορείτε να αναθέσετε άλλον ιδιοκτήτη")
             serializer.save()
             return